@@ -0,0 +1,237 @@
+"""
+Headless acquisition from the target device.
+
+The device is searched and read with the same logic of the GUI (:py:mod:`discovery`,
+:py:mod:`serial_reader`, :py:mod:`frame_decoder`), without importing PyQt5 nor pyqtgraph, so it
+runs on machines with no display. Resistance samples are streamed to a ``.csv`` file, to a binary
+session file (see :py:mod:`session_file`) or to standard output, one value per line; log messages
+go to standard error.
+
+Usage (from the ``GlutenApp`` directory)::
+
+    python acquire.py [--port PORT] [--duration SECONDS] [--id ID] [--format {csv,binary,stdout}] [--sensor SENSOR]
+                      [--rate HZ] [--packed]
+
+Without ``--port`` the device is searched on all the ports, starting from the last one it was found on.
+Without ``--duration`` the acquisition runs until interrupted with ``Ctrl+C``.
+Samples are corrected with the calibration of ``--sensor`` on the device, if any (see :py:mod:`calibration`).
+With ``--rate`` the sample rate of the device is set before starting; ``--packed`` streams several samples per
+frame, as needed by rates in the kHz range.
+"""
+import sys
+
+import time
+
+import argparse
+
+import threading
+
+from loguru import logger
+
+import discovery as disc
+import frame_decoder as dec
+import serial_reader as rdr
+import csv_exporter
+import calibration
+
+
+
+############
+#  MACROS  #
+############
+STDOUT_FORMAT = 'stdout'
+"""
+Stream samples to standard output.
+"""
+
+RESET_TIMEOUT = 2
+"""
+Maximum time, in seconds, to wait for the reset info with the sample rate after connection.
+"""
+
+
+
+#################
+#  ACQUISITION  #
+#################
+class Acquisition:
+    """
+    Class that acquires resistance data from a device and streams them to the chosen output.
+    """
+    def __init__(self, port_name, identifier='', output_format=csv_exporter.CSV_FORMAT, capture_path=None,
+                 sensor=calibration.DEFAULT_SENSOR, sample_rate=None, packed=False):
+        """
+        Init an acquisition.
+
+        :param port_name: Name of the port the device is connected to.
+        :type port_name: str
+        :param identifier: Identifier of the exported file.
+        :type identifier: str
+        :param output_format: Output of the samples: :py:data:`csv_exporter.CSV_FORMAT`,
+            :py:data:`csv_exporter.SESSION_FORMAT` or :py:data:`STDOUT_FORMAT`.
+        :type output_format: str
+        :param capture_path: Path of a file where all the raw bytes received are recorded.
+        :type capture_path: str
+        :param sensor: Name of the sensor in use, whose calibration is applied.
+        :type sensor: str
+        :param sample_rate: Sample rate to be set on the device, in Hz. The one of the device if ``None``.
+        :type sample_rate: int
+        :param packed: Whether to stream several samples per frame.
+        :type packed: bool
+        """
+        self.output_format = output_format
+        self.state = rdr.DeviceState(port_name)
+        self.state.calibration = calibration.CalibrationStore().lookup(disc.port_fingerprint(port_name), sensor)
+        if self.state.calibration is not None:
+            logger.info("Measurements corrected with {}.".format(self.state.calibration))
+        self.reader = rdr.SerialReader(port_name, capture_path, state=self.state,
+                                       on_data=self.handle_data, on_status=self.handle_status)
+        self.reader.requested_rate = sample_rate
+        self.stream_cmd = rdr.PACKED_STREAM_CMD if packed else rdr.PSOC_RES_CMD
+        self.reset_received = threading.Event()
+        self.is_connected = threading.Event()
+        self.is_failed = False
+        self.n_samples = 0
+        self.thread = None
+        csv_exporter.id = identifier
+        csv_exporter.EXPORT = output_format != STDOUT_FORMAT
+        if csv_exporter.EXPORT:
+            csv_exporter.FORMAT = output_format
+
+
+    def start(self):
+        """
+        This method connects to the device and starts the measurement.
+
+        :returns: ``True`` if the measurement has been started.
+        :rtype: bool
+        """
+        self.reader.is_streaming = True
+        self.thread = threading.Thread(target=self.reader.read, daemon=True)
+        self.thread.start()
+        while not self.is_connected.wait(rdr.READ_TIMEOUT):
+            if self.is_failed:
+                return False
+        if not self.reset_received.wait(RESET_TIMEOUT):
+            logger.warning("No reset info received: sample rate assumed {} Hz.".format(self.state.sample_rate))
+        csv_exporter.start_psoc_res_export(self.state)
+        self.reader.send(self.stream_cmd)
+        logger.info("PSoC resistance measurement started")
+        return True
+
+
+    def stop(self):
+        """
+        This method stops the measurement, completes the export and closes the port.
+        """
+        self.reader.send(rdr.STOP_STREAM_CMD)
+        self.reader.stop()
+        if self.thread is not None:
+            self.thread.join()
+        csv_exporter.stop_psoc_res_export(self.state)
+        sys.stdout.flush()
+        logger.info("Measurement stopped: {} samples acquired.".format(self.n_samples))
+        logger.info("Sample rate estimated at {:.4f} Hz ({:+.0f} ppm), {} samples lost.".format(
+            self.state.clock.rate, self.state.clock.drift_ppm, self.state.clock.n_lost))
+
+
+    def handle_data(self, packet_type, data):
+        """
+        This method streams the data received to the chosen output. Called by the reading thread.
+
+        :param packet_type: Identifier of the type of data that have been received.
+        :type packet_type: str
+        :param data: The actual data being received. Resistance measurements come in batches.
+        :type data: sequence
+        """
+        if packet_type == dec.RESET_PACKET:
+            self.reset_received.set()
+        elif packet_type in (dec.PSOC_RES_PACKET, dec.GAP_PACKET):
+            if packet_type == dec.PSOC_RES_PACKET:
+                self.n_samples += len(data)
+            if self.output_format == STDOUT_FORMAT:
+                sys.stdout.write(''.join(['%.3f\n' % value for value in data]))
+            else:
+                csv_exporter.append_psoc_res_data(self.state, data)
+
+
+    def handle_status(self, port_name, status):
+        """
+        This method follows the status of the connection. Called by the reading thread.
+
+        :param port_name: Name of the port.
+        :type port_name: str
+        :param status: Status of the connection, as in :py:class:`serial_reader.SerialReader`.
+        :type status: int
+        """
+        if status in (1, 4):
+            self.is_connected.set()
+        elif status in (0, 2):
+            self.is_failed = True
+            logger.error("Cannot communicate with port {}.".format(port_name))
+
+
+
+###############
+#  UTILITIES  #
+###############
+def find_device():
+    """
+    This function searches for the target device, starting from the port it was last found on.
+
+    :returns: Name of the port the device is connected to, ``None`` if not found.
+    :rtype: str
+    """
+    fingerprint = disc.load_fingerprint()
+    ports = disc.candidate_ports(fingerprint)
+    if fingerprint is not None and ports and disc.cached_port(fingerprint) == ports[0]:
+        if disc.probe_port(ports[0]):
+            return ports[0]
+    port = disc.discover_device(ports)
+    if port is not None:
+        disc.save_fingerprint(port)
+    return port
+
+
+
+#############
+#  RUN APP  #
+#############
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Headless acquisition of resistance data from GlutenSens.")
+    parser.add_argument('--port', help="serial port of the device (default: searched on all ports)")
+    parser.add_argument('--duration', type=float, help="duration of the acquisition in s (default: until Ctrl+C)")
+    parser.add_argument('--id', default='', help="identifier of the exported file (default: none)")
+    parser.add_argument('--format', default=csv_exporter.CSV_FORMAT,
+                        choices=[csv_exporter.CSV_FORMAT, csv_exporter.SESSION_FORMAT, STDOUT_FORMAT],
+                        help="output of the samples (default: csv)")
+    parser.add_argument('--capture', help="file where the raw bytes received are recorded, for later replay")
+    parser.add_argument('--sensor', default=calibration.DEFAULT_SENSOR,
+                        help="sensor in use, whose calibration is applied (default: {})".format(calibration.DEFAULT_SENSOR))
+    parser.add_argument('--rate', type=int, help="sample rate to be set on the device in Hz (default: the one of the device)")
+    parser.add_argument('--packed', action='store_true', help="stream several samples per frame, for high sample rates")
+    parser.add_argument('--verbose', action='store_true', help="print debug messages")
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level='DEBUG' if args.verbose else 'INFO')
+
+    port = args.port if args.port is not None else find_device()
+    if port is None:
+        logger.critical("No target device found. Please check your connections and try again.")
+        sys.exit(1)
+
+    acquisition = Acquisition(port, args.id.replace(' ', '-'), args.format, args.capture, args.sensor,
+                              args.rate, args.packed)
+    if not acquisition.start():
+        sys.exit(1)
+    try:
+        if args.duration is not None:
+            time.sleep(args.duration)
+        else:
+            while True:
+                time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    acquisition.stop()
+    sys.exit(0)
@@ -0,0 +1,139 @@
+"""
+Bridge between the asyncio serial core (:py:mod:`async_serial`) and the Qt GUI.
+
+:py:class:`AsyncLoopThread` runs a single asyncio event loop on a background thread, shared by the
+readers of all the devices; :py:class:`AsyncReadWorker` exposes an :py:class:`async_serial.AsyncReader`
+with the same signals of :py:class:`serial_workers.ReadWorker`, so the GUI handles both alike.
+Each batch handled by the GUI is acknowledged to the reader, which stops reading while the GUI
+lags behind by :py:data:`MAX_PENDING` batches.
+"""
+import asyncio
+
+import threading
+
+from loguru import logger
+
+import async_serial as aser
+import serial_workers as wrk
+
+
+
+##############
+#  SETTINGS  #
+##############
+MAX_PENDING = 64
+"""
+Maximum number of notifications a reader sends to the GUI before they are handled.
+"""
+
+STOP_TIMEOUT = 2
+"""
+Maximum time, in seconds, to wait for the tasks to be cancelled and for the loop thread to end.
+"""
+
+
+
+###############
+# LOOP_THREAD #
+###############
+class AsyncLoopThread:
+    """
+    Class that runs an asyncio event loop on a daemon thread.
+    """
+    def __init__(self):
+        """
+        Init a loop thread and start its event loop.
+        """
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.run, name="asyncio", daemon=True)
+        self.thread.start()
+
+
+    def run(self):
+        """
+        This method runs the event loop until :py:meth:`stop` is called.
+        """
+        logger.trace("asyncio thread initiated.")
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+        logger.trace("asyncio thread terminated.")
+
+
+    def submit(self, coro):
+        """
+        This method schedules a coroutine on the event loop. Thread safe.
+
+        :param coro: Coroutine to be run.
+        :type coro: coroutine
+
+        :returns: Future holding the result of the coroutine.
+        :rtype: concurrent.futures.Future
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+
+    def stop(self):
+        """
+        This method cancels all the tasks, waits for them to close their ports, then stops the event loop.
+        """
+        if self.loop.is_closed():
+            return
+
+        async def cancel_all():
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        try:
+            self.submit(cancel_all()).result(STOP_TIMEOUT)
+        except Exception:
+            logger.exception("Tasks of the asyncio loop not cancelled in time.")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(STOP_TIMEOUT)
+        if not self.thread.is_alive():
+            self.loop.close()
+
+
+
+################
+# ASYNC_WORKER #
+################
+class AsyncReadWorker(aser.AsyncReader):
+    """
+    Class that runs an :py:class:`async_serial.AsyncReader` on an :py:class:`AsyncLoopThread`,
+    notifying data and status through the signals of :py:class:`serial_workers.ReadWorkerSignals`.
+    """
+    def __init__(self, loop_thread, serial_port_name, capture_path=None, reconnect=True, state=None):
+        """
+        Init an asyncio read worker.
+
+        :param loop_thread: Thread running the event loop the worker is run on.
+        :type loop_thread: AsyncLoopThread
+        :param serial_port_name: Name of the port to be read.
+        :type serial_port_name: str
+        :param capture_path: Path of a file where all the raw bytes received are recorded, for later replay (see :py:mod:`replay`).
+        :type capture_path: str
+        :param reconnect: Whether to reconnect automatically when the connection is lost.
+        :type reconnect: bool
+        :param state: State of the device. A new one is created if not given.
+        :type state: serial_reader.DeviceState
+        """
+        self.signals = wrk.ReadWorkerSignals()
+        super().__init__(serial_port_name, capture_path, reconnect, state,
+                         on_data=self.signals.data.emit, on_status=self.signals.status.emit,
+                         max_pending=MAX_PENDING)
+        self.loop_thread = loop_thread
+        # Connected from the GUI thread: acknowledged once the GUI has handled the notification
+        self.signals.data.connect(lambda packet_type, data: self.ack())
+
+
+    def start(self):
+        """
+        This method starts reading on the event loop.
+
+        :returns: Future completed when the reading ends.
+        :rtype: concurrent.futures.Future
+        """
+        logger.trace("Reading task initiated.")
+        return self.loop_thread.submit(self.read_async())
@@ -0,0 +1,358 @@
+"""
+asyncio serial I/O core.
+
+Scanning, reading and command sending as coroutines, so that many devices are multiplexed on a
+single event loop instead of blocking one thread each:
+
+* :py:class:`AsyncSerial` waits for data with ``loop.add_reader`` on the file descriptor of the port
+  (Linux/macOS); where the port has no file descriptor (Windows) reads run on the default executor;
+* :py:func:`probe_port` and :py:func:`discover_device` are the coroutine counterparts of the
+  functions in :py:mod:`discovery`: the remaining probes are cancelled as soon as the device replies;
+* :py:class:`AsyncReader` runs a :py:class:`serial_reader.SerialReader` as a task: stopping it cancels
+  the task, which closes its port before returning. With ``max_pending``, the reader stops reading
+  while too many notified batches have not been acknowledged by the consumer (see :py:meth:`AsyncReader.ack`):
+  data wait in the buffers of the OS instead of piling up in memory.
+
+The module does not depend on Qt: :py:mod:`async_bridge` exposes it to the GUI.
+"""
+import asyncio
+
+import time
+
+from loguru import logger
+
+import serial
+
+import discovery as disc
+import serial_reader as rdr
+from discovery import (
+    BAUDRATE,
+    CONN_REQUEST_CMD,
+    CONN_REPLY,
+    PROBE_TIMEOUT
+)
+
+
+
+###############
+#  TRANSPORT  #
+###############
+class AsyncSerial:
+    """
+    Class that wraps a serial port for use with asyncio.
+    """
+    def __init__(self, port_name, baudrate=BAUDRATE):
+        """
+        Init an asyncio serial port. The port is opened by :py:meth:`open`.
+
+        :param port_name: Name of the port.
+        :type port_name: str
+        :param baudrate: Baudrate of the port.
+        :type baudrate: int
+        """
+        self.port_name = port_name
+        self.baudrate = baudrate
+        self.port = serial.Serial()
+        self.fd = None
+        self.loop = None
+
+
+    def open(self):
+        """
+        This method opens the port in non-blocking mode. Must be called from the event loop.
+        """
+        self.loop = asyncio.get_running_loop()
+        self.port = serial.Serial(port=self.port_name, baudrate=self.baudrate, write_timeout=0, timeout=0)
+        try:
+            self.fd = self.port.fileno()
+        except (AttributeError, serial.SerialException):
+            # No file descriptor to watch: blocking reads on the executor
+            self.fd = None
+            self.port.timeout = rdr.READ_TIMEOUT
+
+
+    async def read(self, timeout=None):
+        """
+        This method waits until some bytes are received, then returns all the bytes available.
+
+        :param timeout: Maximum time, in seconds, to wait for data.
+        :type timeout: float
+
+        :returns: Bytes received, empty if ``timeout`` expired.
+        :rtype: bytes
+        :raises serial.SerialException: If the port is not available anymore.
+        """
+        if self.fd is None:
+            chunk = await self.loop.run_in_executor(None, self.port.read, 1)
+            return chunk + self.port.read(self.port.in_waiting) if chunk else chunk
+        try:
+            chunk = self.port.read(max(1, self.port.in_waiting))
+            if chunk:
+                return chunk
+            readable = self.loop.create_future()
+            self.loop.add_reader(self.fd, lambda: readable.done() or readable.set_result(None))
+            try:
+                await asyncio.wait_for(readable, timeout)
+            except asyncio.TimeoutError:
+                return b''
+            finally:
+                self.loop.remove_reader(self.fd)
+            # A port that is readable but returns no data has been disconnected: pyserial raises
+            return self.port.read(max(1, self.port.in_waiting))
+        except OSError as e:
+            # Non-blocking reads report a disconnection (e.g. EIO) as it is
+            raise serial.SerialException("read failed: {}".format(e))
+
+
+    def write(self, data):
+        """
+        This method writes data on the port, without blocking.
+
+        :param data: Data to be written.
+        :type data: bytes
+        """
+        self.port.write(data)
+
+
+    def close(self):
+        """
+        This method closes the port.
+        """
+        if self.loop is not None and self.fd is not None and not self.loop.is_closed():
+            self.loop.remove_reader(self.fd)
+        self.port.close()
+
+
+
+###############
+#  DISCOVERY  #
+###############
+async def probe_port(port, timeout=PROBE_TIMEOUT):
+    """
+    This coroutine checks whether a port has target device connected to it. See :py:func:`discovery.probe_port`.
+
+    :param port: Name of the port to be checked.
+    :type port: str
+    :param timeout: Maximum time, in seconds, to wait for the reply.
+    :type timeout: float
+
+    :returns: ``True`` or ``False`` based on whether the target device has been found on that port.
+    :rtype: bool
+    """
+    logger.debug("Checking port {}.".format(port))
+    deadline = time.monotonic() + timeout
+    transport = AsyncSerial(port)
+    try:
+        transport.open()
+        transport.port.reset_input_buffer()
+        transport.write(CONN_REQUEST_CMD.encode('utf-8'))
+        reply = b''
+        while time.monotonic() < deadline:
+            reply += await transport.read(deadline - time.monotonic())
+            if CONN_REPLY in reply:
+                return True
+    except (serial.SerialException, ValueError, OSError):
+        logger.debug("Error during setup of port {}.".format(port))
+    finally:
+        transport.close()
+    return False
+
+
+async def discover_device(ports, timeout=PROBE_TIMEOUT):
+    """
+    This coroutine probes all the given ports at the same time and returns the first one on which
+    the target device replies. The other probes are cancelled. See :py:func:`discovery.discover_device`.
+
+    :param ports: Names of the ports to be checked.
+    :type ports: list
+    :param timeout: Maximum time, in seconds, to wait for a reply.
+    :type timeout: float
+
+    :returns: Name of the port the target device is connected to, ``None`` if not found within ``timeout``.
+    :rtype: str
+    """
+    async def probe(port):
+        return port if await probe_port(port, timeout) else None
+
+    probes = [asyncio.ensure_future(probe(port)) for port in ports]
+    try:
+        for probe_done in asyncio.as_completed(probes, timeout=timeout + 1):
+            port = await probe_done
+            if port is not None:
+                return port
+    except asyncio.TimeoutError:
+        logger.warning("Scan of ports {} timed out.".format(ports))
+    finally:
+        for task in probes:
+            task.cancel()
+        await asyncio.gather(*probes, return_exceptions=True)
+    return None
+
+
+
+############
+#  READER  #
+############
+class AsyncReader(rdr.SerialReader):
+    """
+    Class that reads a device as a task of an asyncio event loop. Decoding, batching and
+    reconnection policy are the ones of :py:class:`serial_reader.SerialReader`.
+    """
+    def __init__(self, serial_port_name, capture_path=None, reconnect=True, state=None,
+                 on_data=None, on_status=None, max_pending=None):
+        """
+        Init an asyncio reader.
+
+        :param serial_port_name: Name of the port to be read.
+        :type serial_port_name: str
+        :param capture_path: Path of a file where all the raw bytes received are recorded.
+        :type capture_path: str
+        :param reconnect: Whether to reconnect automatically when the connection is lost.
+        :type reconnect: bool
+        :param state: State of the device. A new one is created if not given.
+        :type state: serial_reader.DeviceState
+        :param on_data: Function called with the type of data and the actual data received.
+        :type on_data: callable
+        :param on_status: Function called with the name of the port and the status of its connection.
+        :type on_status: callable
+        :param max_pending: Maximum number of notifications not acknowledged yet, ``None`` for no limit.
+        :type max_pending: int
+        """
+        super().__init__(serial_port_name, capture_path, reconnect, state, on_data, on_status)
+        self.notify_data = self.on_data
+        self.on_data = self.notify
+        self.max_pending = max_pending
+        self.n_pending = 0
+        self.transport = None
+        self.loop = None
+        self.task = None
+        self.acked = None
+
+
+    async def read_async(self):
+        """
+        This coroutine estabilishes a connection with desired serial port and collects incoming data,
+        until it is cancelled (see :py:meth:`stop`) or ``is_streaming`` is set to ``False``.
+        """
+        self.loop = asyncio.get_running_loop()
+        self.task = asyncio.current_task()
+        self.acked = asyncio.Event()
+        self.transport = AsyncSerial(self.port_name)
+        try:
+            self.transport.open()
+            self.port = self.transport.port
+            self.on_status(self.port_name, 1)
+            logger.info("Succesfully connected to port {}.".format(self.port_name))
+            self.port.write(self.info_request())
+            if self.capture_path is not None:
+                self.capture = open(self.capture_path, 'wb')
+                logger.info("Recording raw data into {}.".format(self.capture_path))
+        except serial.SerialException:
+            self.on_status(self.port_name, 0)
+            logger.exception("Error during setup of port {}.".format(self.port_name))
+            self.is_streaming = False
+
+        try:
+            while self.is_streaming:
+                # Backpressure: wait for the consumer to catch up
+                while self.max_pending is not None and self.n_pending >= self.max_pending:
+                    self.acked.clear()
+                    await self.acked.wait()
+                try:
+                    self.process(await self.transport.read(rdr.READ_TIMEOUT))
+                except serial.SerialException:
+                    if self.reconnect_enabled and self.is_streaming:
+                        logger.warning("Connection with port {} lost.".format(self.port_name))
+                        if await self.reconnect_async():
+                            continue
+                    self.on_status(self.port_name, 2)
+                    logger.exception("Cannot communicate with port {}. Please check the connection and try again.".format(self.port_name))
+                    self.is_streaming = False
+        finally:
+            self.flush()
+            if self.capture is not None:
+                self.capture.close()
+                self.capture = None
+            self.transport.close()
+            logger.info("Serial port {} closed.".format(self.port_name))
+
+
+    async def reconnect_async(self):
+        """
+        This coroutine restores the connection with target device after it has been lost.
+        See :py:meth:`serial_reader.SerialReader.reconnect`.
+
+        :returns: ``True`` if the connection has been restored.
+        :rtype: bool
+        """
+        self.mark_gap()
+        self.transport.close()
+        delay = rdr.RECONNECT_DELAY
+        while self.is_streaming:
+            await asyncio.sleep(delay)
+            port_name = self.port_name
+            if not await probe_port(port_name):
+                port_name = await discover_device(disc.candidate_ports(disc.load_fingerprint()))
+            if port_name is not None:
+                try:
+                    self.transport = AsyncSerial(port_name)
+                    self.transport.open()
+                    self.port = self.transport.port
+                    self.resume(port_name)
+                    return True
+                except serial.SerialException:
+                    self.transport.close()
+                    logger.debug("Reconnection to port {} failed.".format(port_name))
+            delay = min(2*delay, rdr.RECONNECT_MAX_DELAY)
+        return False
+
+
+    def notify(self, packet_type, data):
+        """
+        This method counts the notifications not acknowledged yet, then calls ``on_data``.
+
+        :param packet_type: Type of data.
+        :type packet_type: str
+        :param data: Data.
+        :type data: sequence
+        """
+        self.n_pending += 1
+        self.notify_data(packet_type, data)
+
+
+    def ack(self):
+        """
+        This method acknowledges that a notification has been handled by the consumer. Thread safe.
+        """
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.acknowledged)
+
+
+    def acknowledged(self):
+        """
+        This method, executed by the event loop, lets the reading go on if it was waiting for the consumer.
+        """
+        self.n_pending = max(self.n_pending - 1, 0)
+        self.acked.set()
+
+
+    def send(self, char):
+        """
+        This method sends a single character on serial port, from the event loop. Thread safe.
+
+        :param char: Character to be sent.
+        :type char: char
+        """
+        if self.loop is None or self.loop.is_closed():
+            super().send(char)
+        else:
+            self.loop.call_soon_threadsafe(super().send, char)
+
+
+    def stop(self):
+        """
+        This method cancels the reading task, which closes the port. Thread safe.
+        """
+        super().stop()
+        if self.task is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.task.cancel)
@@ -0,0 +1,82 @@
+"""
+Compares the decoding throughput of :py:meth:`frame_decoder.FrameDecoder.feed` (one frame at a time)
+and :py:meth:`frame_decoder.FrameDecoder.feed_batches` (consecutive resistance frames at once), on
+a stream of resistance frames fed in chunks as read from the serial port.
+
+Usage (from the ``GlutenApp`` directory)::
+
+    python benchmarks/decode_throughput.py [frames] [chunk size] [corrupt rate]
+"""
+import os
+import sys
+import time
+import random
+import struct
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import frame_decoder as dec
+
+
+
+def make_stream(n_frames, corrupt_rate, seed=0):
+    """
+    This function builds a stream of resistance frames, a fraction of them with a corrupted byte.
+
+    :param n_frames: Number of frames.
+    :type n_frames: int
+    :param corrupt_rate: Fraction of corrupted frames.
+    :type corrupt_rate: float
+    :param seed: Seed of the random values.
+    :type seed: int
+
+    :returns: The stream.
+    :rtype: bytes
+    """
+    rng = random.Random(seed)
+    stream = bytearray()
+    for _ in range(n_frames):
+        frame = bytearray(struct.pack('>BIHB', dec.HEADER_PSOC_R_MEAS, rng.randrange(900, 1100),
+                                      rng.randrange(1000), dec.TAIL_MEAS_PACKETS))
+        if rng.random() < corrupt_rate:
+            frame[rng.randrange(len(frame))] = rng.randrange(256)
+        stream += frame
+    return bytes(stream)
+
+
+def run(feed, stream, chunk_size):
+    """
+    This function feeds a stream to a decoding method in chunks.
+
+    :param feed: Decoding method of a new :py:class:`frame_decoder.FrameDecoder`.
+    :type feed: callable
+    :param stream: Stream of frames.
+    :type stream: bytes
+    :param chunk_size: Size of the chunks, in bytes.
+    :type chunk_size: int
+
+    :returns: Number of resistance samples decoded and elapsed time, in s.
+    :rtype: tuple
+    """
+    n_samples = 0
+    start = time.perf_counter()
+    for pos in range(0, len(stream), chunk_size):
+        for packet_type, value in feed(stream[pos:pos + chunk_size]):
+            if packet_type == dec.PSOC_RES_PACKET:
+                n_samples += len(value) if hasattr(value, '__len__') else 1
+    return n_samples, time.perf_counter() - start
+
+
+
+if __name__ == '__main__':
+    n_frames = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    chunk_size = int(sys.argv[2]) if len(sys.argv) > 2 else 4096
+    corrupt_rate = float(sys.argv[3]) if len(sys.argv) > 3 else 0
+
+    stream = make_stream(n_frames, corrupt_rate)
+    print("Frames:        {} in chunks of {} bytes, {:.2%} corrupted".format(n_frames, chunk_size, corrupt_rate))
+    for name, method in (("Per frame", dec.FrameDecoder.feed), ("Vectorized", dec.FrameDecoder.feed_batches)):
+        decoder = dec.FrameDecoder()
+        n_samples, elapsed = run(lambda chunk: method(decoder, chunk), stream, chunk_size)
+        print("{:<14} {:>10.0f} samples/s ({} samples, {} bytes discarded)".format(
+            name+':', n_samples/elapsed, n_samples, decoder.n_discarded))
@@ -0,0 +1,71 @@
+"""
+Measures the CPU used by the reading thread while the target device is connected but idle.
+
+A pseudo-terminal stands in for the serial port (Linux only), so no hardware is required.
+The legacy busy-poll loop on ``in_waiting`` is compared against :py:meth:`serial_workers.ReadWorker.run`.
+
+Usage (from the ``GlutenApp`` directory)::
+
+    python benchmarks/idle_cpu.py [seconds]
+"""
+import os
+import sys
+import time
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import serial
+
+import serial_workers as wrk
+
+
+
+def legacy_poll(port_name, flag):
+    """
+    Busy-poll loop used by ``ReadWorker.run`` before blocking reads were introduced.
+    """
+    port = serial.Serial(port=port_name, baudrate=wrk.BAUDRATE, write_timeout=0, timeout=2)
+    while flag.is_set():
+        if port.in_waiting > 0:
+            port.read(port.in_waiting)
+    port.close()
+
+
+def measure(target, duration):
+    """
+    Runs ``target`` on a thread for ``duration`` seconds and returns the CPU usage in percent.
+    """
+    thread = threading.Thread(target=target)
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    thread.start()
+    time.sleep(duration)
+    cpu = time.process_time() - cpu_start
+    wall = time.perf_counter() - wall_start
+    return thread, 100*cpu/wall
+
+
+if __name__ == '__main__':
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    master, slave = os.openpty()
+    port_name = os.ttyname(slave)
+
+    flag = threading.Event()
+    flag.set()
+    thread, legacy = measure(lambda: legacy_poll(port_name, flag), duration)
+    flag.clear()
+    thread.join()
+
+    worker = wrk.ReadWorker(port_name)
+    worker.is_streaming = True
+    thread, blocking = measure(worker.run, duration)
+    worker.is_streaming = False
+    worker.is_killed = True
+    thread.join()
+
+    os.close(master)
+    os.close(slave)
+    print("Idle CPU usage over {:.0f} s".format(duration))
+    print("  busy poll (legacy): {:6.1f} %".format(legacy))
+    print("  blocking read:      {:6.1f} %".format(blocking))
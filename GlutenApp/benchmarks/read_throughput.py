@@ -0,0 +1,60 @@
+"""
+Measures the throughput of :py:class:`serial_workers.ReadWorker` against the device emulator.
+
+Usage (from the ``GlutenApp`` directory, Linux only)::
+
+    python benchmarks/read_throughput.py [sample rate] [seconds] [corrupt rate]
+"""
+import os
+import sys
+import time
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyQt5.QtCore import Qt
+
+import serial_workers as wrk
+import psoc_emulator
+
+
+
+if __name__ == '__main__':
+    sample_rate = float(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    duration = float(sys.argv[2]) if len(sys.argv) > 2 else 5
+    corrupt_rate = float(sys.argv[3]) if len(sys.argv) > 3 else 0
+
+    emulator = psoc_emulator.PsocEmulator(sample_rate, noise=1.0, corrupt_rate=corrupt_rate)
+    port_name = emulator.start()
+
+    received = [0, 0] # samples, batches
+    def count(packet_type, data):
+        if packet_type == "PSoC res measurement":
+            received[0] += len(data)
+            received[1] += 1
+
+    worker = wrk.ReadWorker(port_name)
+    worker.is_streaming = True
+    # No event loop here: handle data in the reading thread
+    worker.signals.data.connect(count, Qt.DirectConnection)
+    thread = threading.Thread(target=worker.run)
+    thread.start()
+    time.sleep(0.5)
+
+    cpu_start = time.process_time()
+    worker.send(wrk.PSOC_RES_CMD)
+    time.sleep(duration)
+    worker.send(wrk.STOP_STREAM_CMD)
+    cpu = time.process_time() - cpu_start
+    time.sleep(0.5)
+
+    worker.is_streaming = False
+    worker.is_killed = True
+    thread.join()
+    emulator.stop()
+
+    print("Sample rate:   {:.0f} Hz for {:.0f} s".format(sample_rate, duration))
+    print("Frames sent:   {} ({} corrupted)".format(emulator.n_sent, emulator.n_corrupted))
+    print("Samples read:  {} in {} batches".format(received[0], received[1]))
+    print("Discarded:     {} bytes".format(worker.decoder.n_discarded))
+    print("CPU usage:     {:.1f} % (emulator included)".format(100*cpu/duration))
@@ -0,0 +1,259 @@
+"""
+Per-sensor correction of resistance measurements.
+
+Each readout circuit and each batch of electrodes deviates differently from the nominal response.
+A :py:class:`CalibrationStore` holds the corrections of every device, identified by its USB
+fingerprint (see :py:func:`discovery.port_fingerprint`), and of every sensor used with it. The
+corrections are versioned: a new calibration of the same device and sensor never overwrites the
+previous ones, and the version applied is recorded in each session file.
+
+The store is a JSON file (:py:data:`CALIBRATIONS_PATH`) shaped as::
+
+    {"<device key>": {"<sensor>": [{"version": 1, "date": "...", "polynomial": [c0, c1, ...]},
+                                   {"version": 2, "date": "...", "table": [[raw, ...], [corrected, ...]]}]}}
+
+A correction is either a polynomial of the raw resistance (``c0 + c1*R + c2*R**2 + ...``) or a
+table of raw and corrected values, linearly interpolated. :py:class:`Calibration` precomputes it
+once, when the device is connected: a polynomial of degree up to 1 becomes a gain and an offset, the
+others a lookup table of :py:data:`LUT_SIZE` linear segments, so that each batch of samples is
+corrected with a vectorized multiply-add (after picking its segment, for lookup tables).
+
+The module does not depend on Qt.
+"""
+import os
+import json
+
+from datetime import datetime
+
+import numpy as np
+
+from loguru import logger
+
+
+
+##############
+#  SETTINGS  #
+##############
+CALIBRATIONS_PATH = os.path.join('Config', 'calibrations.json')
+"""
+File where the calibrations of all the devices are stored.
+"""
+
+DEFAULT_SENSOR = 'default'
+"""
+Sensor the calibrations refer to, when not specified.
+"""
+
+LUT_SIZE = 16384
+"""
+Number of segments of the lookup table a polynomial of degree higher than 1 is turned into.
+"""
+
+LUT_RANGE = (0.0, 100000.0)
+"""
+Range of raw resistances, in Ohm, covered by the lookup table of a polynomial: linearly extrapolated beyond.
+"""
+
+
+
+#################
+#  CALIBRATION  #
+#################
+class Calibration:
+    """
+    Class that corrects the resistance samples of a sensor, with coefficients precomputed at init.
+    """
+    def __init__(self, device, sensor, record):
+        """
+        Init a calibration.
+
+        :param device: Key of the device (see :py:func:`device_key`).
+        :type device: str
+        :param sensor: Name of the sensor.
+        :type sensor: str
+        :param record: Calibration as stored, with ``version``, ``date`` and either ``polynomial`` or ``table``.
+        :type record: dict
+        """
+        self.device = device
+        self.sensor = sensor
+        self.record = record
+        self.version = record['version']
+        self.gain = None
+        self.offset = None
+        if 'table' in record:
+            raw, corrected = (np.asarray(values, dtype=np.float64) for values in record['table'])
+            order = np.argsort(raw)
+            self.prepare_table(raw[order], corrected[order])
+        else:
+            coefficients = list(record['polynomial']) + [0.0, 0.0]
+            if not any(coefficients[2:]):
+                # Linear: no lookup needed
+                self.offset, self.gain = float(coefficients[0]), float(coefficients[1])
+            else:
+                raw = np.linspace(*LUT_RANGE, LUT_SIZE + 1)
+                self.prepare_table(raw, np.polynomial.polynomial.polyval(raw, record['polynomial']))
+
+
+    def prepare_table(self, raw, corrected):
+        """
+        This method precomputes slope and intercept of each segment of a lookup table.
+
+        :param raw: Raw resistances, increasing, evenly spaced for a fast lookup.
+        :type raw: numpy.ndarray
+        :param corrected: Corrected resistances.
+        :type corrected: numpy.ndarray
+        """
+        if len(raw) < 2:
+            raise ValueError("A calibration table needs at least two points.")
+        self.raw = raw
+        self.slopes = np.diff(corrected)/np.diff(raw)
+        self.intercepts = corrected[:-1] - self.slopes*raw[:-1]
+        spacing = np.diff(raw)
+        # Evenly spaced points are looked up by index, the others by binary search
+        self.step = spacing[0] if np.allclose(spacing, spacing[0]) else None
+
+
+    def apply(self, values, out=None):
+        """
+        This method corrects a batch of samples. ``NaN`` samples stay ``NaN``.
+
+        :param values: Raw resistance samples.
+        :type values: numpy.ndarray
+        :param out: Array the corrected samples are written to, possibly ``values`` itself. A new one if ``None``.
+        :type out: numpy.ndarray
+
+        :returns: Corrected resistance samples.
+        :rtype: numpy.ndarray
+        """
+        if self.gain is not None:
+            out = np.multiply(values, self.gain, out=out)
+            return np.add(out, self.offset, out=out)
+        if self.step is not None:
+            segments = np.nan_to_num((values - self.raw[0])/self.step)
+        else:
+            segments = np.searchsorted(self.raw, np.nan_to_num(values), side='right') - 1
+        segments = np.clip(segments, 0, len(self.slopes) - 1).astype(np.intp)
+        out = np.multiply(values, self.slopes[segments], out=out)
+        return np.add(out, self.intercepts[segments], out=out)
+
+
+    def describe(self):
+        """
+        This method describes the calibration, to be recorded with the data it has been applied to.
+
+        :returns: Device, sensor and the calibration as stored.
+        :rtype: dict
+        """
+        return dict(self.record, device=self.device, sensor=self.sensor)
+
+
+    def __str__(self):
+        return "calibration v{} of sensor {} on device {}".format(self.version, self.sensor, self.device)
+
+
+
+###########
+#  STORE  #
+###########
+class CalibrationStore:
+    """
+    Class that stores the calibrations of all the devices and sensors, and prepares the ones in use.
+    """
+    def __init__(self, path=CALIBRATIONS_PATH):
+        """
+        Init a calibration store, loading its file if it exists.
+
+        :param path: File where the calibrations are stored.
+        :type path: str
+        """
+        self.path = path
+        self.records = {}
+        self.cache = {} # prepared calibration of each (device key, sensor)
+        try:
+            with open(path) as file:
+                self.records = json.load(file)
+            logger.debug("Calibrations loaded from {}.".format(path))
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError):
+            logger.warning("Invalid calibrations in {}: measurements will not be corrected.".format(path))
+
+
+    def lookup(self, fingerprint, sensor=DEFAULT_SENSOR):
+        """
+        This method returns the latest calibration of a sensor used with a device.
+
+        :param fingerprint: Fingerprint of the device, as returned by :py:func:`discovery.port_fingerprint`.
+        :type fingerprint: dict
+        :param sensor: Name of the sensor.
+        :type sensor: str
+
+        :returns: The calibration, ``None`` if the sensor has never been calibrated on the device.
+        :rtype: Calibration
+        """
+        key = device_key(fingerprint)
+        if (key, sensor) not in self.cache:
+            versions = self.records.get(key, {}).get(sensor)
+            calibration = None
+            if versions:
+                try:
+                    calibration = Calibration(key, sensor, max(versions, key=lambda record: record['version']))
+                except (KeyError, TypeError, ValueError):
+                    logger.exception("Invalid calibration of sensor {} on device {}.".format(sensor, key))
+            self.cache[(key, sensor)] = calibration
+        return self.cache[(key, sensor)]
+
+
+    def add(self, fingerprint, sensor=DEFAULT_SENSOR, polynomial=None, table=None):
+        """
+        This method stores a new version of the calibration of a sensor used with a device.
+
+        :param fingerprint: Fingerprint of the device, as returned by :py:func:`discovery.port_fingerprint`.
+        :type fingerprint: dict
+        :param sensor: Name of the sensor.
+        :type sensor: str
+        :param polynomial: Coefficients of the correction polynomial, from the constant term.
+        :type polynomial: list
+        :param table: Raw resistances and corrected resistances.
+        :type table: tuple
+
+        :returns: The new calibration.
+        :rtype: Calibration
+        """
+        key = device_key(fingerprint)
+        versions = self.records.setdefault(key, {}).setdefault(sensor, [])
+        record = {
+            'version': max((r['version'] for r in versions), default=0) + 1,
+            'date': datetime.now().isoformat(),
+        }
+        if table is not None:
+            record['table'] = [list(map(float, values)) for values in table]
+        else:
+            record['polynomial'] = list(map(float, polynomial))
+        calibration = Calibration(key, sensor, record)
+        versions.append(record)
+        self.cache[(key, sensor)] = calibration
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path, 'w') as file:
+            json.dump(self.records, file, indent=1)
+        logger.info("Stored {}.".format(calibration))
+        return calibration
+
+
+
+###############
+#  UTILITIES  #
+###############
+def device_key(fingerprint):
+    """
+    This function builds the key a device is stored with, from its USB fingerprint.
+
+    :param fingerprint: Fingerprint of the device, as returned by :py:func:`discovery.port_fingerprint`.
+    :type fingerprint: dict
+
+    :returns: ``VID:PID:serial number``, or the port name if the device has no serial number.
+    :rtype: str
+    """
+    if fingerprint.get('serial_number') is None or fingerprint.get('vid') is None:
+        return fingerprint['port']
+    return "{:04X}:{:04X}:{}".format(fingerprint['vid'], fingerprint['pid'] or 0, fingerprint['serial_number'])
@@ -1,12 +1,16 @@
-import pandas as pd
-
 import os
 
+import queue
+
+import threading
+
+import time
+
 from datetime import datetime
 
 from loguru import logger
 
-import serial_workers as wrk
+import session_file
 
 
 
@@ -18,16 +22,35 @@ EXPORT = False
 If the user want to export or not.
 """
 
+CSV_FORMAT = 'csv'
+"""
+Export to ``.csv`` file.
+"""
 
+SESSION_FORMAT = 'binary'
+"""
+Export to binary session file (see :py:mod:`session_file`).
+"""
 
-##################
-#  DICTIONARIES  #
-##################
-PSoC_res_dict = {
-    'Resistance': []
-}
+FORMAT = CSV_FORMAT
 """
-Dictionary storing measured resistance data.
+Format of the export chosen by the user.
+"""
+
+FLUSH_INTERVAL = 1.0
+"""
+Maximum time, in seconds, rows stay buffered in memory before being written to file.
+"""
+
+CHUNK_SIZE = 4096
+"""
+Number of buffered rows that triggers a write regardless of :py:data:`FLUSH_INTERVAL`.
+"""
+
+QUEUE_SIZE = 256
+"""
+Maximum number of batches waiting to be written: when reached, :py:meth:`CsvStreamWriter.write` blocks
+until the background thread catches up, instead of letting memory grow.
 """
 
 
@@ -38,39 +61,237 @@ Global variable containing .csv identifier chosen by the user.
 """
 
 
+
+#############
+#  WRITERS  #
+#############
+class CsvStreamWriter:
+    """
+    Class that streams resistance data to a ``.csv`` file while the measurement is running.
+    Each row holds the time of a sample, in s from the first one, and its resistance (see :py:data:`session_file.CSV_COLUMNS`).
+
+    The header is written when the writer is created; then batches of samples are queued by
+    :py:meth:`write` and formatted and appended to file in chunks by a background thread,
+    which also flushes the file periodically. Memory usage is therefore constant, whatever
+    the length of the session, and data already flushed survive an application crash.
+
+    If writing to file fails (e.g. disk full or drive removed), the file is closed, and the error is
+    raised by the following calls to :py:meth:`write` and by :py:meth:`close`.
+    """
+    def __init__(self, path, identifier, sample_rate, flush_interval=FLUSH_INTERVAL, calibration=None):
+        """
+        Init a csv stream writer.
+
+        :param path: Path of the ``.csv`` file to be created.
+        :type path: str
+        :param identifier: Identifier chosen by the user.
+        :type identifier: str
+        :param sample_rate: Sample rate of the data, in Hz.
+        :type sample_rate: int
+        :param flush_interval: Maximum time, in seconds, between two writes to file.
+        :type flush_interval: float
+        :param calibration: Description of the calibration applied to the data (see :py:meth:`calibration.Calibration.describe`).
+        :type calibration: dict
+        """
+        self.path = path
+        self.sample_rate = sample_rate
+        self.flush_interval = flush_interval
+        self.n_samples = 0
+        self.start_ns = None
+        self.last_time = None
+        self.error = None
+        self.is_closing = False
+        self.file = open(path, 'w', encoding='utf-8')
+        self.file.write('#Identifier: '+identifier+'\n')
+        self.file.write('#Sample rate: '+str(sample_rate)+' Hz\n')
+        self.file.write('#Units: s;Ohm'+'\n')
+        if calibration is not None:
+            self.file.write(session_file.csv_calibration(calibration))
+        self.file.write('\n')
+        self.file.write(session_file.CSV_COLUMNS)
+        self.file.flush()
+        self.queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+
+    def write(self, data, timestamps=None):
+        """
+        This method queues a batch of samples to be written.
+
+        :param data: Batch of resistance samples.
+        :type data: sequence
+        :param timestamps: Timestamps of the samples, in ns. If missing, samples are assumed to be evenly spaced at the sample rate.
+        :type timestamps: sequence
+
+        :raises OSError: If writing to file has failed.
+        """
+        if self.error is not None:
+            raise self.error
+        self.queue.put((data, timestamps))
+
+
+    def close(self):
+        """
+        This method writes the remaining samples and closes the file. It blocks until done.
+
+        :raises OSError: If writing to file has failed.
+        """
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+
+    def run(self):
+        """
+        This method, executed by the background thread, formats queued samples and writes them in chunks.
+        """
+        try:
+            self.write_rows()
+        except OSError as e:
+            logger.error("Cannot write to {}: {}".format(self.path, e))
+            self.error = e
+            try:
+                self.file.close()
+            except OSError:
+                pass
+            # Keep emptying the queue, so that write and close never block
+            while not self.is_closing:
+                self.is_closing = self.queue.get() is None
+
+
+    def write_rows(self):
+        """
+        This method formats queued samples and writes them in chunks, until :py:meth:`close` is called.
+        """
+        rows = []
+        n_rows = 0
+        last_flush = time.monotonic()
+        while True:
+            try:
+                item = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = ((), None)
+            if item is None:
+                self.is_closing = True
+                break
+            data, timestamps = item
+            if len(data):
+                rows.append(session_file.csv_rows(self.times(len(data), timestamps), data))
+                n_rows += len(data)
+            if n_rows >= CHUNK_SIZE or time.monotonic() - last_flush >= self.flush_interval:
+                self.flush(rows)
+                self.n_samples += n_rows
+                rows = []
+                n_rows = 0
+                last_flush = time.monotonic()
+        self.flush(rows)
+        self.n_samples += n_rows
+        self.file.close()
+
+
+    def times(self, n_samples, timestamps):
+        """
+        This method computes the time of the samples of a batch, in s from the first sample written.
+
+        :param n_samples: Number of samples of the batch.
+        :type n_samples: int
+        :param timestamps: Timestamps of the samples, in ns, ``None`` if not available.
+        :type timestamps: sequence
+
+        :returns: Time of each sample.
+        :rtype: list
+        """
+        if timestamps is None:
+            start = self.last_time + 1/self.sample_rate if self.last_time is not None else 0
+            times = [start + i/self.sample_rate for i in range(n_samples)]
+        else:
+            if self.start_ns is None:
+                self.start_ns = timestamps[0] - int(self.last_time*1e9 if self.last_time is not None else 0)
+            times = [(timestamp - self.start_ns)/1e9 for timestamp in timestamps]
+        self.last_time = times[-1]
+        return times
+
+
+    def flush(self, rows):
+        """
+        This method writes formatted rows to file and flushes it.
+
+        :param rows: Formatted rows.
+        :type rows: list
+        """
+        if rows:
+            self.file.write(''.join(rows))
+        self.file.flush()
+
+
+
 ##################
 #  EXPORT FUNCS  #
 ##################
-def export_psoc_res_data():
+def start_psoc_res_export(state, suffix=''):
     """
-    This function creates a ``.csv`` file with information on sampling frequency and resistance data.
+    This function creates a ``.csv`` (or binary session) file for a device, with information on
+    sampling frequency and calibration, and starts streaming its resistance data into it.
+
+    :param state: State of the device, which holds the writer of its export.
+    :type state: serial_reader.DeviceState
+    :param suffix: Text appended to the file name, to tell apart the files of several devices.
+    :type suffix: str
     """
+    stop_psoc_res_export(state)
     if EXPORT:
 
         if not os.path.exists("Data"):
             os.mkdir("Data")
             logger.success("Data directory created.")
-            
+
         file_name = datetime.now().strftime("%d-%m-%Y_%H-%M-%S")+'_'+id
-        path = os.path.join('Data',file_name+'.csv')
-
-        sample_rate = str(wrk.PSOC_RES_SAMPLE_RATE)
-
-        with open(path, 'w') as file1:
-            file1.write('#Identifier: '+id+'\n')
-            file1.write('#Sample rate: '+sample_rate+' Hz\n')
-            file1.write('#Units: Ohm'+'\n')
-            file1.write('\n')
-
-        df = pd.DataFrame(PSoC_res_dict)
-        df.to_csv(
-            path,
-            mode='a', 
-            index=False,
-            encoding='utf-8',
-            float_format='%.3f',
-            decimal=',',
-            sep=';'
-        )
-
-        logger.info("PSoC resistance data exported into csv")
+        if suffix:
+            file_name += '_'+suffix
+        calibration = state.calibration.describe() if state.calibration is not None else None
+        if FORMAT == SESSION_FORMAT:
+            path = os.path.join('Data',file_name+session_file.SESSION_EXT)
+            state.writer = session_file.SessionWriter(path, id, state.sample_rate, timestamps=True,
+                                                      extra={'calibration': calibration} if calibration else None)
+        else:
+            path = os.path.join('Data',file_name+'.csv')
+            state.writer = CsvStreamWriter(path, id, state.sample_rate, calibration=calibration)
+        logger.info("PSoC resistance data export into {} started".format(path))
+
+
+def append_psoc_res_data(state, data):
+    """
+    This function appends a batch of resistance data to the ongoing export of a device, if any.
+
+    :param state: State of the device, which holds the writer of its export.
+    :type state: serial_reader.DeviceState
+    :param data: Batch of resistance samples, with their timestamps if it is a :py:class:`serial_reader.SampleBatch`.
+    :type data: sequence
+    """
+    if state.writer is not None:
+        try:
+            state.writer.write(data, getattr(data, 'timestamps', None))
+        except OSError as e:
+            # The file is no longer written: end the export instead of losing data silently
+            logger.error("PSoC resistance data export into {} failed: {}".format(state.writer.path, e))
+            stop_psoc_res_export(state)
+
+
+def stop_psoc_res_export(state):
+    """
+    This function completes the ongoing export of a device, if any.
+
+    :param state: State of the device, which holds the writer of its export.
+    :type state: serial_reader.DeviceState
+    """
+    if state.writer is not None:
+        writer, state.writer = state.writer, None
+        try:
+            writer.close()
+        except OSError as e:
+            logger.error("PSoC resistance data export into {} incomplete ({} samples written): {}".format(
+                writer.path, writer.n_samples, e))
+            return
+        logger.info("PSoC resistance data exported into {} ({} samples)".format(writer.path, writer.n_samples))
@@ -0,0 +1,287 @@
+import numpy as np
+
+
+
+############
+#  MACROS  #
+############
+LOD_FACTOR = 8
+"""
+Number of blocks of a level of detail summarized by a single block of the next (coarser) level.
+"""
+
+
+
+################
+#  DECIMATION  #
+################
+def minmax_decimate(x, y, n_bins):
+    """
+    This function reduces a curve to the minimum and maximum of ``n_bins`` groups of consecutive samples.
+
+    Each group is represented by two points, its minimum and its maximum, in their order of
+    appearance, so that spikes stay visible however large the group is. ``NaN`` values (gaps)
+    do not affect minimum and maximum, but a group that holds any is marked as a gap (see :py:func:`mark_gaps`).
+
+    :param x: Array of data shown on x-axis.
+    :type x: numpy.ndarray
+    :param y: Array of data to be plotted.
+    :type y: numpy.ndarray
+    :param n_bins: Number of groups, usually the width in pixels of the plot.
+    :type n_bins: int
+
+    :returns: The decimated x and y arrays (at most ``4*n_bins`` points each, ``2*n_bins`` with no gaps).
+        The input arrays are returned as they are if already small enough.
+    :rtype: tuple
+    """
+    n_points = len(y)
+    n_bins = max(int(n_bins), 1)
+    if n_points <= 2*n_bins:
+        return x, y
+    bin_size = -(-n_points // n_bins) # ceil
+    n_bins = -(-n_points // bin_size)
+    # Pad the last group with NaN so that all groups have the same size
+    padded = np.full(n_bins*bin_size, np.nan)
+    padded[:n_points] = y
+    groups = padded.reshape(n_bins, bin_size)
+    gaps = np.isnan(groups).any(axis=1)
+    # The padding is not a gap
+    gaps[-1] = np.isnan(y[(n_bins - 1)*bin_size:]).any()
+    with np.errstate(invalid='ignore'):
+        filled = np.where(np.isnan(groups), np.inf, groups)
+        i_min = np.argmin(filled, axis=1)
+        filled = np.where(np.isnan(groups), -np.inf, groups)
+        i_max = np.argmax(filled, axis=1)
+    # Order minimum and maximum of each group as they appear in the signal
+    first = np.minimum(i_min, i_max)
+    second = np.maximum(i_min, i_max)
+    offsets = np.arange(n_bins) * bin_size
+    indexes = np.empty(2*n_bins, dtype=np.intp)
+    indexes[0::2] = offsets + first
+    indexes[1::2] = offsets + second
+    indexes = np.minimum(indexes, n_points - 1)
+    return mark_gaps(x[indexes], y[indexes], gaps)
+
+
+def mark_gaps(x, y, gaps):
+    """
+    This function breaks a min/max envelope at the groups holding a gap, so that no line is drawn across it
+    (with ``connect='finite'``): ``NaN`` points are inserted before, between and after minimum and maximum
+    of each of these groups. The gap is thus shown within one group of its actual position.
+
+    :param x: x of the envelope, two points per group.
+    :type x: numpy.ndarray
+    :param y: Values of the envelope, two points per group.
+    :type y: numpy.ndarray
+    :param gaps: Whether each group holds a gap.
+    :type gaps: numpy.ndarray
+
+    :returns: x and y of the envelope, with the ``NaN`` points.
+    :rtype: tuple
+    """
+    first = 2*np.flatnonzero(gaps) # position of the first point of each group with a gap
+    if len(first) == 0:
+        return x, y
+    positions = np.concatenate((first, first + 1, first + 2))
+    # At the x of the neighbouring points, so that x does not decrease
+    values = np.concatenate((x[first], x[first + 1], x[first + 1]))
+    return np.insert(x, positions, values), np.insert(y, positions, np.nan)
+
+
+
+###########################
+#  LEVEL OF DETAIL (LOD)  #
+###########################
+class MinMaxPyramid:
+    """
+    Multi-resolution min/max envelope of an ever-growing signal (e.g. a whole measurement session).
+
+    Level 0 holds the raw samples. Each block of level ``k`` (``k >= 1``) holds minimum and maximum of
+    ``LOD_FACTOR**k`` raw samples, and whether any of them is ``NaN`` (a gap in the data). Levels are updated incrementally as new samples arrive, so that
+    :py:meth:`query` can draw any range of the signal, at any zoom level, with about as many points as
+    the plot has pixels, without scanning the raw samples.
+    """
+    def __init__(self, factor=LOD_FACTOR, capacity=4096):
+        """
+        Init a min/max pyramid.
+
+        :param factor: Number of blocks of a level summarized by a block of the next one.
+        :type factor: int
+        :param capacity: Initial number of raw samples that can be stored before growing the buffers.
+        :type capacity: int
+        """
+        self.factor = factor
+        self.capacity = capacity
+        self.clear()
+
+
+    def __len__(self):
+        return self.n_samples
+
+
+    def clear(self):
+        """
+        This method discards all the samples.
+        """
+        self.raw = np.empty(self.capacity)
+        self.x_raw = None # x of the raw samples, if given
+        self.n_samples = 0
+        self.mins = [] # one array per level, starting from level 1
+        self.maxs = []
+        self.gaps = []
+        self.n_blocks = []
+
+
+    def extend(self, values, x=None):
+        """
+        This method appends a batch of samples and updates the coarser levels.
+
+        :param values: Samples to be appended, from the oldest to the newest.
+        :type values: sequence
+        :param x: x of the samples, increasing. Samples with no x are placed at their index.
+        :type x: sequence
+        """
+        values = np.asarray(values, dtype=np.float64)
+        n_values = len(values)
+        if n_values == 0:
+            return
+        if x is not None and self.x_raw is None:
+            self.x_raw = np.arange(len(self.raw), dtype=np.float64)
+        if self.x_raw is not None:
+            self.x_raw = self._reserve(self.x_raw, self.n_samples + n_values)
+            self.x_raw[self.n_samples:self.n_samples + n_values] = (
+                x if x is not None else np.arange(self.n_samples, self.n_samples + n_values))
+        self.raw = self._reserve(self.raw, self.n_samples + n_values)
+        self.raw[self.n_samples:self.n_samples + n_values] = values
+        self.n_samples += n_values
+
+        # Propagate the new complete blocks level by level
+        factor = self.factor
+        lower_min = lower_max = self.raw
+        lower_gaps = None
+        lower_n = self.n_samples
+        level = 0
+        while True:
+            n_complete = lower_n // factor
+            if level == len(self.mins):
+                if n_complete == 0:
+                    break
+                self.mins.append(np.empty(max(n_complete, 64)))
+                self.maxs.append(np.empty(max(n_complete, 64)))
+                self.gaps.append(np.empty(max(n_complete, 64), dtype=bool))
+                self.n_blocks.append(0)
+            done = self.n_blocks[level]
+            if n_complete == done:
+                break
+            blocks = slice(done*factor, n_complete*factor)
+            self.mins[level] = self._reserve(self.mins[level], n_complete)
+            self.maxs[level] = self._reserve(self.maxs[level], n_complete)
+            self.mins[level][done:n_complete] = np.fmin.reduce(lower_min[blocks].reshape(-1, factor), axis=1)
+            self.maxs[level][done:n_complete] = np.fmax.reduce(lower_max[blocks].reshape(-1, factor), axis=1)
+            self.gaps[level] = self._reserve(self.gaps[level], n_complete)
+            lower = np.isnan(lower_min[blocks]) if lower_gaps is None else lower_gaps[blocks]
+            self.gaps[level][done:n_complete] = lower.reshape(-1, factor).any(axis=1)
+            self.n_blocks[level] = n_complete
+            lower_min, lower_max, lower_gaps, lower_n = self.mins[level], self.maxs[level], self.gaps[level], n_complete
+            level += 1
+
+
+    def query(self, start, stop, n_bins):
+        """
+        This method returns the min/max envelope of a range of samples.
+
+        :param start: Index of the first sample of the range.
+        :type start: int
+        :param stop: Index after the last sample of the range.
+        :type stop: int
+        :param n_bins: Maximum number of min/max pairs, usually the width in pixels of the plot.
+        :type n_bins: int
+
+        :returns: x (sample indexes, as floats, if the samples have no x) and values of the envelope,
+            broken by ``NaN`` points at the gaps (see :py:func:`mark_gaps`).
+        :rtype: tuple
+        """
+        start = max(int(start), 0)
+        stop = min(int(stop), self.n_samples)
+        n_points = stop - start
+        if n_points <= 0:
+            return np.empty(0), np.empty(0)
+        raw = self.raw[start:stop]
+        if self.x_raw is not None:
+            x_raw = self.x_raw[start:stop]
+        else:
+            x_raw = np.arange(start, stop, dtype=np.float64)
+        if n_points <= 2*n_bins:
+            return x_raw, raw
+
+        # Coarsest level that still has at least n_bins blocks in the range
+        level = -1
+        block = 1
+        while (level + 1 < len(self.mins) and
+               n_points // (block*self.factor) >= n_bins):
+            level += 1
+            block *= self.factor
+        if level < 0:
+            return minmax_decimate(x_raw, raw, n_bins)
+
+        first = start // block
+        last = min(stop // block, self.n_blocks[level])
+        mins = self.mins[level][first:last]
+        maxs = self.maxs[level][first:last]
+        gaps = self.gaps[level][first:last]
+        # Samples after the last complete block are summarized directly (less than one block)
+        tail = self.raw[last*block:stop]
+        if len(tail):
+            mins = np.append(mins, np.fmin.reduce(tail))
+            maxs = np.append(maxs, np.fmax.reduce(tail))
+            gaps = np.append(gaps, np.isnan(tail).any())
+
+        # Merge the blocks into at most n_bins groups
+        n_blocks = len(mins)
+        group = -(-n_blocks // n_bins)
+        n_groups = -(-n_blocks // group)
+        padded = np.full((2, n_groups*group), np.nan)
+        padded[0, :n_blocks] = mins
+        padded[1, :n_blocks] = maxs
+        mins = np.fmin.reduce(padded[0].reshape(n_groups, group), axis=1)
+        maxs = np.fmax.reduce(padded[1].reshape(n_groups, group), axis=1)
+        padded_gaps = np.zeros(n_groups*group, dtype=bool)
+        padded_gaps[:n_blocks] = gaps
+        gaps = padded_gaps.reshape(n_groups, group).any(axis=1)
+
+        x = np.empty(2*n_groups)
+        y = np.empty(2*n_groups)
+        x[0::2] = (first + np.arange(n_groups)*group) * block
+        x[1::2] = x[0::2] + group*block/2
+        np.minimum(x, stop - 1, out=x)
+        y[0::2] = mins
+        y[1::2] = maxs
+        if self.x_raw is not None:
+            x = self.x_raw[x.astype(np.intp)]
+        return mark_gaps(x, y, gaps)
+
+
+    def index_of(self, x):
+        """
+        This method finds the index of the first sample whose x is not lower than a given one.
+
+        :param x: x to be searched.
+        :type x: float
+
+        :returns: Index of the sample (``x`` itself if the samples have no x).
+        :rtype: float
+        """
+        if self.x_raw is None:
+            return x
+        return float(np.searchsorted(self.x_raw[:self.n_samples], x))
+
+
+    def _reserve(self, array, size):
+        """
+        This method grows an array, doubling its size, if it cannot hold ``size`` elements.
+        """
+        if size <= len(array):
+            return array
+        grown = np.empty(max(size, 2*len(array)), dtype=array.dtype)
+        grown[:len(array)] = array
+        return grown
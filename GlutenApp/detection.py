@@ -0,0 +1,307 @@
+"""
+Real-time gluten detection.
+
+:py:class:`DetectionEngine` consumes the resistance samples of a device as they are received and
+decides whether the food sample contains gluten, within a latency budget after the measurement
+has been started:
+
+* the samples of the first ``baseline_time`` seconds give the baseline resistance ``R0``, before the sensor reacts;
+* the decision metric is the relative resistance change ``(R - R0)/R0``, where ``R`` is the mean
+  resistance over the last ``window`` seconds;
+* gluten is detected if the metric exceeds ``threshold`` (in absolute value). The confidence of the
+  verdict is the probability, given the noise of the samples, that the metric is on the same side of
+  the threshold as measured;
+* the verdict is given as soon as its confidence reaches ``confidence``, and at the latest
+  ``latency_budget`` seconds after the start, with whatever confidence has been reached. Since the
+  sensor takes some time to respond, a gluten-free verdict is never given before ``response_time`` seconds.
+
+Only running sums are kept, so each batch of samples is processed with a few vectorized NumPy
+operations. Thresholds are loaded from a calibration file (see :py:func:`load_calibration`), a JSON
+object with the keys of :py:data:`DEFAULT_CALIBRATION`.
+
+The module does not depend on Qt.
+"""
+import os
+import json
+import math
+
+from collections import deque
+
+import numpy as np
+
+from loguru import logger
+
+
+
+##############
+#  SETTINGS  #
+##############
+CALIBRATION_PATH = os.path.join('Config', 'detection.json')
+"""
+File where the detection thresholds are stored.
+"""
+
+DEFAULT_CALIBRATION = {
+    'baseline_time': 10.0,
+    'window': 5.0,
+    'threshold': 0.05,
+    'confidence': 0.95,
+    'response_time': 30.0,
+    'latency_budget': 60.0,
+}
+"""
+Detection thresholds used when no calibration file is available: durations in seconds, ``threshold``
+as relative resistance change and ``confidence`` between 0 and 1.
+"""
+
+
+
+############
+#  MACROS  #
+############
+GLUTEN = "Gluten detected"
+"""
+Verdict of a food sample containing gluten.
+"""
+
+GLUTEN_FREE = "Gluten free"
+"""
+Verdict of a gluten-free food sample.
+"""
+
+INCONCLUSIVE = "Inconclusive"
+"""
+Verdict given when the latency budget expires before enough samples have been received.
+"""
+
+
+
+#############
+#  VERDICT  #
+#############
+class Verdict:
+    """
+    Class that holds the outcome of a detection.
+    """
+    def __init__(self, label, confidence, metric, latency):
+        """
+        Init a verdict.
+
+        :param label: :py:data:`GLUTEN`, :py:data:`GLUTEN_FREE` or :py:data:`INCONCLUSIVE`.
+        :type label: str
+        :param confidence: Confidence of the verdict, between 0 and 1.
+        :type confidence: float
+        :param metric: Relative resistance change the verdict is based on, ``NaN`` if not available.
+        :type metric: float
+        :param latency: Time, in seconds, from the start of the measurement to the verdict.
+        :type latency: float
+        """
+        self.label = label
+        self.confidence = confidence
+        self.metric = metric
+        self.latency = latency
+
+
+    def __str__(self):
+        return "{} ({:.0%} confidence, relative change {:+.2%}, after {:.1f} s)".format(
+            self.label, self.confidence, self.metric, self.latency)
+
+
+
+############
+#  ENGINE  #
+############
+class DetectionEngine:
+    """
+    Class that decides, from the resistance samples of a device, whether a food sample contains gluten.
+    """
+    def __init__(self, calibration=None):
+        """
+        Init a detection engine, idle until :py:meth:`start`.
+
+        :param calibration: Detection thresholds, as :py:data:`DEFAULT_CALIBRATION`. Defaults to the ones of :py:func:`load_calibration`.
+        :type calibration: dict
+        """
+        self.calibration = calibration if calibration is not None else load_calibration()
+        self.start_ns = None
+        self.verdict = None
+
+
+    @property
+    def is_running(self):
+        """
+        ``True`` from :py:meth:`start` until a verdict is given or :py:meth:`stop`.
+        """
+        return self.start_ns is not None and self.verdict is None
+
+
+    def start(self, start_ns):
+        """
+        This method starts a new detection.
+
+        :param start_ns: Time, in ns (``time.monotonic_ns()``), the measurement has been started at.
+        :type start_ns: int
+        """
+        self.start_ns = start_ns
+        self.verdict = None
+        self.offset = None
+        self.baseline = np.zeros(3) # number of samples, sum and sum of squares
+        self.batches = deque() # time of the last sample and sums of the batches in the window
+        self.window = np.zeros(3)
+        self.first_ns = None # time of the first sample after the baseline
+
+
+    def stop(self):
+        """
+        This method stops the ongoing detection, if any, without a verdict.
+        """
+        self.start_ns = None
+
+
+    def update(self, values, timestamps):
+        """
+        This method adds a batch of samples to the detection.
+
+        :param values: Resistance samples, in Ohm. ``NaN`` samples are ignored.
+        :type values: sequence
+        :param timestamps: Timestamps of the samples, in ns, on the same clock as the start time.
+        :type timestamps: sequence
+
+        :returns: The verdict, if given by this call.
+        :rtype: Verdict
+        """
+        if not self.is_running:
+            return None
+        values = np.asarray(values, dtype=np.float64)
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        if len(values) == 0:
+            return None
+        now_ns = int(timestamps[-1])
+        valid = ~np.isnan(values) & (timestamps >= self.start_ns)
+        values, timestamps = values[valid], timestamps[valid]
+        if len(values) == 0:
+            return self.poll(now_ns)
+        if self.offset is None:
+            # Sums of the differences from the first sample do not lose precision
+            self.offset = values[0]
+        values = values - self.offset
+        in_baseline = timestamps < self.start_ns + self.calibration['baseline_time']*1e9
+        self.baseline += sums(values[in_baseline])
+        values, timestamps = values[~in_baseline], timestamps[~in_baseline]
+        if len(values):
+            if self.first_ns is None:
+                self.first_ns = int(timestamps[0])
+            batch_sums = sums(values)
+            self.batches.append((int(timestamps[-1]), batch_sums))
+            self.window += batch_sums
+            # Drop the batches older than the window
+            while self.batches[0][0] < timestamps[-1] - self.calibration['window']*1e9:
+                self.window -= self.batches.popleft()[1]
+        return self.poll(now_ns)
+
+
+    def poll(self, now_ns):
+        """
+        This method gives the verdict if its confidence is high enough or the latency budget has expired.
+        To be called also when no samples are received, so that the budget is met anyway.
+
+        :param now_ns: Current time, in ns, on the same clock as the start time.
+        :type now_ns: int
+
+        :returns: The verdict, if given by this call.
+        :rtype: Verdict
+        """
+        if not self.is_running:
+            return None
+        latency = (now_ns - self.start_ns)/1e9
+        is_expired = latency >= self.calibration['latency_budget']
+        label, confidence, metric = self.evaluate(now_ns)
+        if label is None:
+            if not is_expired:
+                return None
+            label, confidence = INCONCLUSIVE, 0.0
+        elif not is_expired and (confidence < self.calibration['confidence']
+                                 or label == GLUTEN_FREE and latency < self.calibration['response_time']):
+            return None
+        self.verdict = Verdict(label, confidence, metric, latency)
+        return self.verdict
+
+
+    def evaluate(self, now_ns):
+        """
+        This method computes the decision metric and the verdict it leads to, with its confidence.
+
+        :param now_ns: Current time, in ns.
+        :type now_ns: int
+
+        :returns: Verdict label (``None`` if not enough samples have been received yet), confidence and metric.
+        :rtype: tuple
+        """
+        n_base, n_window = self.baseline[0], self.window[0]
+        if n_base < 2 or n_window < 2 or now_ns - self.first_ns < self.calibration['window']*1e9:
+            return None, 0.0, float('nan')
+        mean_base, var_base = moments(self.baseline)
+        mean_window, var_window = moments(self.window)
+        baseline = self.offset + mean_base
+        metric = (mean_window - mean_base)/baseline
+        error = math.sqrt(var_base/n_base + var_window/n_window)/abs(baseline)
+        margin = abs(metric) - self.calibration['threshold']
+        if error > 0:
+            confidence = 0.5*(1 + math.erf(abs(margin)/(error*math.sqrt(2))))
+        else:
+            confidence = 1.0
+        return (GLUTEN if margin >= 0 else GLUTEN_FREE), confidence, metric
+
+
+
+###############
+#  UTILITIES  #
+###############
+def sums(values):
+    """
+    This function computes the running sums of a batch of samples.
+
+    :param values: Samples.
+    :type values: numpy.ndarray
+
+    :returns: Number of samples, sum and sum of squares.
+    :rtype: numpy.ndarray
+    """
+    return np.array([len(values), values.sum(), np.dot(values, values)])
+
+
+def moments(running_sums):
+    """
+    This function computes mean and sample variance from running sums.
+
+    :param running_sums: Number of samples, sum and sum of squares, as returned by :py:func:`sums`.
+    :type running_sums: numpy.ndarray
+
+    :returns: Mean and variance.
+    :rtype: tuple
+    """
+    n, total, squares = running_sums
+    mean = total/n
+    return mean, max(squares - n*mean*mean, 0.0)/(n - 1)
+
+
+def load_calibration(path=CALIBRATION_PATH):
+    """
+    This function loads the detection thresholds. Missing thresholds take the values of :py:data:`DEFAULT_CALIBRATION`.
+
+    :param path: Calibration file.
+    :type path: str
+
+    :returns: The detection thresholds.
+    :rtype: dict
+    """
+    calibration = dict(DEFAULT_CALIBRATION)
+    try:
+        with open(path) as file:
+            calibration.update({key: float(value) for key, value in json.load(file).items() if key in DEFAULT_CALIBRATION})
+        logger.debug("Detection thresholds loaded from {}.".format(path))
+    except FileNotFoundError:
+        logger.debug("No detection calibration in {}: default thresholds used.".format(path))
+    except (OSError, ValueError, AttributeError, TypeError):
+        logger.warning("Invalid detection calibration in {}: default thresholds used.".format(path))
+    return calibration
@@ -0,0 +1,270 @@
+import time
+
+from loguru import logger
+
+from PyQt5.QtCore import (
+    QObject,
+    pyqtSignal
+)
+
+import csv_exporter
+import serial_workers as wrk
+import async_bridge
+import dsp
+import detection
+import calibration
+import discovery as disc
+
+
+
+###################
+# MANAGER_SIGNALS #
+###################
+class DeviceManagerSignals(QObject):
+    """
+    Class that defines the signals available to a :py:class:`DeviceManager` object.
+    """
+    #: Contains the state of the device *(serial_reader.DeviceState)*, the type of data *(str)* and the actual data received *(sequence)*.
+    data = pyqtSignal(object, str, object)
+    #: Contains the state of the device *(serial_reader.DeviceState)* and the status *(int)* of its connection, as in :py:class:`serial_workers.ReadWorkerSignals`.
+    status = pyqtSignal(object, int)
+
+
+
+##################
+# DEVICE_MANAGER #
+##################
+class DeviceManager:
+    """
+    Class that runs the reading workers of several devices at the same time.
+
+    Each device has its own reading worker and its own :py:class:`serial_reader.DeviceState`, which
+    holds sample rate and export. With an :py:class:`async_bridge.AsyncLoopThread`, the devices are read
+    by :py:class:`async_bridge.AsyncReadWorker` tasks sharing its event loop; otherwise each one is read
+    by a :py:class:`serial_workers.ReadWorker` on its own thread. Data and status of all the devices are
+    forwarded by a single pair of signals, together with the state of the device they come from.
+
+    When signal processing is enabled (see :py:meth:`set_dsp`), each device has its own
+    :py:func:`dsp.default_stage`, run by its reading worker on the samples before they are forwarded.
+    Each device also has its own :py:class:`detection.DetectionEngine`, sharing the thresholds loaded at init,
+    and the :py:class:`calibration.Calibration` of the ``sensor`` in use, looked up when the device is added.
+    The ``sample_rate`` set with :py:meth:`set_sample_rate`, if any, is set on each device upon connection.
+    """
+    def __init__(self, threadpool, loop_thread=None):
+        """
+        Init a device manager.
+
+        :param threadpool: Thread pool the thread based workers (e.g. replays) are run on.
+        :type threadpool: QThreadPool
+        :param loop_thread: Thread running the event loop the devices are read on, ``None`` to read each device on its own thread.
+        :type loop_thread: async_bridge.AsyncLoopThread
+        """
+        self.threadpool = threadpool
+        self.loop_thread = loop_thread
+        self.workers = []
+        self.n_added = 0
+        self.dsp_enabled = False
+        self.sample_rate = None
+        self.detection_calibration = detection.load_calibration()
+        self.calibrations = calibration.CalibrationStore()
+        self.sensor = calibration.DEFAULT_SENSOR
+        self.signals = DeviceManagerSignals()
+
+
+    def create_worker(self, port_name, capture_path=None):
+        """
+        This method creates the reading worker of a device, to be started by :py:meth:`add`.
+
+        :param port_name: Name of the port the device is connected to.
+        :type port_name: str
+        :param capture_path: Path of a file where all the raw bytes received are recorded.
+        :type capture_path: str
+
+        :returns: Reading worker of the device.
+        :rtype: async_bridge.AsyncReadWorker or serial_workers.ReadWorker
+        """
+        if self.loop_thread is not None:
+            return async_bridge.AsyncReadWorker(self.loop_thread, port_name, capture_path)
+        return wrk.ReadWorker(port_name, capture_path)
+
+
+    def add(self, worker):
+        """
+        This method starts a reading worker and forwards its signals.
+
+        :param worker: Reading worker of the device, not started yet.
+        :type worker: async_bridge.AsyncReadWorker or serial_workers.ReadWorker
+
+        :returns: State of the device.
+        :rtype: serial_reader.DeviceState
+        """
+        self.n_added += 1
+        state = worker.state
+        if state.label == state.port_name:
+            state.label = "Dev{}".format(self.n_added)
+        if self.dsp_enabled:
+            state.dsp = dsp.default_stage(state.sample_rate)
+        state.detector = detection.DetectionEngine(self.detection_calibration)
+        self.calibrate(state)
+        if self.sample_rate is not None:
+            # Set upon connection, instead of requesting the reset info
+            worker.requested_rate = self.sample_rate
+        worker.signals.data.connect(
+            lambda packet_type, data, state=state: self.signals.data.emit(state, packet_type, data))
+        worker.signals.status.connect(
+            lambda port_name, status, state=state: self.signals.status.emit(state, status))
+        self.workers.append(worker)
+        worker.is_streaming = True
+        if isinstance(worker, async_bridge.AsyncReadWorker):
+            worker.start()
+        else:
+            # Each thread based worker blocks a thread for the whole connection: leave room for the scan worker
+            n_threads = sum(not isinstance(w, async_bridge.AsyncReadWorker) for w in self.workers)
+            if self.threadpool.maxThreadCount() < n_threads + 2:
+                self.threadpool.setMaxThreadCount(n_threads + 2)
+            self.threadpool.start(worker)
+        logger.info("Device {} added on port {}.".format(state.label, state.port_name))
+        return state
+
+
+    def remove(self, state):
+        """
+        This method stops the reading worker of a device and completes its export.
+
+        :param state: State of the device.
+        :type state: serial_reader.DeviceState
+        """
+        for worker in self.workers:
+            if worker.state is state:
+                worker.stop()
+                self.workers.remove(worker)
+                csv_exporter.stop_psoc_res_export(state)
+                logger.info("Device {} removed.".format(state.label))
+                return
+
+
+    def remove_all(self):
+        """
+        This method stops the reading workers of all the devices and completes their exports.
+        """
+        for worker in list(self.workers):
+            self.remove(worker.state)
+        self.n_added = 0
+
+
+    def set_dsp(self, enabled):
+        """
+        This method enables or disables the signal processing of all the devices, present and future.
+
+        :param enabled: ``True`` to process the samples with :py:func:`dsp.default_stage`.
+        :type enabled: bool
+        """
+        self.dsp_enabled = enabled
+        for state in self.states():
+            # Replaced as a whole: the reading workers pick the new stage up at their next batch
+            state.dsp = dsp.default_stage(state.sample_rate) if enabled else None
+        logger.info("Signal processing {}.".format("enabled" if enabled else "disabled"))
+
+
+    def set_sample_rate(self, sample_rate):
+        """
+        This method sets the sample rate of all the devices, present and future. Ongoing measurements are stopped:
+        each device replies with the reset info of the rate it has actually set.
+
+        :param sample_rate: Sample rate, in Hz.
+        :type sample_rate: int
+        """
+        self.sample_rate = sample_rate
+        for worker in self.workers:
+            worker.set_sample_rate(sample_rate)
+        logger.info("Sample rate of the devices set to {} Hz.".format(sample_rate))
+
+
+    def calibrate(self, state):
+        """
+        This method looks up the calibration of the ``sensor`` in use on a device.
+
+        :param state: State of the device.
+        :type state: serial_reader.DeviceState
+        """
+        state.calibration = self.calibrations.lookup(disc.port_fingerprint(state.port_name), self.sensor)
+        if state.calibration is not None:
+            logger.info("Measurements of {} corrected with {}.".format(state.label, state.calibration))
+        else:
+            logger.debug("No calibration of sensor {} on {}: measurements not corrected.".format(self.sensor, state.label))
+
+
+    def set_sensor(self, sensor):
+        """
+        This method changes the sensor in use, and the calibration applied to all the devices accordingly.
+
+        :param sensor: Name of the sensor.
+        :type sensor: str
+        """
+        self.sensor = sensor if sensor else calibration.DEFAULT_SENSOR
+        for state in self.states():
+            self.calibrate(state)
+
+
+    def start_detection(self):
+        """
+        This method starts the detection on all the devices, from now.
+        """
+        start_ns = time.monotonic_ns()
+        for state in self.states():
+            state.detector.start(start_ns)
+
+
+    def stop_detection(self):
+        """
+        This method stops the ongoing detections, if any, without a verdict.
+        """
+        for state in self.states():
+            state.detector.stop()
+
+
+    def send(self, char):
+        """
+        This method sends a command to all the devices.
+
+        :param char: Command.
+        :type char: str
+        """
+        for worker in self.workers:
+            worker.send(char)
+
+
+    def ports(self):
+        """
+        This method lists the ports in use.
+
+        :returns: Names of the ports the devices are connected to.
+        :rtype: list
+        """
+        return [worker.state.port_name for worker in self.workers]
+
+
+    def states(self):
+        """
+        This method lists the states of the devices.
+
+        :returns: States of the devices, in the order they have been added.
+        :rtype: list
+        """
+        return [worker.state for worker in self.workers]
+
+
+    def start_exports(self):
+        """
+        This method starts the export of all the devices. With several devices, each file name ends with the device label.
+        """
+        for state in self.states():
+            csv_exporter.start_psoc_res_export(state, state.label if len(self.workers) > 1 else '')
+
+
+    def stop_exports(self):
+        """
+        This method completes the exports of all the devices.
+        """
+        for state in self.states():
+            csv_exporter.stop_psoc_res_export(state)
@@ -0,0 +1,281 @@
+import os
+
+import json
+
+import time
+
+import threading
+
+from concurrent.futures import (
+    ThreadPoolExecutor,
+    as_completed,
+    TimeoutError as FuturesTimeoutError
+)
+
+from loguru import logger
+
+import serial
+import serial.tools.list_ports
+
+
+
+##############
+#  COMMANDS  #
+##############
+CONN_REQUEST_CMD = 'c'
+"""
+Command to find target device.
+"""
+
+CONN_REPLY = b'$$$'
+"""
+Marker of the reply of the target device to :py:data:`CONN_REQUEST_CMD`.
+"""
+
+
+
+##############
+#  SETTINGS  #
+##############
+BAUDRATE = 115200
+"""
+Baudrate of serial port.
+"""
+
+EXTRA_PORTS = [port for port in os.environ.get('GLUTENSENS_PORTS', '').split(os.pathsep) if port]
+"""
+Additional ports to be scanned, besides the ones listed by the OS (e.g. the pseudo-terminal of
+:py:mod:`psoc_emulator`). Taken from the ``GLUTENSENS_PORTS`` environment variable, as a list of ports
+separated by ``os.pathsep``.
+"""
+
+PROBE_TIMEOUT = 1.5
+"""
+Maximum time, in seconds, the target device takes to reply to :py:data:`CONN_REQUEST_CMD`.
+"""
+
+PROBE_READ_TIMEOUT = 0.05
+"""
+Timeout, in seconds, of each read while waiting for the reply. Bounds the time a probe needs to notice it has been cancelled.
+"""
+
+MAX_PROBES = 16
+"""
+Maximum number of ports probed at the same time.
+"""
+
+CYPRESS_VID = 0x04B4
+"""
+USB vendor ID of Cypress, manufacturer of the PSoC (and of its KitProg USB-UART bridge).
+"""
+
+FINGERPRINT_PATH = os.path.join('Config', 'last_device.json')
+"""
+File where the fingerprint of the last target device found is stored.
+"""
+
+
+
+###############
+#  DISCOVERY  #
+###############
+def candidate_ports(fingerprint=None):
+    """
+    This function lists the ports on which the target device may be connected.
+
+    When the OS reports the USB vendor ID of a port, the port is kept only if it matches
+    Cypress or the vendor/product IDs of the last device found; ports without USB metadata
+    are always kept, since drivers do not always report it. The port that matches the
+    fingerprint of the last device found (same serial number, or same name) comes first.
+
+    :param fingerprint: Fingerprint of the last device found (see :py:func:`port_fingerprint`).
+    :type fingerprint: dict
+
+    :returns: Names of the ports, as accepted by ``serial.Serial``.
+    :rtype: list
+    """
+    last_port = cached_port(fingerprint)
+    fingerprint = fingerprint or {}
+    ports = [
+        p.device
+        for p in serial.tools.list_ports.comports()
+        if p.vid is None or p.vid == CYPRESS_VID or
+        (p.vid, p.pid) == (fingerprint.get('vid'), fingerprint.get('pid'))
+    ] + EXTRA_PORTS
+    if last_port in ports:
+        ports.remove(last_port)
+        ports.insert(0, last_port)
+    return ports
+
+
+def cached_port(fingerprint):
+    """
+    This function finds the port the device described by a fingerprint is currently connected to.
+
+    The device is looked up by serial number, since the OS may assign it a different port
+    when it is plugged again; if the serial number is not available, by port name.
+
+    :param fingerprint: Fingerprint of the device (see :py:func:`port_fingerprint`).
+    :type fingerprint: dict
+
+    :returns: Name of the port, ``None`` if the port is not available anymore.
+    :rtype: str
+    """
+    if not fingerprint:
+        return None
+    ports = list(serial.tools.list_ports.comports())
+    if fingerprint.get('serial_number') is not None:
+        for p in ports:
+            if p.serial_number == fingerprint['serial_number']:
+                return p.device
+    if fingerprint['port'] in [p.device for p in ports] + EXTRA_PORTS:
+        return fingerprint['port']
+    return None
+
+
+def probe_port(port, timeout=PROBE_TIMEOUT, cancel=None):
+    """
+    This function checks whether a port has target device connected to it.
+
+    The connection command is sent and the reply is read as soon as it arrives, until the
+    connection marker is found or ``timeout`` expires. The port is always closed before returning.
+
+    :param port: Name of the port to be checked.
+    :type port: str
+    :param timeout: Maximum time, in seconds, to wait for the reply.
+    :type timeout: float
+    :param cancel: Event that, when set, aborts the probe.
+    :type cancel: threading.Event
+
+    :returns: ``True`` or ``False`` based on whether the target device has been found on that port.
+    :rtype: bool
+    """
+    logger.debug("Checking port {}.".format(port))
+    deadline = time.monotonic() + timeout
+    try:
+        with serial.Serial(port=port, baudrate=BAUDRATE,
+                           write_timeout=0, timeout=PROBE_READ_TIMEOUT) as ser:
+            ser.reset_input_buffer()
+            ser.write(CONN_REQUEST_CMD.encode('utf-8'))
+            logger.debug("Connection character {} written on port {}.".format(CONN_REQUEST_CMD, port))
+            reply = b''
+            while time.monotonic() < deadline:
+                if cancel is not None and cancel.is_set():
+                    return False
+                reply += ser.read(max(1, ser.in_waiting))
+                if CONN_REPLY in reply:
+                    return True
+    except (serial.SerialException, ValueError, OSError):
+        logger.debug("Error during setup of port {}.".format(port))
+        return False
+    return False
+
+
+def port_fingerprint(port):
+    """
+    This function collects the USB information that identifies the device connected to a port.
+
+    :param port: Name of the port.
+    :type port: str
+
+    :returns: Port name, USB vendor and product IDs and serial number (``None`` when not available).
+    :rtype: dict
+    """
+    fingerprint = {'port': port, 'vid': None, 'pid': None, 'serial_number': None}
+    for p in serial.tools.list_ports.comports():
+        if p.device == port:
+            fingerprint.update(vid=p.vid, pid=p.pid, serial_number=p.serial_number)
+            break
+    return fingerprint
+
+
+def save_fingerprint(port, path=FINGERPRINT_PATH):
+    """
+    This function stores the fingerprint of the device connected to a port, to find it faster at next startup.
+
+    :param port: Name of the port the target device is connected to.
+    :type port: str
+    :param path: File where the fingerprint is stored.
+    :type path: str
+    """
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as file:
+            json.dump(port_fingerprint(port), file)
+    except OSError:
+        logger.exception("Could not store fingerprint of device on port {}.".format(port))
+
+
+def load_fingerprint(path=FINGERPRINT_PATH):
+    """
+    This function loads the fingerprint of the last target device found.
+
+    :param path: File where the fingerprint is stored.
+    :type path: str
+
+    :returns: The fingerprint, ``None`` if not available.
+    :rtype: dict
+    """
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def discover_device(ports, timeout=PROBE_TIMEOUT, progress=None):
+    """
+    This function probes all the given ports at the same time and returns the first one on which
+    the target device replies.
+
+    :param ports: Names of the ports to be checked.
+    :type ports: list
+    :param timeout: Maximum time, in seconds, to wait for a reply.
+    :type timeout: float
+    :param progress: Function called with the number of probes completed and the number of ports, each time a probe completes.
+    :type progress: callable
+
+    :returns: Name of the port the target device is connected to, ``None`` if not found within ``timeout``.
+    :rtype: str
+    """
+    if not ports:
+        return None
+    cancel = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=min(len(ports), MAX_PROBES), thread_name_prefix="probe")
+    futures = {executor.submit(probe_port, port, timeout, cancel): port for port in ports}
+    found = None
+    try:
+        # Opening a port may hang on some drivers: bound the overall time
+        for n_done, future in enumerate(as_completed(futures, timeout=timeout + 1), 1):
+            if progress is not None:
+                progress(n_done, len(ports))
+            if future.result():
+                found = futures[future]
+                break
+    except FuturesTimeoutError:
+        logger.warning("Scan of ports {} timed out.".format(ports))
+    finally:
+        # Remaining probes stop at their next read; do not wait for them
+        cancel.set()
+        executor.shutdown(wait=False)
+    return found
+
+
+def discover_devices(ports, timeout=PROBE_TIMEOUT):
+    """
+    This function probes all the given ports at the same time and returns all the ones on which
+    a target device replies.
+
+    :param ports: Names of the ports to be checked.
+    :type ports: list
+    :param timeout: Maximum time, in seconds, to wait for a reply.
+    :type timeout: float
+
+    :returns: Names of the ports target devices are connected to, in the order of ``ports``.
+    :rtype: list
+    """
+    if not ports:
+        return []
+    with ThreadPoolExecutor(max_workers=min(len(ports), MAX_PROBES), thread_name_prefix="probe") as executor:
+        replies = list(executor.map(lambda port: probe_port(port, timeout), ports))
+    return [port for port, reply in zip(ports, replies) if reply]
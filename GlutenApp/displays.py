@@ -1,3 +1,5 @@
+from collections import deque
+
 from loguru import logger
 
 from PyQt5.QtWidgets import (
@@ -5,14 +7,14 @@ from PyQt5.QtWidgets import (
     QDialogButtonBox,
     QVBoxLayout,
     QLabel,
-    QTextEdit
+    QPlainTextEdit
 )
 from PyQt5 import QtCore
 
 
 KILL = False
 """
-Macro to avoid emission of append_signal.
+Macro to stop queueing logger messages.
 
 This ensures not to access some deleted objects when trying to display
 logs on window, if the user has closed the application. 
@@ -21,15 +23,28 @@ logs on window, if the user has closed the application.
 
 
 
-##################
-# LOGGER SIGNALS #
-##################
-class LoggerSignals(QtCore.QObject):
-    """
-    Class that defines the signals available to a :py:meth:`LoggerDisplay` object.
-    """
-    #: Text *(str)* to be displayed.
-    append_signal = QtCore.pyqtSignal(str)
+##############
+#  SETTINGS  #
+##############
+LOG_FLUSH_INTERVAL = 100
+"""
+Interval, in ms, between two updates of the logger display.
+"""
+
+LOG_MAX_LINES = 2000
+"""
+Maximum number of lines kept by the logger display: the oldest ones are discarded.
+"""
+
+LOG_LEVEL = 'DEBUG'
+"""
+Default minimum level of the messages displayed.
+"""
+
+LOG_FORMAT = "{time:DD-MM-YYYY HH:mm:ss} | {level} | {name} | {message}"
+"""
+Format of the messages displayed.
+"""
 
 
 
@@ -40,38 +55,85 @@ class LoggerDisplay(QtCore.QObject):
     """
     Class that is in charge of displaying logger messages on GUI.
 
-    .. note::
-        Has to be a *QObject* because a *QTextEdit* cannot work with 
-        multiple threads (the logger is active in multiple threads)::
-
-            QObject::connect: Cannot queue arguments of type 'QTextCursor'
-            (Make sure 'QTextCursor' is registered using qRegisterMetaType(). 
+    The loguru sink, called by any thread, only appends the message to a queue; the queue is
+    emptied into the display by a timer of the GUI thread every :py:data:`LOG_FLUSH_INTERVAL` ms,
+    with a single update of the widget however many messages arrived. The display keeps the last
+    :py:data:`LOG_MAX_LINES` lines only, so its memory and repaint cost do not grow with the session.
+    Messages below the chosen level are discarded by loguru before being formatted.
 
-        would be generated otherwise.
+    .. note::
+        The widget is only accessed by the GUI thread: a *QPlainTextEdit* cannot work with 
+        multiple threads (the logger is active in multiple threads).
     """
-    def __init__(self):
+    def __init__(self, level=LOG_LEVEL):
         """
         Init a logger display.
+
+        :param level: Minimum level of the messages displayed.
+        :type level: str
         """
         super(QtCore.QObject, self).__init__()
 
-        self.signals = LoggerSignals()
+        self.queue = deque(maxlen=LOG_MAX_LINES)
+        self.level_no = logger.level(level).no
 
-        self.txt_window = QTextEdit()
+        self.txt_window = QPlainTextEdit()
         self.txt_window.setReadOnly(True)
-        logger.add(
+        self.txt_window.setMaximumBlockCount(LOG_MAX_LINES)
+        self.handler_id = logger.add(
             self.appendMessage, 
-            format="{time:DD-MM-YYYY HH:mm:ss} | {level} | {name} | {message}"
+            format=LOG_FORMAT,
+            filter=lambda record: record["level"].no >= self.level_no
         )
 
+        self.flush_timer = QtCore.QTimer(self)
+        self.flush_timer.timeout.connect(self.flush)
+        self.flush_timer.start(LOG_FLUSH_INTERVAL)
+
 
     def appendMessage(self, text):
         """
-        This method sends a signal to ``MainWindow`` to update the display.
+        This method queues a message to be displayed. Called by any thread.
 
         :param text: Text to be displayed.
         :type text: str
         """
         global KILL
         if not KILL:
-            self.signals.append_signal.emit(text)
\ No newline at end of file
+            self.queue.append(text.rstrip('\n'))
+
+
+    def flush(self):
+        """
+        This method displays the messages queued since the previous call.
+        """
+        if not self.queue:
+            return
+        lines = []
+        while self.queue:
+            lines.append(self.queue.popleft())
+        self.txt_window.appendPlainText('\n'.join(lines))
+        scroll_bar = self.txt_window.verticalScrollBar()
+        scroll_bar.setValue(scroll_bar.maximum())
+
+
+    @QtCore.pyqtSlot(str)
+    def set_level(self, level):
+        """
+        This method changes the minimum level of the messages displayed.
+
+        :param level: Name of the level (e.g. ``'INFO'``).
+        :type level: str
+        """
+        self.level_no = logger.level(level).no
+
+
+    def close(self):
+        """
+        This method stops displaying messages: the sink is removed from the logger.
+        """
+        self.flush_timer.stop()
+        try:
+            logger.remove(self.handler_id)
+        except ValueError:
+            pass
@@ -0,0 +1,468 @@
+"""
+Streaming signal processing of resistance data.
+
+Filters process the samples batch by batch, as they are received, keeping only the few past
+samples they need between two batches: memory is constant and each batch is processed with a few
+vectorized NumPy operations, whatever the length of the session. A ``NaN`` sample (a gap in the
+data) is passed through and restarts the filters, so that the samples before a gap do not affect
+the ones after it.
+
+Available filters:
+
+* :py:class:`MovingAverage` and :py:class:`MovingMedian` over a window of samples;
+* :py:class:`LowPass`, a first order IIR low-pass filter;
+* :py:class:`BaselineRemoval`, which removes the slow drift of the baseline;
+* :py:class:`Derivative`, the slope of the signal, in units per second.
+
+Filters are chained and grouped in a :py:class:`DspStage`, which computes all its outputs from each
+batch of samples. :py:func:`default_stage` builds the stage used by the application.
+
+The module does not depend on Qt: it can be used by :py:mod:`acquire` and for offline processing as well.
+"""
+import math
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+
+##############
+#  SETTINGS  #
+##############
+MEDIAN_WINDOW = 5
+"""
+Number of samples of the moving median of the default stage, which removes isolated spikes.
+"""
+
+AVERAGE_WINDOW = 10
+"""
+Number of samples of the moving average applied before the derivative in the default stage.
+"""
+
+LOWPASS_CUTOFF = 0.5
+"""
+Cutoff frequency, in Hz, of the low-pass filter of the default stage.
+"""
+
+BASELINE_TIME_CONSTANT = 300
+"""
+Time constant, in seconds, of the baseline removed by the default stage: slower variations are removed.
+"""
+
+IIR_BLOCK_RANGE = 1e15
+"""
+Maximum ratio between the weights of the samples of a block processed at once by :py:func:`iir_first_order`.
+Bounds the rounding errors of the vectorized computation.
+"""
+
+
+
+##############
+#   MACROS   #
+##############
+SMOOTHED = "Smoothed"
+"""
+Name of the output of the default stage holding the smoothed resistance, in Ohm.
+"""
+
+BASELINE_CORRECTED = "Baseline corrected"
+"""
+Name of the output of the default stage holding the resistance without its baseline, in Ohm.
+"""
+
+SLOPE = "Slope"
+"""
+Name of the output of the default stage holding the slope of the resistance, in Ohm/s.
+"""
+
+
+
+#############
+#  FILTERS  #
+#############
+class StreamFilter:
+    """
+    Base class of the streaming filters. Subclasses implement :py:meth:`filter` and :py:meth:`restart`.
+    """
+    def __init__(self):
+        """
+        Init a streaming filter.
+        """
+        self.sample_rate = None
+
+
+    def reset(self, sample_rate):
+        """
+        This method prepares the filter for a new signal.
+
+        :param sample_rate: Sample rate of the signal, in Hz.
+        :type sample_rate: float
+        """
+        self.sample_rate = float(sample_rate)
+        self.restart()
+
+
+    def restart(self):
+        """
+        This method forgets the past samples, e.g. after a gap.
+        """
+
+
+    def process(self, values):
+        """
+        This method filters a batch of samples. ``NaN`` samples are passed through and restart the filter.
+
+        :param values: Samples, from the oldest to the newest.
+        :type values: sequence
+
+        :returns: Filtered samples, as many as the input ones.
+        :rtype: numpy.ndarray
+        """
+        values = np.asarray(values, dtype=np.float64)
+        gaps = np.flatnonzero(np.isnan(values))
+        if len(gaps) == 0:
+            return self.filter(values) if len(values) else values.copy()
+        out = np.full(len(values), np.nan)
+        start = 0
+        for gap in np.append(gaps, len(values)):
+            if gap > start:
+                out[start:gap] = self.filter(values[start:gap])
+            if gap < len(values):
+                self.restart()
+            start = gap + 1
+        return out
+
+
+    def filter(self, values):
+        """
+        This method filters a batch of samples with no gaps.
+
+        :param values: Samples, at least one.
+        :type values: numpy.ndarray
+
+        :returns: Filtered samples.
+        :rtype: numpy.ndarray
+        """
+        raise NotImplementedError
+
+
+
+class MovingAverage(StreamFilter):
+    """
+    Class that computes the mean of the last ``window`` samples. At the beginning of the signal,
+    the first sample stands in for the missing ones.
+    """
+    def __init__(self, window):
+        """
+        Init a moving average.
+
+        :param window: Number of samples averaged.
+        :type window: int
+        """
+        super().__init__()
+        self.window = int(window)
+        self.tail = None
+
+
+    def restart(self):
+        self.tail = None
+
+
+    def filter(self, values):
+        if self.tail is None:
+            self.tail = np.full(self.window - 1, values[0])
+        padded = np.concatenate((self.tail, values))
+        sums = np.concatenate(([0.0], np.cumsum(padded)))
+        self.tail = padded[len(padded) - (self.window - 1):]
+        return (sums[self.window:] - sums[:-self.window])/self.window
+
+
+
+class MovingMedian(StreamFilter):
+    """
+    Class that computes the median of the last ``window`` samples. At the beginning of the signal,
+    the first sample stands in for the missing ones.
+    """
+    def __init__(self, window):
+        """
+        Init a moving median.
+
+        :param window: Number of samples of the window.
+        :type window: int
+        """
+        super().__init__()
+        self.window = int(window)
+        self.tail = None
+
+
+    def restart(self):
+        self.tail = None
+
+
+    def filter(self, values):
+        if self.tail is None:
+            self.tail = np.full(self.window - 1, values[0])
+        padded = np.concatenate((self.tail, values))
+        self.tail = padded[len(padded) - (self.window - 1):]
+        return np.median(sliding_window_view(padded, self.window), axis=1)
+
+
+
+class LowPass(StreamFilter):
+    """
+    Class that implements a first order IIR low-pass filter, ``y[n] = y[n-1] + a*(x[n] - y[n-1])``.
+    The output starts from the first sample.
+    """
+    def __init__(self, cutoff):
+        """
+        Init a low-pass filter.
+
+        :param cutoff: Cutoff frequency, in Hz.
+        :type cutoff: float
+        """
+        super().__init__()
+        self.cutoff = float(cutoff)
+        self.alpha = 1.0
+        self.last = None
+
+
+    def reset(self, sample_rate):
+        super().reset(sample_rate)
+        self.alpha = 1 - math.exp(-2*math.pi*self.cutoff/self.sample_rate)
+
+
+    def restart(self):
+        self.last = None
+
+
+    def filter(self, values):
+        if self.last is None:
+            self.last = values[0]
+        out = iir_first_order(values, self.alpha, self.last)
+        self.last = out[-1]
+        return out
+
+
+
+class BaselineRemoval(StreamFilter):
+    """
+    Class that removes the baseline of the signal, i.e. its variations slower than a given time constant.
+    The output starts from 0.
+    """
+    def __init__(self, time_constant):
+        """
+        Init a baseline removal.
+
+        :param time_constant: Time constant, in seconds, of the baseline.
+        :type time_constant: float
+        """
+        super().__init__()
+        self.baseline = LowPass(1/(2*math.pi*time_constant))
+
+
+    def reset(self, sample_rate):
+        super().reset(sample_rate)
+        self.baseline.reset(sample_rate)
+
+
+    def restart(self):
+        self.baseline.restart()
+
+
+    def filter(self, values):
+        return values - self.baseline.filter(values)
+
+
+
+class Derivative(StreamFilter):
+    """
+    Class that computes the slope of the signal, in units per second, from consecutive samples.
+    The slope of the first sample is 0.
+    """
+    def __init__(self):
+        """
+        Init a derivative.
+        """
+        super().__init__()
+        self.last = None
+
+
+    def restart(self):
+        self.last = None
+
+
+    def filter(self, values):
+        if self.last is None:
+            self.last = values[0]
+        out = np.diff(values, prepend=self.last)*self.sample_rate
+        self.last = values[-1]
+        return out
+
+
+
+###########
+#  STAGE  #
+###########
+class Chain(StreamFilter):
+    """
+    Class that applies several filters one after the other.
+    """
+    def __init__(self, *filters):
+        """
+        Init a chain of filters.
+
+        :param filters: Filters, in the order they are applied.
+        :type filters: StreamFilter
+        """
+        super().__init__()
+        self.filters = filters
+
+
+    def reset(self, sample_rate):
+        super().reset(sample_rate)
+        for stream_filter in self.filters:
+            stream_filter.reset(sample_rate)
+
+
+    def restart(self):
+        for stream_filter in self.filters:
+            stream_filter.restart()
+
+
+    def filter(self, values):
+        for stream_filter in self.filters:
+            values = stream_filter.filter(values)
+        return values
+
+
+
+class DspStage:
+    """
+    Class that computes several processed signals (outputs) from the same resistance samples.
+
+    Outputs can be added and removed while the stage is in use by another thread: the set of
+    outputs is replaced, never modified in place.
+    """
+    def __init__(self, sample_rate):
+        """
+        Init a stage with no outputs.
+
+        :param sample_rate: Sample rate of the resistance samples, in Hz.
+        :type sample_rate: float
+        """
+        self.sample_rate = sample_rate
+        self.chains = {}
+
+
+    def add(self, name, *filters):
+        """
+        This method adds an output, computed by a chain of filters.
+
+        :param name: Name of the output.
+        :type name: str
+        :param filters: Filters, in the order they are applied.
+        :type filters: StreamFilter
+        """
+        chain = Chain(*filters)
+        chain.reset(self.sample_rate)
+        self.chains = dict(self.chains, **{name: chain})
+
+
+    def remove(self, name):
+        """
+        This method removes an output.
+
+        :param name: Name of the output.
+        :type name: str
+        """
+        self.chains = {key: chain for key, chain in self.chains.items() if key != name}
+
+
+    def names(self):
+        """
+        This method lists the outputs.
+
+        :returns: Names of the outputs.
+        :rtype: list
+        """
+        return list(self.chains)
+
+
+    def reset(self, sample_rate):
+        """
+        This method prepares all the outputs for a new measurement.
+
+        :param sample_rate: Sample rate of the resistance samples, in Hz.
+        :type sample_rate: float
+        """
+        self.sample_rate = sample_rate
+        for chain in self.chains.values():
+            chain.reset(sample_rate)
+
+
+    def process(self, values):
+        """
+        This method computes all the outputs from a batch of samples.
+
+        :param values: Resistance samples, from the oldest to the newest.
+        :type values: sequence
+
+        :returns: Processed samples of each output, as many as the input ones, by name.
+        :rtype: dict
+        """
+        values = np.asarray(values, dtype=np.float64)
+        return {name: chain.process(values) for name, chain in self.chains.items()}
+
+
+
+###############
+#  UTILITIES  #
+###############
+def iir_first_order(values, alpha, last):
+    """
+    This function computes ``y[n] = (1 - alpha)*y[n-1] + alpha*x[n]`` without a loop over the samples.
+
+    Within a block of samples, ``y[n] = c**(n+1)*(y[-1] + alpha*sum(x[k]/c**(k+1)))``, with ``c = 1 - alpha``:
+    blocks are short enough for the weights ``c**(k+1)`` not to span more than :py:data:`IIR_BLOCK_RANGE`.
+
+    :param values: Input samples.
+    :type values: numpy.ndarray
+    :param alpha: Smoothing factor, between 0 and 1.
+    :type alpha: float
+    :param last: Output preceding the first sample.
+    :type last: float
+
+    :returns: Output samples.
+    :rtype: numpy.ndarray
+    """
+    decay = 1 - alpha
+    if decay <= 0:
+        return values.copy()
+    if decay >= 1:
+        return np.full(len(values), last, dtype=np.float64)
+    block = max(int(math.log(IIR_BLOCK_RANGE)/-math.log(decay)), 1)
+    out = np.empty(len(values))
+    for start in range(0, len(values), block):
+        chunk = values[start:start + block]
+        weights = decay**np.arange(1, len(chunk) + 1)
+        out[start:start + len(chunk)] = weights*(last + alpha*np.cumsum(chunk/weights))
+        last = out[start + len(chunk) - 1]
+    return out
+
+
+def default_stage(sample_rate):
+    """
+    This function builds the stage used by the application: smoothed resistance (:py:data:`SMOOTHED`),
+    resistance without baseline (:py:data:`BASELINE_CORRECTED`) and its slope (:py:data:`SLOPE`).
+
+    :param sample_rate: Sample rate of the resistance samples, in Hz.
+    :type sample_rate: float
+
+    :returns: The default stage.
+    :rtype: DspStage
+    """
+    stage = DspStage(sample_rate)
+    stage.add(SMOOTHED, MovingMedian(MEDIAN_WINDOW), LowPass(LOWPASS_CUTOFF))
+    stage.add(BASELINE_CORRECTED, MovingMedian(MEDIAN_WINDOW), BaselineRemoval(BASELINE_TIME_CONSTANT))
+    stage.add(SLOPE, MovingAverage(AVERAGE_WINDOW), Derivative())
+    return stage
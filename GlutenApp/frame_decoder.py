@@ -0,0 +1,484 @@
+import struct
+
+import math
+
+import numpy as np
+
+
+
+##############
+#   MACROS   #
+##############
+    # --------------- DATA STREAM
+HEADER_PSOC_R_MEAS = 0x0A
+"""
+Header byte for incoming PSoC resistance measurements data.
+"""
+
+HEADER_PSOC_R_PACKED = 0x0B
+"""
+Header byte for incoming PSoC resistance measurements data, several samples per frame.
+"""
+
+HEADER_RESET = 0x00
+"""
+Header byte for reset info.
+"""
+
+HEADER_RESET_EXT = 0x01
+"""
+Header byte for reset info with the sample rate in mHz, sent when it is not an integer number of Hz up to 255.
+"""
+
+HEADER_TEST = 0x11
+"""
+Header byte for test union data.
+"""
+
+TAIL_MEAS_PACKETS = 0xFF
+"""
+Tail byte for incoming measurements data.
+"""
+
+TAIL_PACKED = 0xFE
+"""
+Tail byte for incoming packed measurements data.
+"""
+
+TAIL_RESET = 0x0F
+"""
+Tail byte for reset info.
+"""
+
+TAIL_TEST = 0x0F
+"""
+Tail byte for test union data.
+"""
+
+    # --------------- PACKET TYPES
+PSOC_RES_PACKET = "PSoC res measurement"
+"""
+Packet type of resistance measurements.
+"""
+
+PSOC_PACKED_PACKET = "PSoC res packed"
+"""
+Packet type of packed resistance measurements: several samples with the sequence number of the frame.
+"""
+
+RESET_PACKET = "Reset info"
+"""
+Packet type of reset info.
+"""
+
+TEST_PACKET = "Test"
+"""
+Packet type of test union data.
+"""
+
+GAP_PACKET = "Gap"
+"""
+Packet type marking a gap in resistance measurements, due to a connection lost with the device.
+Not sent by the device: generated by :py:class:`serial_reader.SerialReader`.
+"""
+
+FRAMES = {
+    HEADER_PSOC_R_MEAS:   (PSOC_RES_PACKET,    8, TAIL_MEAS_PACKETS),
+    HEADER_PSOC_R_PACKED: (PSOC_PACKED_PACKET, 6, TAIL_PACKED),
+    HEADER_RESET:         (RESET_PACKET,       3, TAIL_RESET),
+    HEADER_RESET_EXT:     (RESET_PACKET,       6, TAIL_RESET),
+    HEADER_TEST:          (TEST_PACKET,        6, TAIL_TEST),
+}
+"""
+Frame layout for each header byte: packet type, total frame length (header and tail included) and tail byte.
+The length of packed frames is the one with no samples: see :py:func:`frame_length`.
+"""
+
+    # --------------- PACKED FRAMES
+PACKED_COUNT_OFFSET = 3
+"""
+Position, from the header, of the number of samples of a packed frame. The frame is laid out as:
+header, sequence number (uint16, big endian), number of samples (uint8), samples (see :py:data:`RES_SAMPLE_DTYPE`),
+checksum (sum of all the previous bytes, modulo 256) and tail.
+"""
+
+MAX_PACKED_SAMPLES = 64
+"""
+Maximum number of samples of a packed frame: a header followed by a larger number is not a valid frame.
+"""
+
+SEQUENCE_MASK = 0xFFFF
+"""
+Sequence numbers of packed frames wrap around after this value.
+"""
+
+RES_FRAME_DTYPE = np.dtype([
+    ('header', 'u1'),
+    ('integer', '>u4'),
+    ('decimal', '>u2'),
+    ('tail', 'u1'),
+])
+"""
+Layout of a resistance frame, to decode many consecutive frames at once with ``np.frombuffer``.
+"""
+
+RES_SAMPLE_DTYPE = np.dtype([
+    ('integer', '>u4'),
+    ('decimal', '>u2'),
+])
+"""
+Layout of a resistance sample in a packed frame.
+"""
+
+
+
+#################
+# FRAME DECODER #
+#################
+class FrameDecoder:
+    """
+    Streaming decoder of the frames sent by the target device.
+
+    Raw bytes are fed in chunks of any size through :py:meth:`feed`; they are stored in a
+    reusable buffer and every complete frame (header, payload, tail) is decoded in place.
+    Incomplete frames are kept for the next chunk, whereas bytes that cannot start a valid
+    frame (unknown header or wrong tail) are discarded, so that the decoder re-synchronizes on
+    the next valid frame.
+
+    :py:meth:`feed` decodes one frame at a time. :py:meth:`feed_batches` gives the same result,
+    but decodes each run of consecutive resistance frames at once, as a NumPy structured array
+    over the buffer (see :py:data:`RES_FRAME_DTYPE`), and looks for the next valid frame with
+    vectorized comparisons: no Python object is created per resistance sample.
+
+    Packed frames (:py:data:`PSOC_PACKED_PACKET`) carry several samples each, decoded at once as well,
+    and are valid only if their checksum matches. Their value is a tuple of sequence number and samples:
+    the sequence numbers reveal the frames lost or discarded (see :py:class:`serial_reader.SerialReader`).
+
+    .. note::
+        This class does not depend on Qt nor on the serial port, so it can be fed with any
+        byte string (e.g. for testing purposes).
+    """
+    def __init__(self):
+        """
+        Init a frame decoder.
+        """
+        self.buffer = bytearray()
+        self.n_discarded = 0
+
+
+    def feed(self, chunk):
+        """
+        This method appends a chunk of raw bytes to the internal buffer and decodes all the complete frames.
+
+        :param chunk: Raw bytes received from the target device.
+        :type chunk: bytes
+
+        :returns: Decoded frames, in order of arrival, as tuples of packet type and value.
+        :rtype: list
+        """
+        buffer = self.buffer
+        buffer += chunk
+        frames = []
+        pos = 0
+        end = len(buffer)
+        while pos < end:
+            layout = FRAMES.get(buffer[pos])
+            if layout is None:
+                # Not a header: skip the byte
+                pos += 1
+                self.n_discarded += 1
+                continue
+            packet_type = layout[0]
+            length = frame_length(buffer, pos, end)
+            if length is None or pos + length > end:
+                # Incomplete frame: wait for more data
+                break
+            if not length or not check_frame(buffer, pos, length):
+                # Wrong tail or checksum: the header byte was part of a payload
+                pos += 1
+                self.n_discarded += 1
+                continue
+            frames.append((packet_type, self.decode(packet_type, buffer, pos)))
+            pos += length
+        # Drop consumed bytes, keep the incomplete frame (if any) at the beginning
+        del buffer[:pos]
+        return frames
+
+
+    def feed_batches(self, chunk):
+        """
+        This method appends a chunk of raw bytes to the internal buffer and decodes all the complete frames,
+        consecutive resistance frames at once.
+
+        :param chunk: Raw bytes received from the target device.
+        :type chunk: bytes
+
+        :returns: Decoded frames, in order of arrival, as tuples of packet type and value. The value of
+            :py:data:`PSOC_RES_PACKET` frames is a *numpy.ndarray* with the samples of consecutive frames.
+        :rtype: list
+        """
+        buffer = self.buffer
+        buffer += chunk
+        frames = []
+        pos = 0
+        end = len(buffer)
+        while pos < end:
+            layout = FRAMES.get(buffer[pos])
+            if layout is not None:
+                packet_type = layout[0]
+                length = frame_length(buffer, pos, end)
+                if length is None or pos + length > end:
+                    # Incomplete frame: wait for more data
+                    break
+                if length and check_frame(buffer, pos, length):
+                    if packet_type == PSOC_RES_PACKET:
+                        values = decode_resistance_run(buffer, pos, (end - pos)//length)
+                        frames.append((packet_type, values))
+                        pos += len(values)*length
+                    else:
+                        frames.append((packet_type, self.decode(packet_type, buffer, pos)))
+                        pos += length
+                    continue
+            # Not a header, or wrong tail or checksum: skip to the next possible frame
+            next_pos = find_frame(buffer, pos + 1, end)
+            self.n_discarded += next_pos - pos
+            pos = next_pos
+        # Drop consumed bytes, keep the incomplete frame (if any) at the beginning
+        del buffer[:pos]
+        return frames
+
+
+    def decode(self, packet_type, buffer, pos):
+        """
+        This method decodes the payload of a frame starting at a given position of the buffer.
+
+        :param packet_type: Type of the frame to be decoded.
+        :type packet_type: str
+        :param buffer: Buffer holding the frame.
+        :type buffer: bytearray
+        :param pos: Position of the header byte of the frame.
+        :type pos: int
+
+        :returns: Decoded value: sequence number and samples for packed frames.
+        :rtype: float or int or tuple
+        """
+        if packet_type == PSOC_RES_PACKET:
+            data_int, data_dec = struct.unpack_from('>IH', buffer, pos + 1)
+            return round((data_int + data_dec/1000), 3)
+        if packet_type == PSOC_PACKED_PACKET:
+            return decode_packed(buffer, pos)
+        if packet_type == RESET_PACKET:
+            if buffer[pos] == HEADER_RESET_EXT:
+                rate_mhz = struct.unpack_from('>I', buffer, pos + 1)[0]
+                return rate_mhz//1000 if rate_mhz % 1000 == 0 else rate_mhz/1000
+            return buffer[pos + 1]
+        return truncate(struct.unpack_from('<f', buffer, pos + 1)[0], 3)
+
+
+    def reset(self):
+        """
+        This method discards any buffered byte.
+        """
+        self.buffer.clear()
+
+
+
+###############
+#  UTILITIES  #
+###############
+def decode_resistance_run(buffer, pos, n_frames):
+    """
+    This function decodes the consecutive valid resistance frames starting at a given position of the buffer.
+
+    :param buffer: Buffer holding the frames.
+    :type buffer: bytearray
+    :param pos: Position of the header byte of the first frame, which must be valid.
+    :type pos: int
+    :param n_frames: Maximum number of frames to be decoded.
+    :type n_frames: int
+
+    :returns: Resistance values, as many as the frames before the first invalid one.
+    :rtype: numpy.ndarray
+    """
+    # The views over the buffer are released on return, so that it can be resized
+    records = np.frombuffer(buffer, dtype=RES_FRAME_DTYPE, count=n_frames, offset=pos)
+    valid = (records['header'] == HEADER_PSOC_R_MEAS) & (records['tail'] == TAIL_MEAS_PACKETS)
+    if not valid.all():
+        records = records[:np.argmin(valid)]
+    # Exact numerator in thousandths of Ohm: a single rounding, as round(data_int + data_dec/1000, 3)
+    return (records['integer']*1000.0 + records['decimal'])/1000
+
+
+def decode_packed(buffer, pos):
+    """
+    This function decodes a packed frame starting at a given position of the buffer.
+
+    :param buffer: Buffer holding the frame.
+    :type buffer: bytearray
+    :param pos: Position of the header byte of the frame, which must be valid.
+    :type pos: int
+
+    :returns: Sequence number of the frame and its resistance values.
+    :rtype: tuple
+    """
+    sequence, n_samples = struct.unpack_from('>HB', buffer, pos + 1)
+    records = np.frombuffer(buffer, dtype=RES_SAMPLE_DTYPE, count=n_samples, offset=pos + PACKED_COUNT_OFFSET + 1)
+    return sequence, (records['integer']*1000.0 + records['decimal'])/1000
+
+
+def frame_length(buffer, pos, end):
+    """
+    This function computes the length of the frame whose header byte is at a given position of the buffer.
+
+    :param buffer: Buffer holding the frame.
+    :type buffer: bytearray
+    :param pos: Position of the header byte.
+    :type pos: int
+    :param end: End of the valid bytes of the buffer.
+    :type end: int
+
+    :returns: Length of the frame, header and tail included. ``None`` if the number of samples of a packed frame
+        has not been received yet, ``0`` if it is out of range (the header cannot start a valid frame).
+    :rtype: int
+    """
+    packet_type, length, _ = FRAMES[buffer[pos]]
+    if packet_type != PSOC_PACKED_PACKET:
+        return length
+    if pos + PACKED_COUNT_OFFSET >= end:
+        return None
+    n_samples = buffer[pos + PACKED_COUNT_OFFSET]
+    if not 0 < n_samples <= MAX_PACKED_SAMPLES:
+        return 0
+    return length + n_samples*RES_SAMPLE_DTYPE.itemsize
+
+
+def check_frame(buffer, pos, length):
+    """
+    This function checks the tail of a complete frame and, for packed frames, its checksum.
+
+    :param buffer: Buffer holding the frame.
+    :type buffer: bytearray
+    :param pos: Position of the header byte of the frame.
+    :type pos: int
+    :param length: Length of the frame, as returned by :py:func:`frame_length`.
+    :type length: int
+
+    :returns: ``True`` if the frame is valid.
+    :rtype: bool
+    """
+    packet_type, _, tail = FRAMES[buffer[pos]]
+    if buffer[pos + length - 1] != tail:
+        return False
+    if packet_type == PSOC_PACKED_PACKET:
+        return sum(buffer[pos:pos + length - 2]) & 0xFF == buffer[pos + length - 2]
+    return True
+
+
+def count_samples(frames):
+    """
+    This function counts the resistance samples of decoded frames.
+
+    :param frames: Frames, as returned by :py:meth:`FrameDecoder.feed_batches`.
+    :type frames: list
+
+    :returns: Number of resistance samples, single or packed.
+    :rtype: int
+    """
+    n_samples = sum(len(value) for packet_type, value in frames if packet_type == PSOC_RES_PACKET)
+    return n_samples + sum(len(value[1]) for packet_type, value in frames if packet_type == PSOC_PACKED_PACKET)
+
+
+def find_frame(buffer, start, end):
+    """
+    This function finds the first position of the buffer where a frame may start: a header byte
+    followed by the right tail, or a header byte whose frame is not complete yet. Checksums are not verified.
+
+    :param buffer: Buffer holding the frames.
+    :type buffer: bytearray
+    :param start: First position to be checked.
+    :type start: int
+    :param end: End of the valid bytes of the buffer.
+    :type end: int
+
+    :returns: Position of the possible frame, ``end`` if none.
+    :rtype: int
+    """
+    data = np.frombuffer(buffer, dtype=np.uint8, count=end)
+    next_pos = end
+    for header, (packet_type, length, tail) in FRAMES.items():
+        if packet_type == PSOC_PACKED_PACKET:
+            continue
+        last = end - length + 1 # first position of a frame that would not be complete
+        if last > start:
+            found = np.flatnonzero((data[start:last] == header) & (data[start + length - 1:end] == tail))
+            if len(found):
+                next_pos = min(next_pos, start + int(found[0]))
+        found = np.flatnonzero(data[max(start, last):end] == header)
+        if len(found):
+            next_pos = min(next_pos, max(start, last) + int(found[0]))
+    # Packed frames: the length depends on the number of samples after each header
+    _, length, tail = FRAMES[HEADER_PSOC_R_PACKED]
+    candidates = start + np.flatnonzero(data[start:next_pos] == HEADER_PSOC_R_PACKED)
+    if len(candidates):
+        count_pos = candidates + PACKED_COUNT_OFFSET
+        counts = data[np.minimum(count_pos, end - 1)].astype(np.intp)
+        tail_pos = candidates + length - 1 + counts*RES_SAMPLE_DTYPE.itemsize
+        possible = (count_pos >= end) | ((counts > 0) & (counts <= MAX_PACKED_SAMPLES) &
+                                         ((tail_pos >= end) | (data[np.minimum(tail_pos, end - 1)] == tail)))
+        found = np.flatnonzero(possible)
+        if len(found):
+            next_pos = int(candidates[found[0]])
+    return next_pos
+
+
+def get_data(data_raw):
+    """
+    This function reconstructs the measured resistance value from the 6 bytes received.
+
+    :param data_raw: Array of 6 bytes containing resistance data to be reconstructed.
+    :type data_raw: int
+
+    :returns: Reconstructed value of resistance.
+    :rtype: float
+
+    .. note::
+        The first 4 bytes of data_raw encodes the integer value, in Ohm:
+
+        0. (0x???????? >> 24) & 0xFF
+        1. (0x???????? >> 16) & 0xFF
+        2. (0x???????? >> 8)  & 0xFF
+        3. (0x????????)       & 0xFF
+
+        The last 2 bytes encodes the decimal part as an integer.
+        To get the decimal value they need to be divided by 1000.
+
+        4. (0x???? >> 8)      & 0xFF
+        5. (0x????)           & 0xFF
+
+    """
+    data_int = data_raw[0] << 24 | data_raw[1] << 16 | data_raw[2] << 8 | data_raw[3]
+    data_dec = data_raw[4] << 8 | data_raw[5]
+    data_final = round((data_int + data_dec/1000), 3)
+    return data_final
+
+
+def truncate(number, digits) -> float:
+    """
+    This function is used to truncate the reconstructed float after 3 decimals.
+    This is necessay because floating point precision of Python is higher than C, and if a 3 decimal float
+    is sent to the GUI, once reconstructed it will have a lot more decimals, NOT PART OF THE ORIGINAL SIGNAL.
+
+    :param number: Number to be truncated.
+    :type char: float
+    :param digits: Number of digits to maintain.
+    :type digits: int
+
+    :returns: Truncated number of desired decimal precision.
+    :rtype: float
+    """
+    stepper = 10.0 ** digits
+    scaled = stepper * number
+    # Numbers with no more decimals are returned as they are, to avoid truncate(16.4, 2) = 16.39 or truncate(-1.13, 2) = -1.12
+    if abs(scaled - round(scaled)) <= 4 * math.ulp(scaled):
+        return number
+    return math.trunc(scaled) / stepper
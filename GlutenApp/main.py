@@ -22,13 +22,18 @@ from PyQt5.QtWidgets import (
     QVBoxLayout,
     QHBoxLayout,
     QWidget,
-    QMessageBox
+    QMessageBox,
+    QFileDialog
 )
 
 import serial_workers as wrk
 import tab_graph as grp
 import displays
 import csv_exporter
+import replay
+import device_manager as dm
+import async_bridge
+import calibration
 
 
 
@@ -64,8 +69,6 @@ class MainWindow(QMainWindow):
         """
         Init a main window.
         """
-        # Parallel thread for progress bar
-        self.bar_worker = wrk.BarWorker()
         # Parallel thread for serial port scan
         self.scan_worker = wrk.ScanWorker()
         # Parallel thread for serial port reading
@@ -81,6 +84,16 @@ class MainWindow(QMainWindow):
         
         # Thread handler
         self.threadpool = QtCore.QThreadPool()
+        # Scan worker keeps monitoring ports for the whole session: readers must not wait for a free thread
+        self.threadpool.setMaxThreadCount(max(self.threadpool.maxThreadCount(), 4))
+        # Event loop shared by the reading tasks of all the devices
+        self.async_loop = async_bridge.AsyncLoopThread()
+        # Reading workers of all the devices connected
+        self.device_manager = dm.DeviceManager(self.threadpool, self.async_loop)
+        self.device_manager.signals.data.connect(self.handle_data)
+        self.device_manager.signals.status.connect(self.check_serialport_status)
+        # Latest verdict of the detection of each device
+        self.verdicts = {}
 
         self.serialscan()
         self.initUI()
@@ -102,6 +115,8 @@ class MainWindow(QMainWindow):
         self.progress_bar = QProgressBar()
         self.status_bar.addWidget(self.status_label,1)
         self.status_bar.addWidget(self.progress_bar,1)
+        self.verdict_label = QLabel()
+        self.status_bar.addWidget(self.verdict_label,1)
 
         # Menu bar
         menu = self.menuBar()
@@ -128,6 +143,14 @@ class MainWindow(QMainWindow):
         self.id_txt.setFixedWidth(80)
         self.id_txt.setPlaceholderText("max 10 char")
         self.file_toolbar.addWidget(self.id_txt)
+                # Sensor in use, whose calibration is applied
+        self.file_toolbar.addWidget(QLabel(" Sensor: "))
+        self.sensor_txt = QLineEdit(
+            editingFinished=lambda: self.device_manager.set_sensor(self.sensor_txt.text().strip())
+        )
+        self.sensor_txt.setFixedWidth(80)
+        self.sensor_txt.setPlaceholderText(calibration.DEFAULT_SENSOR)
+        self.file_toolbar.addWidget(self.sensor_txt)
                 # Icon for data export to csv
         self.file_toolbar.addSeparator()
         self.csv_export_icon = QAction(QtGui.QIcon('Icons/script-excel.png'), "Export .csv")
@@ -135,8 +158,19 @@ class MainWindow(QMainWindow):
         self.csv_export_icon.triggered.connect(self.doExportcsv)
         self.csv_export_icon.setShortcut(QtGui.QKeySequence("Ctrl+e"))
         self.file_toolbar.addAction(self.csv_export_icon)
+                # Format of exported data
+        self.file_toolbar.addWidget(QLabel(" Format: "))
+        self.format_list_widget = QComboBox()
+        self.format_list_widget.addItems([csv_exporter.CSV_FORMAT, csv_exporter.SESSION_FORMAT])
+        self.format_list_widget.currentTextChanged.connect(self.change_export_format)
+        self.file_toolbar.addWidget(self.format_list_widget)
         self.file_toolbar.addSeparator()
         self.file_menu.addAction(self.csv_export_icon)
+                # Replay of recorded data
+        self.replay_action = QAction("Replay recording...")
+        self.replay_action.triggered.connect(self.start_replay)
+        self.replay_action.setShortcut(QtGui.QKeySequence("Ctrl+r"))
+        self.file_menu.addAction(self.replay_action)
             # Option toolbar
         self.opt_toolbar = QToolBar("Option toolbar")
                 # Cannot be moved
@@ -146,6 +180,52 @@ class MainWindow(QMainWindow):
         self.opt_toolbar.toggleViewAction().setEnabled(False)
         self.opt_toolbar.setIconSize(QtCore.QSize(16, 16))
         self.addToolBar(self.opt_toolbar)
+                # Plot refresh rate
+        self.opt_toolbar.addSeparator()
+        self.opt_toolbar.addWidget(QLabel("Plot FPS: "))
+        self.fps_list_widget = QComboBox()
+        self.fps_list_widget.addItems(['10', '30', '60'])
+        self.fps_list_widget.setCurrentText(str(grp.PLOT_FPS))
+        self.fps_list_widget.currentTextChanged.connect(self.change_plot_fps)
+        self.opt_toolbar.addWidget(self.fps_list_widget)
+                # Replay speed
+        self.opt_toolbar.addSeparator()
+        self.opt_toolbar.addWidget(QLabel("Replay speed: "))
+        self.speed_list_widget = QComboBox()
+        self.speed_list_widget.addItems(['1x', '10x', '100x', 'max'])
+        self.opt_toolbar.addWidget(self.speed_list_widget)
+                # Minimum level of the messages displayed
+        self.opt_toolbar.addSeparator()
+        self.opt_toolbar.addWidget(QLabel("Log level: "))
+        self.log_level_list_widget = QComboBox()
+        self.log_level_list_widget.addItems(['DEBUG', 'INFO', 'WARNING', 'ERROR'])
+        self.log_level_list_widget.setCurrentText(displays.LOG_LEVEL)
+        self.opt_toolbar.addWidget(self.log_level_list_widget)
+                # Sample rate of the devices
+        self.opt_toolbar.addSeparator()
+        self.opt_toolbar.addWidget(QLabel("Sample rate [Hz]: "))
+        self.sample_rate_list_widget = QComboBox()
+        self.sample_rate_list_widget.addItems(['10', '100', '250', '500', '1000'])
+        self.sample_rate_list_widget.setCurrentText(str(wrk.PSOC_RES_SAMPLE_RATE))
+        self.sample_rate_list_widget.currentTextChanged.connect(self.change_sample_rate)
+        self.opt_toolbar.addWidget(self.sample_rate_list_widget)
+                # Recording of raw data for later replay
+        self.capture_action = QAction("Record raw data")
+        self.capture_action.setCheckable(True)
+        self.option_menu.addAction(self.capture_action)
+                # Acquisition from several devices at the same time
+        self.connect_all_action = QAction("Connect all devices")
+        self.connect_all_action.triggered.connect(self.connect_all_devices)
+        self.option_menu.addAction(self.connect_all_action)
+                # Online processing of the resistance samples
+        self.dsp_action = QAction("Signal processing")
+        self.dsp_action.setCheckable(True)
+        self.dsp_action.toggled.connect(self.toggle_dsp)
+        self.option_menu.addAction(self.dsp_action)
+                # Several samples per frame, for high sample rates
+        self.packed_action = QAction("Packed frames")
+        self.packed_action.setCheckable(True)
+        self.option_menu.addAction(self.packed_action)
 
         # Graph's tab panel
         self.graph_tab = grp.MyTabWidget()
@@ -181,9 +261,9 @@ class MainWindow(QMainWindow):
         self.clear_btn.setDisabled(True)
 
         # Logger display
-        self.logger_interface = displays.LoggerDisplay()
-        self.logger_interface.signals.append_signal.connect(self.update_log_window)
-        self.logger_txt = displays.LoggerDisplay().txt_window
+        self.logger_interface = displays.LoggerDisplay(self.log_level_list_widget.currentText())
+        self.log_level_list_widget.currentTextChanged.connect(self.logger_interface.set_level)
+        self.logger_txt = self.logger_interface.txt_window
                 
         # layout
         streaming_hlay = QHBoxLayout()
@@ -239,15 +319,14 @@ class MainWindow(QMainWindow):
         # Setup scan worker (already defined)
         self.scan_worker.signals.error.connect(self.scanworker_error)
         self.scan_worker.signals.device.connect(self.update_port_list)
+        self.scan_worker.signals.progress.connect(self.update_progress)
+        self.scan_worker.signals.found.connect(self.check_progress)
+        self.scan_worker.signals.port_added.connect(self.add_port)
+        self.scan_worker.signals.port_removed.connect(self.remove_port)
+        self.scan_worker.signals.another_device.connect(self.add_device)
         # Execute the worker
         self.threadpool.start(self.scan_worker)
 
-        # Setup progress bar worker (already defined)
-        self.bar_worker.signals.progress.connect(self.update_progress)
-        self.bar_worker.signals.finished.connect(self.check_progress)
-        # Execute the worker
-        self.threadpool.start(self.bar_worker)
-
 
     @QtCore.pyqtSlot(bool)
     def on_toggled(self, checked):
@@ -259,17 +338,18 @@ class MainWindow(QMainWindow):
         """
         if checked:
             # Setup reading worker
-            self.read_worker = wrk.ReadWorker(self.port_text) # needs to be re defined
-            self.read_worker.is_streaming = True
-            self.read_worker.signals.data.connect(self.handle_data)
-            self.read_worker.signals.status.connect(self.check_serialport_status)
+            capture_path = None
+            if self.capture_action.isChecked():
+                if not os.path.exists("Data"):
+                    os.mkdir("Data")
+                capture_path = os.path.join('Data', datetime.now().strftime("%d-%m-%Y_%H-%M-%S")+'_capture.bin')
+            self.read_worker = self.device_manager.create_worker(self.port_text, capture_path) # needs to be re defined
             # Execute the worker
-            self.threadpool.start(self.read_worker)
+            self.device_manager.add(self.read_worker)
         else:
-            # Stop streaming
-            self.read_worker.is_streaming = False
-            # Kill thread
-            self.read_worker.is_killed = True
+            # Stop streaming and kill the threads of all the devices
+            self.device_manager.remove_all()
+            self.graph_tab.remove_devices()
             # Disable all the widgets
             self.com_list_widget.setDisabled(False) # enable the possibility to change port
             self.res_stream_btn.setDisabled(True)
@@ -283,6 +363,70 @@ class MainWindow(QMainWindow):
             )
 
 
+    def start_replay(self):
+        """
+        This method replays a recorded raw capture or session file through the same path of live data.
+
+        The replay behaves as a connected device: measurement starts with ``res_stream_btn`` and
+        the replay is closed with ``conn_btn``.
+        """
+        if self.conn_btn.isChecked():
+            logger.warning("Disconnect from port {} before replaying a recording.".format(self.port_text))
+            return
+        path, _ = QFileDialog.getOpenFileName(
+            self, "Replay recording", "Data", "Recordings (*.bin *{});;All files (*)".format(replay.session_file.SESSION_EXT))
+        if not path:
+            return
+        speed = self.speed_list_widget.currentText()
+        speed = replay.MAX_SPEED if speed == 'max' else float(speed.rstrip('x'))
+        # Setup replay worker in place of reading worker
+        self.read_worker = replay.ReplayWorker(path, speed)
+        # conn_btn closes the replay, without opening the port
+        self.conn_btn.blockSignals(True)
+        self.conn_btn.setChecked(True)
+        self.conn_btn.blockSignals(False)
+        self.conn_btn.setDisabled(False)
+        # Execute the worker
+        self.device_manager.add(self.read_worker)
+
+
+    def toggle_dsp(self, checked):
+        """
+        This method enables or disables the online processing of the resistance samples of all the devices.
+        Processed signals are plotted in the *Processed* tab.
+
+        :param checked: State of the ``dsp_action``.
+        :type checked: bool
+        """
+        self.device_manager.set_dsp(checked)
+        if not checked:
+            self.graph_tab.remove_outputs()
+
+
+    def connect_all_devices(self):
+        """
+        This method searches for all the target devices connected besides the ones in use, and connects to them.
+        Measurements are started and stopped on all the devices at the same time.
+        """
+        if not self.conn_btn.isChecked() or isinstance(self.read_worker, replay.ReplayWorker):
+            logger.warning("Connect to a device before searching for other devices.")
+            return
+        logger.info("Searching for other devices...")
+        self.scan_worker.search_all(self.device_manager.ports())
+
+
+    def add_device(self, port):
+        """
+        This method connects to another target device found by the ``scan_worker``.
+
+        :param port: Name of the port the device is connected to.
+        :type port: str
+        """
+        if not self.conn_btn.isChecked():
+            return
+        self.device_manager.add(self.device_manager.create_worker(port))
+
+
     @QtCore.pyqtSlot(bool)
     def psoc_res_measure_start(self, checked):
         """
@@ -292,8 +436,15 @@ class MainWindow(QMainWindow):
         :type checked: bool
         """
         if checked:
-            self.read_worker.send(wrk.PSOC_RES_CMD)
+            self.device_manager.start_exports()
+            self.device_manager.send(wrk.PACKED_STREAM_CMD if self.packed_action.isChecked() else wrk.PSOC_RES_CMD)
             logger.info("PSoC resistance measurement started")
+            # Verdicts are due within the latency budget, even if no data are received
+            self.device_manager.start_detection()
+            self.verdicts = {}
+            self.verdict_label.setText("Detecting...")
+            QtCore.QTimer.singleShot(
+                int(self.device_manager.detection_calibration['latency_budget']*1000), self.check_detection)
             self.res_stream_btn.setDisabled(True)
             self.stop_stream_btn.setChecked(False)
             self.graph_tab.clear_plot_btn.setDisabled(True)
@@ -303,7 +454,7 @@ class MainWindow(QMainWindow):
     @QtCore.pyqtSlot(bool)
     def stop_data_stream(self, checked):
         """
-        This method stops measurement and, if enabled, exports data to csv file.
+        This method stops measurement and, if enabled, completes the export of data to csv file.
 
         .. note:: 
             This function does **not** set ``is_streaming`` to ``False``, neither kills the 
@@ -313,19 +464,20 @@ class MainWindow(QMainWindow):
         :type checked: bool
         """
         if checked:
-            self.read_worker.send(wrk.STOP_STREAM_CMD)
+            self.device_manager.send(wrk.STOP_STREAM_CMD)
             logger.info("Measurement stopped")
-            if self.res_stream_btn.isChecked():
-                csv_exporter.export_psoc_res_data()
+            self.device_manager.stop_detection()
+            if not self.verdicts:
+                self.verdict_label.clear()
+            for state in self.device_manager.states():
+                logger.info("Sample rate of {} estimated at {:.4f} Hz ({:+.0f} ppm), {} samples lost.".format(
+                    state.label, state.clock.rate, state.clock.drift_ppm, state.clock.n_lost))
+            # Complete the exports (if any)
+            self.device_manager.stop_exports()
 
             #self.stop = time.time()
             #t = self.stop-self.start
-            #logger.info("time: {}, samples: {}".format(t, len(csv_exporter.PSoC_res_dict['Resistance'])))
-
-            # Reset the dictionaries
-            csv_exporter.PSoC_res_dict.update({
-                'Resistance': []
-            })
+            #logger.info("time: {}".format(t))
             
             self.res_stream_btn.setChecked(False)
             self.res_stream_btn.setDisabled(False)
@@ -334,9 +486,9 @@ class MainWindow(QMainWindow):
 
     def send_input(self):
         """
-        This method sends user typed text to the connected device.
+        This method sends user typed text to the connected devices.
         """
-        self.read_worker.send(self.input_txt.text())
+        self.device_manager.send(self.input_txt.text())
 
 
 
@@ -356,7 +508,7 @@ class MainWindow(QMainWindow):
 
         if "setup" in text:
             # Device was found, but connection failed.. automatically re-start the search
-            self.scan_worker.device_found = False
+            self.scan_worker.search_again()
 
             
     def update_port_list(self, port):
@@ -371,102 +523,162 @@ class MainWindow(QMainWindow):
         self.com_list_widget.setCurrentText(port)
 
 
+    def add_port(self, port):
+        """
+        This method adds a plugged serial port to the ports list widget, without selecting it.
+
+        :param port: Name of the port that has been plugged.
+        :type port: str
+        """
+        if self.com_list_widget.findText(port) == -1: # avoids duplicates
+            self.com_list_widget.addItems([port])
+
+
+    def remove_port(self, port):
+        """
+        This method removes an unplugged serial port from the ports list widget.
+
+        :param port: Name of the port that has been unplugged.
+        :type port: str
+        """
+        index = self.com_list_widget.findText(port)
+        if index != -1 and not (self.conn_btn.isChecked() and port == self.port_text):
+            self.com_list_widget.removeItem(index)
+
 
-    ######################
-    # BAR WORKER SIGNALS #
-    ######################
     def update_progress(self, progress):
         """
-        This method updates the progress bar during the initial search-for-target-devide phase.
+        This method updates the progress bar during the search-for-target-devide phase.
 
-        :param progress: Progress quantification from 0 to 100% to be visualized on screen.
+        :param progress: Percentage of the ports probed in the ongoing search, from 0 to 100%.
         :type progress: int
-
-        .. note:: 
-            The percentage is time based, not event-related. The only event that
-            has an impact on the percentage displayed is the connection with the
-            target device, upon which 100% will be displayed.
         """
         self.progress_bar.setValue(progress)
 
 
-    def check_progress(self):
+    def check_progress(self, port):
         """
-        This method operates on the progress bar depending on the status of the 
-        search-for-target-devide and connection phases.
+        This method enables the interface and connects to the target device once it has been found.
+
+        :param port: Name of the port on which the target device has been found.
+        :type port: str
         """
-        if wrk.CONNECTION_STATUS != wrk.DEVICE_CONN:
-            # Setup progress bar worker
-            self.bar_worker = wrk.BarWorker() # needs to be re defined
-            self.bar_worker.signals.progress.connect(self.update_progress)
-            self.bar_worker.signals.finished.connect(self.check_progress)
-            # Execute the worker
-            self.threadpool.start(self.bar_worker)
-        else:
-            # Remove widgets from status bar
-            time.sleep(0.5)
-            self.status_bar.removeWidget(self.progress_bar)
-            self.status_bar.removeWidget(self.status_label)
-            # Enable the interface and set status tips (not done before to avoid hiding the progress bar)
-            self.conn_btn.setDisabled(False)
-            self.conn_btn.setChecked(True)
-            self.id_txt.setStatusTip("Insert identifier for .csv file. Max 5 char allowed")
-            self.csv_export_icon.setStatusTip("Enable/Disable .csv export")
-            self.res_stream_btn.setStatusTip("Start resistance measurement with PSoC readout circuit")
-            self.stop_stream_btn.setStatusTip("Stop any active streaming")
-            self.input_txt.setStatusTip("User input to be sent to target device")
-            self.send_btn.setStatusTip("Send user input to target device")
-            self.clear_btn.setStatusTip("Clear 'Reading...' tab history")
-            self.logger_txt.setStatusTip("Logging information display")
-            self.com_list_widget.setStatusTip("List of eligible ports")
-            self.conn_btn.setStatusTip("Connect/Disconnect from serial port")
-
-            logger.success("GUI connected with device on port {}.".format(self.com_list_widget.currentText()))
+        if self.conn_btn.isChecked():
+            # Already connected (e.g. replay ongoing)
+            return
+        # Remove widgets from status bar
+        self.status_bar.removeWidget(self.progress_bar)
+        self.status_bar.removeWidget(self.status_label)
+        # Enable the interface and set status tips (not done before to avoid hiding the progress bar)
+        self.conn_btn.setDisabled(False)
+        self.conn_btn.setChecked(True)
+        self.id_txt.setStatusTip("Insert identifier for .csv file. Max 5 char allowed")
+        self.csv_export_icon.setStatusTip("Enable/Disable .csv export")
+        self.format_list_widget.setStatusTip("Format of exported data: .csv or binary session file")
+        self.fps_list_widget.setStatusTip("Target refresh rate of the plot")
+        self.res_stream_btn.setStatusTip("Start resistance measurement with PSoC readout circuit")
+        self.stop_stream_btn.setStatusTip("Stop any active streaming")
+        self.input_txt.setStatusTip("User input to be sent to target device")
+        self.send_btn.setStatusTip("Send user input to target device")
+        self.clear_btn.setStatusTip("Clear 'Reading...' tab history")
+        self.speed_list_widget.setStatusTip("Speed of the replay of recorded data")
+        self.log_level_list_widget.setStatusTip("Minimum level of the messages displayed")
+        self.logger_txt.setStatusTip("Logging information display")
+        self.com_list_widget.setStatusTip("List of eligible ports")
+        self.conn_btn.setStatusTip("Connect/Disconnect from serial port")
+
+        logger.success("GUI connected with device on port {}.".format(self.com_list_widget.currentText()))
 
 
 
     #######################
     # READ WORKER SIGNALS #
     #######################
-    def handle_data(self, packet_type, data):
+    def handle_data(self, state, packet_type, data):
         """
-        This method updates the output window and the plot; it also updates the dictionary in which the 
-        resistance values, measured by the instrument and transmitted to the host machine, are stored.
+        This method updates the output window and the plot; it also streams the resistance values, 
+        measured by the instrument and transmitted to the host machine, to the ongoing csv export (if any).
+        Resistance values are received in batches, so each call handles all the samples collected
+        by the reading worker of a device since the previous one. Each device has its own curve
+        and export, whereas only the data of the ``read_worker`` are printed on the output window.
         
+        :param state: State of the device the data come from.
+        :type state: serial_reader.DeviceState
         :param packet_type: Identifier of the type of data that have been received.
         :type packet_type: str
-        :param data: The actual data being received.
-        :type data: list
+        :param data: The actual data being received. Resistance measurements come in batches.
+        :type data: sequence
         """
-        if packet_type != "Reset info":
+        if packet_type != "Reset info" and state is self.read_worker.state:
             # Reset info is handled differently
-            for i in range(0, len(data)):
-                self.graph_tab.output_window.append(str(data[i]))
-                self.graph_tab.output_window.moveCursor(QtGui.QTextCursor.End)
+            self.graph_tab.output_window.append(data)
 
         if packet_type == "Reset info":
-            # Reset stream buttons to relfect device status (not streaming)
-            self.res_stream_btn.setChecked(False)
-            self.res_stream_btn.setDisabled(False)
-            self.stop_stream_btn.setChecked(False)
-            # Clear plots
-            self.graph_tab.clear_plot(1, self.graph_tab.psoc_r_graph) # 1 is just random to account for state parameter
-        elif packet_type == "PSoC res measurement":
-            # Update plot and dict
-            self.graph_tab.update_plot(data[0], self.graph_tab.x_psoc_r, self.graph_tab.y_psoc_r, self.graph_tab.psoc_rLoad_line)
-            csv_exporter.PSoC_res_dict['Resistance'].append(data[0])
+            # Device is not streaming anymore: complete the export (if any)
+            csv_exporter.stop_psoc_res_export(state)
+            if state.detector is not None:
+                state.detector.stop()
+            if state is self.read_worker.state:
+                # Reset stream buttons to relfect device status (not streaming)
+                self.res_stream_btn.setChecked(False)
+                self.res_stream_btn.setDisabled(False)
+                self.stop_stream_btn.setChecked(False)
+            # Clear the curves of the device
+            self.graph_tab.clear_device(state)
+        elif packet_type in ("PSoC res measurement", "Gap"):
+            # Update plot and export (a gap is marked by a NaN sample)
+            self.graph_tab.update_device_plot(state, data)
+            csv_exporter.append_psoc_res_data(state, data)
+            if state.detector is not None and state.detector.is_running:
+                self.show_verdict(state, state.detector.update(data, data.timestamps))
+
+
+    def check_detection(self):
+        """
+        This method gives the verdicts still pending when the latency budget expires.
+        """
+        now_ns = time.monotonic_ns()
+        for state in self.device_manager.states():
+            if state.detector is not None:
+                self.show_verdict(state, state.detector.poll(now_ns))
+
+
+    def show_verdict(self, state, verdict):
+        """
+        This method shows the verdict of the detection of a device on the status bar.
+
+        :param state: State of the device.
+        :type state: serial_reader.DeviceState
+        :param verdict: Verdict of the detection, ``None`` if not given yet.
+        :type verdict: detection.Verdict
+        """
+        if verdict is None:
+            return
+        logger.success("{}: {}.".format(state.label, verdict))
+        self.verdicts[state.label] = verdict
+        self.verdict_label.setText(", ".join(
+            "{}: {} ({:.0%})".format(label, v.label, v.confidence) for label, v in self.verdicts.items()))
 
 
 
-    def check_serialport_status(self, port_name, status):
+    def check_serialport_status(self, state, status):
         """
         This method handles the status of the connection to serial port phase.
+        Errors of devices other than the one of the ``read_worker`` only disconnect that device.
 
-        :param port_name: Port name to which a connection is being estabilished.
-        :type port_name: str
-        :param status: Paramenter representing the status of the connection (0 - error during opening, 1 - success, 2 - error during reading).
+        :param state: State of the device to which a connection is being estabilished.
+        :type state: serial_reader.DeviceState
+        :param status: Paramenter representing the status of the connection (0 - error during opening, 1 - success, 2 - error during reading, 3 - connection lost and reconnecting, 4 - connection restored).
         :type status: int
         """
+        port_name = state.port_name
+        if state is not self.read_worker.state and status in (0, 1, 2):
+            if status == 1:
+                logger.success("Device {} connected on port {}.".format(state.label, port_name))
+            else:
+                logger.error("Device {} on port {} disconnected.".format(state.label, port_name))
+                self.device_manager.remove(state)
+            return
         if status == 0:
             self.conn_btn.setChecked(False)
             self.read_worker.is_streaming = False
@@ -499,12 +711,25 @@ class MainWindow(QMainWindow):
             self.stop_stream_btn.setChecked(False)
             self.res_stream_btn.setChecked(False)
             self.read_worker.is_streaming = False
+            csv_exporter.stop_psoc_res_export(state)
+            # Search again for the device: connection is restored as soon as it is plugged again
+            self.scan_worker.search_again()
             dlg = QMessageBox(self)
             dlg.setWindowTitle("Warning")
             dlg.setText("Cannot communicate with port {}. Please check the connection and try again.".format(port_name))
             dlg.setStandardButtons(QMessageBox.Ok)
             dlg.setIcon(QMessageBox.Warning)
             button = dlg.exec_()
+        elif status == 3:
+            # The reading worker is reconnecting: the measurement will be resumed
+            self.status_bar.showMessage("Connection with {} on port {} lost: reconnecting...".format(state.label, port_name))
+        elif status == 4:
+            if state is self.read_worker.state:
+                self.update_port_list(port_name)
+                self.conn_btn.setText(
+                    "Disconnect from port {}".format(port_name)
+                )
+            self.status_bar.showMessage("Connection with {} restored on port {}.".format(state.label, port_name), 5000)
 
 
     ###############
@@ -530,21 +755,10 @@ class MainWindow(QMainWindow):
             be run again without any problem.
         """
         displays.KILL = True # avoids printing to a not-anymore-existing widget
-        self.scan_worker.is_killed = True
-        self.bar_worker.is_killed = True
-        self.read_worker.is_streaming = False
-        self.read_worker.is_killed = True
-
-
-    def update_log_window(self, text):
-        """
-        This method updates the logger display.
-
-        :param text: Text to be displayed.
-        :type text: str
-        """
-        self.logger_txt.append(text)
-        self.logger_txt.moveCursor(QtGui.QTextCursor.End)
+        self.logger_interface.close()
+        self.scan_worker.kill()
+        self.device_manager.remove_all() # data received so far are saved
+        self.async_loop.stop() # ports closed before exiting
 
 
     @QtCore.pyqtSlot(str)
@@ -558,9 +772,44 @@ class MainWindow(QMainWindow):
         csv_exporter.id = id.replace(' ','-') # avoid spaces in the id
 
 
+    @QtCore.pyqtSlot(str)
+    def change_plot_fps(self, fps):
+        """
+        This method updates the target refresh rate of the plot according to user choice.
+
+        :param fps: Refresh rate selected by the user, in frames per second.
+        :type fps: str
+        """
+        self.graph_tab.set_fps(int(fps))
+
+
+    @QtCore.pyqtSlot(str)
+    def change_sample_rate(self, sample_rate):
+        """
+        This method sets the sample rate of the devices according to user choice.
+        Ongoing measurements are stopped, as upon a device reset.
+
+        :param sample_rate: Sample rate selected by the user, in Hz.
+        :type sample_rate: str
+        """
+        self.device_manager.set_sample_rate(int(sample_rate))
+
+
+    @QtCore.pyqtSlot(str)
+    def change_export_format(self, export_format):
+        """
+        This method updates the format of exported data according to user choice.
+
+        :param export_format: Format selected by the user.
+        :type export_format: str
+        """
+        csv_exporter.FORMAT = export_format
+        logger.info("Data export format set to {}".format(export_format))
+
+
     def doExportcsv(self, checked):
         """
-        This method enables csv export of received data.
+        This method enables csv export of received data. The choice applies from the next measurement started.
         """
         if checked:
             logger.info("Data export to .csv file enabled")
@@ -0,0 +1,226 @@
+"""
+Numeric output display.
+
+:py:class:`OutputView` shows the values received, one per row, as a list view over a
+:py:class:`SampleListModel`: samples are held by a :py:class:`ring_buffer.RingBuffer`, which
+retains the newest :py:data:`OUTPUT_RETENTION` values, and only the visible rows are ever formatted
+and painted. Values are appended in batches, and the view is updated at most
+:py:data:`OUTPUT_REFRESH_RATE` times per second, so the cost per sample does not depend on the
+length of the session.
+"""
+import numpy as np
+
+from PyQt5.QtCore import (
+    QAbstractListModel,
+    QModelIndex,
+    Qt,
+    QTimer
+)
+from PyQt5.QtWidgets import QListView
+
+from ring_buffer import RingBuffer
+
+
+
+##############
+#  SETTINGS  #
+##############
+OUTPUT_RETENTION = 100000
+"""
+Default number of values kept by the output display: the oldest ones are discarded.
+"""
+
+OUTPUT_REFRESH_RATE = 10
+"""
+Rate, in Hz, at which the values received are shown.
+"""
+
+
+
+##############
+# LIST_MODEL #
+##############
+class SampleListModel(QAbstractListModel):
+    """
+    Class that exposes the content of a ring buffer as a list of rows, from the oldest value to the newest.
+
+    Values appended are kept pending until :py:meth:`refresh`, which moves them into the buffer and
+    notifies the rows removed and inserted, so the rows never change under the view between two updates.
+    """
+    def __init__(self, retention=OUTPUT_RETENTION, row_format=None):
+        """
+        Init a sample list model.
+
+        :param retention: Maximum number of values kept.
+        :type retention: int
+        :param row_format: Format of each row (e.g. ``'{:.3f}'``), ``None`` to show values as they are.
+        :type row_format: str
+        """
+        super().__init__()
+        self.buffer = RingBuffer(retention, fill=np.nan)
+        self.row_format = row_format
+        self.n_rows = 0
+        self.pending = []
+
+
+    def rowCount(self, parent=QModelIndex()):
+        """
+        This method returns the number of rows shown.
+
+        :returns: Number of rows.
+        :rtype: int
+        """
+        return 0 if parent.isValid() else self.n_rows
+
+
+    def data(self, index, role=Qt.DisplayRole):
+        """
+        This method formats the value of a row. Only called for the rows being painted.
+
+        :param index: Index of the row.
+        :type index: QModelIndex
+        :param role: Role of the data requested.
+        :type role: int
+
+        :returns: Text of the row, ``None`` for other roles.
+        :rtype: str
+        """
+        if role != Qt.DisplayRole or not index.isValid():
+            return None
+        value = float(self.buffer.view()[self.buffer.capacity - self.n_rows + index.row()])
+        return self.row_format.format(value) if self.row_format is not None else str(value)
+
+
+    def append(self, values):
+        """
+        This method queues values to be shown at the next :py:meth:`refresh`.
+
+        :param values: Values, from the oldest to the newest.
+        :type values: sequence
+        """
+        if len(values):
+            self.pending.append(values)
+
+
+    def refresh(self):
+        """
+        This method moves the pending values into the buffer and updates the rows.
+
+        :returns: ``True`` if some row has been added.
+        :rtype: bool
+        """
+        if not self.pending:
+            return False
+        values = np.concatenate([np.asarray(batch, dtype=np.float64) for batch in self.pending])
+        self.pending = []
+        capacity = self.buffer.capacity
+        if len(values) >= capacity:
+            # All the rows change
+            self.beginResetModel()
+            self.buffer.extend(values)
+            self.n_rows = capacity
+            self.endResetModel()
+            return True
+        n_removed = max(self.n_rows + len(values) - capacity, 0)
+        if n_removed:
+            self.beginRemoveRows(QModelIndex(), 0, n_removed - 1)
+            self.n_rows -= n_removed
+            self.endRemoveRows()
+        self.beginInsertRows(QModelIndex(), self.n_rows, self.n_rows + len(values) - 1)
+        self.buffer.extend(values)
+        self.n_rows += len(values)
+        self.endInsertRows()
+        return True
+
+
+    def clear(self):
+        """
+        This method removes all the values, pending ones included.
+        """
+        self.beginResetModel()
+        self.buffer.clear(np.nan)
+        self.pending = []
+        self.n_rows = 0
+        self.endResetModel()
+
+
+    def set_retention(self, retention):
+        """
+        This method changes the maximum number of values kept. Values shown are removed.
+
+        :param retention: Maximum number of values kept.
+        :type retention: int
+        """
+        self.beginResetModel()
+        self.buffer = RingBuffer(retention, fill=np.nan)
+        self.pending = []
+        self.n_rows = 0
+        self.endResetModel()
+
+
+
+###############
+# OUTPUT_VIEW #
+###############
+class OutputView(QListView):
+    """
+    Class that displays numeric values one per row, following the newest ones while scrolled to the bottom.
+    """
+    def __init__(self, retention=OUTPUT_RETENTION, row_format=None, refresh_rate=OUTPUT_REFRESH_RATE):
+        """
+        Init an output view.
+
+        :param retention: Maximum number of values kept.
+        :type retention: int
+        :param row_format: Format of each row (e.g. ``'{:.3f}'``), ``None`` to show values as they are.
+        :type row_format: str
+        :param refresh_rate: Rate, in Hz, at which the values received are shown.
+        :type refresh_rate: int
+        """
+        super().__init__()
+        self.sample_model = SampleListModel(retention, row_format)
+        self.setModel(self.sample_model)
+        # All rows have the same height: no need to measure them
+        self.setUniformItemSizes(True)
+        self.setEditTriggers(QListView.NoEditTriggers)
+
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.refresh_timer.start(int(1000/refresh_rate))
+
+
+    def append(self, values):
+        """
+        This method appends values to the display. See :py:meth:`SampleListModel.append`.
+
+        :param values: Values, from the oldest to the newest.
+        :type values: sequence
+        """
+        self.sample_model.append(values)
+
+
+    def refresh(self):
+        """
+        This method shows the values received since the previous call.
+        """
+        scroll_bar = self.verticalScrollBar()
+        at_bottom = scroll_bar.value() >= scroll_bar.maximum()
+        if self.sample_model.refresh() and at_bottom:
+            self.scrollToBottom()
+
+
+    def clear(self):
+        """
+        This method removes all the values.
+        """
+        self.sample_model.clear()
+
+
+    def set_retention(self, retention):
+        """
+        This method changes the maximum number of values kept. Values shown are removed.
+
+        :param retention: Maximum number of values kept.
+        :type retention: int
+        """
+        self.sample_model.set_retention(retention)
@@ -0,0 +1,158 @@
+"""
+Serial port hotplug monitor.
+
+:py:class:`PortMonitor` reports the serial ports that appear or disappear, so that the search for
+the target device runs only when something actually changes. On Linux, if
+`pyudev <https://pyudev.readthedocs.io>`_ is installed, the monitor sleeps on the udev netlink socket
+and lists the ports only upon ``tty`` events; otherwise the list of ports is polled every
+:py:data:`POLL_INTERVAL` seconds and compared with the previous one. In both cases, another thread
+can end the wait at once with :py:meth:`PortMonitor.wake`.
+"""
+import os
+import select
+import threading
+import time
+
+from loguru import logger
+
+import serial.tools.list_ports
+
+try:
+    import pyudev
+except ImportError:
+    pyudev = None
+
+
+
+##############
+#  SETTINGS  #
+##############
+POLL_INTERVAL = 0.5
+"""
+Interval, in seconds, between two listings of the ports when udev is not available.
+"""
+
+
+
+#############
+#  MONITOR  #
+#############
+class PortMonitor:
+    """
+    Class that detects serial ports added and removed.
+    """
+    def __init__(self, poll_interval=POLL_INTERVAL, use_udev=True):
+        """
+        Init a port monitor. The ports available at this time are the reference for the first changes.
+
+        :param poll_interval: Interval, in seconds, between two listings of the ports when udev is not available.
+        :type poll_interval: float
+        :param use_udev: Whether to use udev events, if available.
+        :type use_udev: bool
+        """
+        self.poll_interval = poll_interval
+        self.woken = threading.Event()
+        self.wake_fds = None
+        self.udev_monitor = None
+        if use_udev and pyudev is not None:
+            try:
+                self.udev_monitor = pyudev.Monitor.from_netlink(pyudev.Context())
+                self.udev_monitor.filter_by('tty')
+                self.udev_monitor.start()
+                # The udev socket and the wake-up pipe are waited for together
+                self.wake_fds = os.pipe()
+                os.set_blocking(self.wake_fds[0], False)
+                logger.debug("Port monitor listening to udev events.")
+            except (OSError, ValueError):
+                logger.debug("udev not available: port monitor polling every {} s.".format(poll_interval))
+                self.udev_monitor = None
+        self.ports = self.snapshot()
+
+
+    def snapshot(self):
+        """
+        This method lists the ports currently available.
+
+        :returns: Names of the ports.
+        :rtype: set
+        """
+        return {p.device for p in serial.tools.list_ports.comports()}
+
+
+    def wake(self):
+        """
+        This method ends the ongoing (or the next) :py:meth:`wait`, from any thread.
+        """
+        self.woken.set()
+        if self.wake_fds is not None:
+            os.write(self.wake_fds[1], b'\0')
+
+
+    def wait_udev(self, timeout):
+        """
+        This method waits for udev events, until ``timeout`` expires or :py:meth:`wake` is called.
+
+        :param timeout: Maximum time, in seconds, to wait; ``None`` to wait with no limit.
+        :type timeout: float
+
+        :returns: ``True`` if some event has been received.
+        :rtype: bool
+        """
+        readable, _, _ = select.select([self.udev_monitor, self.wake_fds[0]], [], [], timeout)
+        if self.udev_monitor not in readable:
+            return False
+        # Several events are generated for a single device: list ports only once they are over
+        while self.udev_monitor.poll(timeout=0.05) is not None:
+            pass
+        return True
+
+
+    def wait(self, timeout=None):
+        """
+        This method waits until some port is added or removed, until ``timeout`` expires, or until
+        :py:meth:`wake` is called.
+
+        :param timeout: Maximum time, in seconds, to wait; ``None`` to wait with no limit.
+        :type timeout: float
+
+        :returns: Names of the ports added and of the ports removed since the previous call.
+        :rtype: tuple
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        added, removed = set(), set()
+        while not self.woken.is_set():
+            remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+            if self.udev_monitor is not None:
+                changed = self.wait_udev(remaining)
+            else:
+                self.woken.wait(self.poll_interval if remaining is None else min(remaining, self.poll_interval))
+                changed = not self.woken.is_set()
+            if changed:
+                ports = self.snapshot()
+                added, removed = ports - self.ports, self.ports - ports
+                self.ports = ports
+                if added or removed:
+                    logger.debug("Ports added: {}, removed: {}.".format(sorted(added), sorted(removed)))
+                    break
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+        if self.woken.is_set():
+            self.woken.clear()
+            if self.wake_fds is not None:
+                try:
+                    while os.read(self.wake_fds[0], 64):
+                        pass
+                except BlockingIOError:
+                    pass
+        return added, removed
+
+
+    def close(self):
+        """
+        This method stops listening to udev events.
+        """
+        if self.wake_fds is not None:
+            for fd in self.wake_fds:
+                os.close(fd)
+            self.wake_fds = None
+        self.udev_monitor = None
@@ -0,0 +1,371 @@
+"""
+Virtual GlutenSens device.
+
+The emulator implements the serial protocol of the firmware in ``PSoC_code`` on a pseudo-terminal
+(Linux/macOS only), so that :py:class:`serial_workers.ScanWorker`, :py:class:`serial_workers.ReadWorker`
+and the whole application can be tested and benchmarked without hardware:
+
+* ``c`` replies with the connection string ``Gluten $$$``;
+* ``r`` sends the reset info with the sample rate;
+* ``m`` starts streaming 8-byte resistance frames at the sample rate;
+* ``p`` starts streaming packed frames of :py:data:`PACKED_SAMPLES` samples at the sample rate;
+* ``f`` followed by a rate in Hz (uint16, big endian) sets the sample rate, as the firmware timer allows, and sends the reset info;
+* ``s`` stops streaming;
+* ``u`` sends the test union frame;
+* ``h`` prints the available commands.
+
+Resistance follows a baseline with linear drift and gaussian noise; a fraction of the frames can be
+corrupted on purpose (wrong tail, or wrong checksum for packed frames) to exercise re-synchronization. Unlike the real device, the sample rate is not
+limited by the baud rate.
+
+Usage from command line (the scan finds the emulator through the ``GLUTENSENS_PORTS`` environment variable)::
+
+    python psoc_emulator.py --rate 1000 --noise 0.5 --drift 0.01 --corrupt 0.001
+"""
+import os
+
+import sys
+
+import tty
+
+import time
+
+import select
+
+import argparse
+
+import threading
+
+import numpy as np
+
+from loguru import logger
+
+import frame_decoder as dec
+
+
+
+############
+#  MACROS  #
+############
+CONN_STRING = b"Gluten $$$\r\n"
+"""
+Connection string sent upon ``c`` command.
+"""
+
+HELP_STRING = (
+    b"Enter c to send connection string.\r\n"
+    b"Enter m to start measurement.\r\n"
+    b"Enter p to start measurement with packed frames.\r\n"
+    b"Enter s to stop measurement.\r\n"
+    b"Enter r to send reset info.\r\n"
+    b"Enter f and the sampling frequency in Hz (2 bytes, MSB first) to set it.\r\n"
+    b"Enter u to send test union data buffer.\r\n"
+    b"Enter h to list commands.\r\n"
+)
+"""
+Help string sent upon ``h`` command.
+"""
+
+TEST_VALUE = -5648.365
+"""
+Value sent in the test union frame, as in the firmware.
+"""
+
+FRAME_DTYPE = np.dtype([
+    ('header', 'u1'),
+    ('integer', '>u4'),
+    ('decimal', '>u2'),
+    ('tail', 'u1'),
+])
+"""
+Layout of a resistance frame.
+"""
+
+MAX_FRAMES = 4096
+"""
+Maximum number of frames generated at once.
+"""
+
+PACKED_SAMPLES = 10
+"""
+Number of samples of each packed frame, as in the firmware.
+"""
+
+TIMER_RATE = 2000
+"""
+Rate, in Hz, of the firmware timer: the sample rates set with ``f`` are integer fractions of it.
+"""
+
+
+
+############
+# EMULATOR #
+############
+class PsocEmulator:
+    """
+    Class that emulates the target device on a pseudo-terminal.
+    """
+    def __init__(self, sample_rate=10, baseline=1000.0, noise=0.0, drift=0.0, corrupt_rate=0.0, seed=None):
+        """
+        Init a device emulator.
+
+        :param sample_rate: Sample rate of resistance measurements, in Hz.
+        :type sample_rate: float
+        :param baseline: Resistance at the start of the measurement, in Ohm.
+        :type baseline: float
+        :param noise: Standard deviation of the gaussian noise, in Ohm.
+        :type noise: float
+        :param drift: Linear drift of the resistance, in Ohm/s.
+        :type drift: float
+        :param corrupt_rate: Fraction of frames sent with a wrong tail byte.
+        :type corrupt_rate: float
+        :param seed: Seed of the random number generator.
+        :type seed: int
+        """
+        self.sample_rate = sample_rate
+        self.baseline = baseline
+        self.noise = noise
+        self.drift = drift
+        self.corrupt_rate = corrupt_rate
+        self.rng = np.random.default_rng(seed)
+        self.is_streaming = False
+        self.is_packed = False
+        self.sequence = 0
+        self.argument = None
+        self.is_killed = False
+        self.stream_start = 0
+        self.n_streamed = 0
+        self.n_sent = 0
+        self.n_corrupted = 0
+        self.master = None
+        self.slave = None
+        self.port_name = None
+        self.thread = None
+
+
+    def start(self):
+        """
+        This method opens the pseudo-terminal and starts the emulator thread.
+
+        :returns: Name of the port to be opened by the application.
+        :rtype: str
+        """
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.master)
+        tty.setraw(self.slave)
+        os.set_blocking(self.master, False)
+        self.port_name = os.ttyname(self.slave)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        logger.info("PSoC emulator listening on {}.".format(self.port_name))
+        return self.port_name
+
+
+    def stop(self):
+        """
+        This method stops the emulator thread and closes the pseudo-terminal.
+        """
+        self.is_killed = True
+        if self.thread is not None:
+            self.thread.join()
+        os.close(self.master)
+        os.close(self.slave)
+
+
+    def run(self):
+        """
+        This method, executed by the emulator thread, serves commands and streams frames when due.
+        """
+        while not self.is_killed:
+            timeout = 0.1
+            if self.is_streaming:
+                # Wake up when the next sample is due
+                next_due = self.stream_start + (self.n_streamed + 1)/self.sample_rate
+                timeout = min(max(next_due - time.monotonic(), 0), timeout)
+            readable, _, _ = select.select([self.master], [], [], timeout)
+            try:
+                if readable:
+                    for command in os.read(self.master, 1024):
+                        if self.argument is not None:
+                            self.handle_argument(command)
+                        else:
+                            self.handle_command(chr(command))
+                if self.is_streaming:
+                    self.stream()
+            except OSError:
+                break
+
+
+    def handle_command(self, command):
+        """
+        This method executes a command received from the application.
+
+        :param command: Command character.
+        :type command: str
+        """
+        if command == 'c':
+            self.write(CONN_STRING)
+        elif command == 'r':
+            self.send_reset()
+        elif command in ('m', 'p'):
+            self.is_streaming = True
+            self.is_packed = command == 'p'
+            self.sequence = 0
+            self.stream_start = time.monotonic()
+            self.n_streamed = 0
+        elif command == 'f':
+            self.stop_streaming()
+            self.argument = bytearray()
+        elif command == 's':
+            self.stop_streaming()
+        elif command == 'u':
+            self.write(bytes([dec.HEADER_TEST]) + np.float32(TEST_VALUE).astype('<f4').tobytes() + bytes([dec.TAIL_TEST]))
+        elif command == 'h':
+            self.write(HELP_STRING)
+        # As the firmware, any other character is ignored
+
+
+    def handle_argument(self, byte):
+        """
+        This method receives a byte of the argument of the ``f`` command, and sets the sample rate once complete.
+
+        :param byte: Byte received.
+        :type byte: int
+        """
+        self.argument.append(byte)
+        if len(self.argument) < 2:
+            return
+        rate = min(max(int.from_bytes(self.argument, 'big'), 1), TIMER_RATE)
+        self.argument = None
+        # Closest rate the firmware timer can provide
+        self.sample_rate = TIMER_RATE/((TIMER_RATE + rate//2)//rate)
+        self.send_reset()
+
+
+    def send_reset(self):
+        """
+        This method sends the reset info: the sample rate in a byte if it is an integer up to 255 Hz, in mHz otherwise.
+        """
+        rate_mhz = int(round(self.sample_rate*1000))
+        if rate_mhz % 1000 == 0 and rate_mhz <= 255000:
+            self.write(bytes([dec.HEADER_RESET, rate_mhz//1000, dec.TAIL_RESET]))
+        else:
+            self.write(bytes([dec.HEADER_RESET_EXT]) + rate_mhz.to_bytes(4, 'big') + bytes([dec.TAIL_RESET]))
+
+
+    def stop_streaming(self):
+        """
+        This method stops streaming. As the firmware, samples already taken but not sent yet make a last packed frame.
+        """
+        if self.is_streaming and self.is_packed:
+            self.stream(final=True)
+        self.is_streaming = False
+
+
+    def write(self, data):
+        """
+        This method sends data to the application. It waits while the application does not read,
+        as the firmware does when its UART buffer is full, but returns as soon as the emulator is stopped.
+
+        :param data: Data to be sent.
+        :type data: bytes
+        """
+        data = memoryview(data)
+        while data and not self.is_killed:
+            try:
+                data = data[os.write(self.master, data):]
+            except BlockingIOError:
+                select.select([], [self.master], [], 0.1)
+
+
+    def stream(self, final=False):
+        """
+        This method sends all the resistance frames due since the previous call.
+        In packed mode, only full frames are sent, unless ``final``.
+
+        :param final: Whether the streaming is being stopped.
+        :type final: bool
+        """
+        n_due = int((time.monotonic() - self.stream_start)*self.sample_rate) - self.n_streamed
+        n_due = min(n_due, MAX_FRAMES)
+        if self.is_packed and not final:
+            n_due -= n_due % PACKED_SAMPLES
+        if n_due <= 0:
+            return
+        t = (self.n_streamed + np.arange(n_due))/self.sample_rate
+        resistance = self.baseline + self.drift*t
+        if self.noise:
+            resistance = resistance + self.rng.normal(0, self.noise, n_due)
+        resistance = np.clip(resistance, 0, 0xFFFFFFFF)
+        if self.is_packed:
+            self.write(self.packed_frames(resistance))
+            self.n_streamed += n_due
+            self.n_sent += n_due
+            return
+        frames = np.empty(n_due, dtype=FRAME_DTYPE)
+        frames['header'] = dec.HEADER_PSOC_R_MEAS
+        frames['integer'] = resistance.astype(np.uint32)
+        frames['decimal'] = (resistance*1000).astype(np.uint64) % 1000
+        frames['tail'] = dec.TAIL_MEAS_PACKETS
+        if self.corrupt_rate:
+            corrupted = self.rng.random(n_due) < self.corrupt_rate
+            frames['tail'][corrupted] = 0x00
+            self.n_corrupted += int(corrupted.sum())
+        self.write(frames.tobytes())
+        self.n_streamed += n_due
+        self.n_sent += n_due
+
+
+
+    def packed_frames(self, resistance):
+        """
+        This method builds the packed frames of a run of samples, the last one possibly not full.
+
+        :param resistance: Resistance samples, in Ohm.
+        :type resistance: numpy.ndarray
+
+        :returns: Packed frames.
+        :rtype: bytes
+        """
+        data = bytearray()
+        for start in range(0, len(resistance), PACKED_SAMPLES):
+            chunk = resistance[start:start + PACKED_SAMPLES]
+            samples = np.empty(len(chunk), dtype=dec.RES_SAMPLE_DTYPE)
+            samples['integer'] = chunk.astype(np.uint32)
+            samples['decimal'] = (chunk*1000).astype(np.uint64) % 1000
+            frame = bytearray([dec.HEADER_PSOC_R_PACKED]) + self.sequence.to_bytes(2, 'big') + bytes([len(chunk)])
+            frame += samples.tobytes()
+            checksum = sum(frame) & 0xFF
+            if self.corrupt_rate and self.rng.random() < self.corrupt_rate:
+                checksum ^= 0xFF
+                self.n_corrupted += 1
+            frame += bytes([checksum, dec.TAIL_PACKED])
+            data += frame
+            self.sequence = (self.sequence + 1) & dec.SEQUENCE_MASK
+        return bytes(data)
+
+
+
+#############
+#  RUN APP  #
+#############
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Virtual GlutenSens device on a pseudo-terminal.")
+    parser.add_argument('--rate', type=float, default=10, help="sample rate in Hz (default: 10)")
+    parser.add_argument('--baseline', type=float, default=1000.0, help="initial resistance in Ohm (default: 1000)")
+    parser.add_argument('--noise', type=float, default=0.0, help="standard deviation of the noise in Ohm (default: 0)")
+    parser.add_argument('--drift', type=float, default=0.0, help="drift in Ohm/s (default: 0)")
+    parser.add_argument('--corrupt', type=float, default=0.0, help="fraction of corrupted frames (default: 0)")
+    args = parser.parse_args()
+
+    emulator = PsocEmulator(args.rate, args.baseline, args.noise, args.drift, args.corrupt)
+    port_name = emulator.start()
+    print("Emulator running on {}. Start the application with:".format(port_name))
+    print("    GLUTENSENS_PORTS={} python main.py".format(port_name))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        emulator.stop()
+        print("Frames sent: {}, corrupted: {}".format(emulator.n_sent, emulator.n_corrupted))
+        sys.exit(0)
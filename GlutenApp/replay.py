@@ -0,0 +1,222 @@
+import time
+
+import numpy as np
+
+from loguru import logger
+
+from PyQt5.QtCore import pyqtSlot
+
+import serial_workers as wrk
+import frame_decoder as dec
+import session_file
+
+
+
+############
+#  MACROS  #
+############
+MAX_SPEED = 0
+"""
+Replay speed meaning *as fast as possible*.
+"""
+
+REPLAY_PORT_NAME = "replay"
+"""
+Port name reported by a :py:class:`ReplayWorker` in its status signals.
+"""
+
+FRAME_SIZE = dec.FRAMES[dec.HEADER_PSOC_R_MEAS][1]
+"""
+Size, in bytes, of a resistance frame of a raw capture. Packed frames take less per sample: chunks of
+this size per sample hold at least as many samples as requested.
+"""
+
+
+
+#################
+# REPLAY_WORKER #
+#################
+class ReplayWorker(wrk.ReadWorker):
+    """
+    Class that replays a recorded session through the same decoding and display path of a
+    :py:class:`serial_workers.ReadWorker`, without any device connected.
+
+    Two kinds of recordings are supported:
+
+    * raw byte captures recorded by a :py:class:`serial_workers.ReadWorker` (``capture_path``),
+      which are decoded by the :py:class:`frame_decoder.FrameDecoder` exactly as live data;
+    * binary session files (see :py:mod:`session_file`), whose samples are sent in batches.
+
+    The worker emulates the target device: it sends the reset info upon start, streams data
+    only after :py:data:`serial_reader.PSOC_RES_CMD` (or :py:data:`serial_reader.PACKED_STREAM_CMD`) is sent and pauses upon
+    :py:data:`serial_reader.STOP_STREAM_CMD`. Data are paced at ``speed`` times the sample rate
+    (:py:data:`MAX_SPEED` to replay as fast as possible). Samples are timestamped as they were
+    recorded, whatever the replay speed: with the recorded timestamps of a session file or, if the
+    recording has none, as if each one was received one sample period after the previous one.
+    """
+    def __init__(self, path, speed=1):
+        """
+        Init a replay worker.
+
+        :param path: Path of the raw capture or session file to be replayed.
+        :type path: str
+        :param speed: Replay speed, as a multiple of the sample rate (:py:data:`MAX_SPEED` for no pacing).
+        :type speed: float
+        """
+        super().__init__(REPLAY_PORT_NAME)
+        self.path = path
+        self.speed = speed
+        self.is_playing = False
+        self.play_start = time.monotonic()
+        self.n_played = 0
+        self.position = 0
+        self.n_decoded = 0
+        self.source = None
+        self.timestamps = None
+        self.session = None
+        self.sample_rate = wrk.PSOC_RES_SAMPLE_RATE
+        self.start_ns = time.monotonic_ns()
+
+
+    @pyqtSlot()
+    def run(self):
+        """
+        This method loads the recording and replays it until the end or until ``is_streaming`` is set to ``False``.
+        """
+        logger.trace("Replay thread initiated.")
+        try:
+            self.load()
+        except (OSError, ValueError):
+            self.signals.status.emit(self.port_name, 0)
+            logger.exception("Cannot replay {}.".format(self.path))
+            return
+        self.signals.status.emit(self.port_name, 1)
+        logger.info("Replaying {} at {}.".format(
+            self.path, "max speed" if self.speed == MAX_SPEED else "{}x".format(self.speed)))
+        self.send_reset()
+
+        while(self.is_streaming):
+            if not self.is_playing:
+                time.sleep(wrk.READ_TIMEOUT)
+                continue
+            n_samples = self.play_tick()
+            if n_samples is None:
+                self.flush()
+                self.is_playing = False
+                logger.info("Replay of {} completed.".format(self.path))
+                continue
+            self.n_played += n_samples
+            if self.speed != MAX_SPEED:
+                # Wait until the replayed samples are due
+                due = self.n_played/(self.state.sample_rate*self.speed)
+                delay = self.play_start + due - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            if time.monotonic() - self.last_flush >= 1/wrk.FLUSH_RATE:
+                self.flush()
+
+        self.flush()
+        logger.info("Replay of {} stopped.".format(self.path))
+
+
+    def load(self):
+        """
+        This method opens the recording, detecting whether it is a session file or a raw capture.
+        """
+        try:
+            header, samples = session_file.open_session(self.path)
+            self.session = header
+            self.source = samples['resistance'] if header['timestamps'] else samples
+            self.timestamps = samples['timestamp'] if header['timestamps'] else None
+            self.sample_rate = header['sample_rate']
+        except ValueError:
+            # Not a session file: raw capture
+            with open(self.path, 'rb') as file:
+                self.source = file.read()
+            # Sample rate from the first reset info recorded
+            for packet_type, value in dec.FrameDecoder().feed(self.source[:4096]):
+                if packet_type == dec.RESET_PACKET:
+                    self.sample_rate = value
+                    break
+
+
+    def send_reset(self):
+        """
+        This method emulates the reset info sent by the device upon connection, and rewinds the recording.
+        """
+        self.position = 0
+        self.n_decoded = 0
+        self.start_ns = time.monotonic_ns()
+        self.decoder.reset()
+        wrk.SerialReader.handle_frame(self, dec.RESET_PACKET, self.sample_rate)
+
+
+    def play_tick(self):
+        """
+        This method replays the data due in one flush period (or a full batch at max speed).
+
+        :returns: Number of resistance samples replayed, ``None`` at the end of the recording.
+        :rtype: int
+        """
+        if self.speed == MAX_SPEED:
+            n_samples = wrk.BATCH_SIZE
+        else:
+            n_samples = max(int(self.state.sample_rate*self.speed/wrk.FLUSH_RATE), 1)
+        if self.position >= len(self.source):
+            return None
+        if self.session is not None:
+            chunk = self.source[self.position:self.position + n_samples]
+            if self.timestamps is not None:
+                timestamps = self.timestamps[self.position:self.position + len(chunk)].astype(np.int64)
+            else:
+                timestamps = (np.arange(self.position, self.position + len(chunk))*1e9/self.sample_rate).astype(np.int64)
+            self.position += len(chunk)
+            self.batch.add_run(chunk, timestamps + self.start_ns)
+            if len(self.batch) >= wrk.BATCH_SIZE:
+                self.flush()
+            return len(chunk)
+        # Raw capture: go through the frame decoder, as live data, received at the recorded sample rate
+        chunk = self.source[self.position:self.position + n_samples*FRAME_SIZE]
+        self.position += len(chunk)
+        frames = self.decoder.feed_batches(chunk)
+        # Arrival time from the samples decoded so far: the bytes per sample depend on the frames
+        self.n_decoded += dec.count_samples(frames)
+        return self.handle_frames(frames, self.start_ns + int(self.n_decoded*1e9/self.state.sample_rate))
+
+
+    def handle_frame(self, packet_type, value):
+        """
+        This method handles a frame decoded from a raw capture. See :py:meth:`serial_reader.SerialReader.handle_frame`.
+
+        :param packet_type: Type of the decoded frame.
+        :type packet_type: str
+        :param value: Decoded value.
+        :type value: float or int
+        """
+        if packet_type == dec.RESET_PACKET:
+            # Recorded resets only update the sample rate: the replay goes on
+            self.state.sample_rate = value
+            return
+        super().handle_frame(packet_type, value)
+
+
+    def send(self, char):
+        """
+        This method emulates the commands of the target device: start, stop and reset.
+
+        :param char: Command.
+        :type char: char
+        """
+        if char in (wrk.PSOC_RES_CMD, wrk.PACKED_STREAM_CMD):
+            self.play_start = time.monotonic()
+            self.n_played = 0
+            self.is_playing = True
+            logger.debug("Replay started.")
+        elif char == wrk.STOP_STREAM_CMD:
+            self.is_playing = False
+            logger.debug("Replay paused.")
+        elif char == wrk.RESET_CMD:
+            self.is_playing = False
+            self.send_reset()
+        else:
+            logger.debug("Command {} ignored during replay.".format(char))
@@ -0,0 +1,104 @@
+import numpy as np
+
+
+
+###############
+# RING BUFFER #
+###############
+class RingBuffer:
+    """
+    Fixed-capacity circular buffer backed by a preallocated NumPy array.
+
+    Every sample is stored twice, at position ``i`` and ``i + capacity`` of an array
+    twice as long as the capacity. This way the content of the buffer, from the oldest
+    to the newest sample, is always a contiguous slice of the array: :py:meth:`view`
+    returns it without copying, whereas appending costs O(1) per sample.
+    """
+    def __init__(self, capacity, fill=0.0, dtype=np.float64):
+        """
+        Init a ring buffer.
+
+        :param capacity: Number of samples held by the buffer.
+        :type capacity: int
+        :param fill: Initial value of all the samples.
+        :type fill: float
+        :param dtype: Data type of the samples.
+        :type dtype: numpy.dtype
+        """
+        self.capacity = int(capacity)
+        self.data = np.full(2*self.capacity, fill, dtype=dtype)
+        self.head = 0 # position of the oldest sample
+        self.count = 0 # number of samples appended since the last clear
+
+
+    def __len__(self):
+        return self.capacity
+
+
+    def append(self, value):
+        """
+        This method appends a single sample, overwriting the oldest one.
+
+        :param value: Sample to be appended.
+        :type value: float
+        """
+        self.data[self.head] = value
+        self.data[self.head + self.capacity] = value
+        self.head = (self.head + 1) % self.capacity
+        self.count += 1
+
+
+    def extend(self, values):
+        """
+        This method appends a batch of samples, overwriting the oldest ones.
+
+        :param values: Samples to be appended, from the oldest to the newest.
+        :type values: sequence
+        """
+        values = np.asarray(values, dtype=self.data.dtype)
+        n_values = len(values)
+        if n_values == 0:
+            return
+        self.count += n_values
+        capacity = self.capacity
+        if n_values >= capacity:
+            # Only the newest samples fit
+            self.data[:capacity] = values[-capacity:]
+            self.data[capacity:] = values[-capacity:]
+            self.head = 0
+            return
+        start = self.head
+        n_first = min(n_values, capacity - start)
+        n_wrap = n_values - n_first
+        self.data[start:start + n_first] = values[:n_first]
+        self.data[start + capacity:start + capacity + n_first] = values[:n_first]
+        if n_wrap:
+            self.data[:n_wrap] = values[n_first:]
+            self.data[capacity:capacity + n_wrap] = values[n_first:]
+        self.head = (start + n_values) % capacity
+
+
+    def view(self):
+        """
+        This method gives access to the content of the buffer without copying it.
+
+        :returns: Samples from the oldest to the newest.
+        :rtype: numpy.ndarray
+
+        .. note::
+            The returned array is a view on the buffer memory: it must not be modified and
+            its content is only valid until the next append.
+        """
+        return self.data[self.head:self.head + self.capacity]
+
+
+    def clear(self, fill=0.0):
+        """
+        This method sets all the samples to a given value.
+
+        :param fill: Value of all the samples.
+        :type fill: float
+        """
+        self.data.fill(fill)
+        self.head = 0
+        self.count = 0
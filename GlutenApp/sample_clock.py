@@ -0,0 +1,218 @@
+"""
+Timestamping of the samples streamed by a device.
+
+The device does not send any time information: samples are only known to be taken at its sample
+rate, and to have been taken before they are received by the host. :py:class:`SampleClock` turns
+the host arrival times (``time.monotonic_ns()``) into a regular time axis:
+
+* the time of each sample follows the previous one by one sample period, so the jitter of USB
+  transfers and of the reading thread does not show up in the data;
+* a sample is never timestamped after its arrival: the time axis is moved back as soon as a
+  sample arrives earlier than expected;
+* if a sample arrives much later than expected, the samples in between have been lost: the gap is
+  reported and the time axis jumps forward, instead of being silently compressed;
+* the actual sample rate of the device, and hence the drift of its clock with respect to the host one,
+  is estimated from the samples that arrived with the shortest latency over the last
+  :py:data:`ESTIMATE_WINDOW` intervals of :py:data:`ESTIMATE_INTERVAL` seconds.
+"""
+from collections import deque
+
+import numpy as np
+
+from loguru import logger
+
+
+
+##############
+#  SETTINGS  #
+##############
+GAP_TOLERANCE = 0.25
+"""
+Minimum delay, in seconds, of a sample with respect to its expected time, for the samples before it to be considered lost.
+"""
+
+GAP_PERIODS = 3
+"""
+Minimum delay, in sample periods, of a sample with respect to its expected time, for the samples before it to be considered lost.
+"""
+
+ESTIMATE_INTERVAL = 1.0
+"""
+Duration, in seconds, of the intervals over which the sample that arrived with the shortest latency is picked for rate estimation.
+"""
+
+ESTIMATE_WINDOW = 60
+"""
+Number of intervals over which the sample rate is estimated.
+"""
+
+MIN_ESTIMATE_SPAN = 5.0
+"""
+Minimum time, in seconds, spanned by the samples used for rate estimation. The nominal rate is used until then.
+"""
+
+
+
+###########
+#  CLOCK  #
+###########
+class SampleClock:
+    """
+    Class that timestamps the samples of a device and estimates its actual sample rate.
+    """
+    def __init__(self, sample_rate):
+        """
+        Init a sample clock.
+
+        :param sample_rate: Nominal sample rate, in Hz, as reported by the device.
+        :type sample_rate: float
+        """
+        self.reset(sample_rate)
+
+
+    def reset(self, sample_rate):
+        """
+        This method restarts timestamping for a new measurement.
+
+        :param sample_rate: Nominal sample rate, in Hz, as reported by the device.
+        :type sample_rate: float
+        """
+        self.nominal_rate = float(sample_rate)
+        self.rate = float(sample_rate)
+        self.n_lost = 0
+        self.n_gaps = 0
+        self.restart()
+
+
+    def restart(self):
+        """
+        This method restarts the time axis from the next sample, e.g. after the connection has been lost.
+        The sample rate estimated so far is kept.
+        """
+        self.index = 0
+        self.anchor_index = 0
+        self.anchor_ns = None
+        self.last_ns = None
+        self.points = deque(maxlen=ESTIMATE_WINDOW)
+        self.bucket = None
+
+
+    @property
+    def period_ns(self):
+        """
+        Estimated sample period, in ns.
+        """
+        return 1e9/self.rate
+
+
+    @property
+    def drift_ppm(self):
+        """
+        Drift of the device clock with respect to the host clock, in parts per million:
+        positive if the device samples faster than its nominal rate.
+        """
+        return (self.rate/self.nominal_rate - 1)*1e6
+
+
+    def stamp(self, arrival_ns):
+        """
+        This method timestamps the next sample.
+
+        :param arrival_ns: Latest time, in ns, the sample may have been taken at (usually its arrival time).
+        :type arrival_ns: int
+
+        :returns: Timestamp of the sample, in ns, and time of the gap before it (``None`` if no sample has been lost).
+        :rtype: tuple
+        """
+        gap_ns = None
+        if self.anchor_ns is None:
+            self.anchor_ns, self.anchor_index = arrival_ns, self.index
+        timestamp = self.anchor_ns + int((self.index - self.anchor_index)*self.period_ns)
+        if arrival_ns < timestamp:
+            # Taken before being received: move the time axis back
+            self.anchor_ns, self.anchor_index = arrival_ns, self.index
+            timestamp = arrival_ns
+        elif arrival_ns - timestamp > max(GAP_TOLERANCE*1e9, GAP_PERIODS*self.period_ns):
+            # Samples lost: skip their indexes, so that the time axis goes on from the arrival time
+            n_lost = int(round((arrival_ns - timestamp)/self.period_ns))
+            self.n_lost += n_lost
+            self.n_gaps += 1
+            gap_ns = self.last_ns + int(self.period_ns) if self.last_ns is not None else timestamp
+            self.index += n_lost
+            self.anchor_ns, self.anchor_index = arrival_ns, self.index
+            timestamp = arrival_ns
+            logger.debug("About {} samples lost.".format(n_lost))
+        self.update_rate(arrival_ns)
+        self.index += 1
+        self.last_ns = timestamp
+        return timestamp, gap_ns
+
+
+    def stamp_run(self, arrival_ns, n_samples):
+        """
+        This method timestamps consecutive samples received together, each one sample period after the previous one.
+        Since they follow one another on the time axis as they arrived, only the first one may move the axis
+        back or reveal a gap: the result is the same as :py:meth:`stamp` on each sample, except that the
+        estimate of the sample rate is updated once per run.
+
+        :param arrival_ns: Latest time, in ns, the first sample may have been taken at.
+        :type arrival_ns: int
+        :param n_samples: Number of samples, at least one.
+        :type n_samples: int
+
+        :returns: Timestamps of the samples, in ns (*numpy.ndarray* of int64), and time of the gap before them (``None`` if no sample has been lost).
+        :rtype: tuple
+        """
+        first, gap_ns = self.stamp(arrival_ns)
+        # Same time axis as stamp(): anchor plus index times period
+        indexes = np.arange(self.index - 1, self.index - 1 + n_samples) - self.anchor_index
+        timestamps = self.anchor_ns + (indexes*self.period_ns).astype(np.int64)
+        timestamps[0] = first
+        self.index += n_samples - 1
+        self.last_ns = int(timestamps[-1])
+        return timestamps, gap_ns
+
+
+    def skip(self, n_samples):
+        """
+        This method skips the indexes of samples known to be lost (e.g. from the sequence numbers of packed frames),
+        so that the time axis goes on from the next sample as if they had been received.
+
+        :param n_samples: Number of samples lost.
+        :type n_samples: int
+
+        :returns: Time of the gap, in ns, ``None`` if no sample has been timestamped yet.
+        :rtype: int
+        """
+        self.n_lost += n_samples
+        self.n_gaps += 1
+        self.index += n_samples
+        logger.debug("{} samples lost.".format(n_samples))
+        return self.last_ns + int(self.period_ns) if self.last_ns is not None else None
+
+
+    def update_rate(self, arrival_ns):
+        """
+        This method updates the estimate of the sample rate with the arrival time of the current sample.
+
+        :param arrival_ns: Latest time, in ns, the current sample may have been taken at.
+        :type arrival_ns: int
+        """
+        # Shortest latency: smallest arrival time with respect to a regular time axis
+        offset = arrival_ns - self.index*1e9/self.nominal_rate
+        if self.bucket is not None and arrival_ns - self.bucket[3] < ESTIMATE_INTERVAL*1e9:
+            if offset < self.bucket[0]:
+                self.bucket = (offset, self.index, arrival_ns, self.bucket[3])
+            return
+        if self.bucket is not None:
+            self.points.append(self.bucket[1:3])
+        self.bucket = (offset, self.index, arrival_ns, arrival_ns)
+        if len(self.points) < 2:
+            return
+        (first_index, first_ns), (last_index, last_ns) = self.points[0], self.points[-1]
+        if last_ns - first_ns < MIN_ESTIMATE_SPAN*1e9 or last_index <= first_index:
+            return
+        # Keep the time axis continuous while changing its slope
+        self.anchor_ns += int((self.index - self.anchor_index)*self.period_ns)
+        self.anchor_index = self.index
+        self.rate = (last_index - first_index)*1e9/(last_ns - first_ns)
@@ -0,0 +1,644 @@
+"""
+Acquisition from the target device, independent of the GUI.
+
+:py:class:`SerialReader` opens the port, decodes the frames (see :py:mod:`frame_decoder`) and
+notifies data and status through callbacks; it also reconnects automatically when the connection
+is lost. It is run by :py:class:`serial_workers.ReadWorker` in the GUI and by :py:mod:`acquire` from
+command line, without importing PyQt5. Resistance samples are notified in :py:class:`SampleBatch` objects,
+which carry the timestamp of each sample (see :py:mod:`sample_clock`) and, if the device has a
+:py:class:`dsp.DspStage`, the processed signals computed from them. Samples are corrected by the
+:py:class:`calibration.Calibration` of the device, if any, before being notified.
+
+The sample rate can be set at runtime (see :py:meth:`SerialReader.set_sample_rate`). For rates in the kHz range,
+the measurement is streamed in packed frames (see :py:data:`PACKED_STREAM_CMD`), whose sequence numbers reveal
+exactly how many samples have been lost.
+"""
+import time
+import struct
+
+from array import array
+
+import numpy as np
+
+from loguru import logger
+
+import serial
+
+import frame_decoder as dec
+import discovery as disc
+from discovery import BAUDRATE
+from sample_clock import SampleClock
+
+
+
+##############
+#  COMMANDS  #
+##############
+PSOC_RES_CMD = 'm'
+"""
+Command to initiate PSoC resistance measurement.
+"""
+
+PACKED_STREAM_CMD = 'p'
+"""
+Command to initiate PSoC resistance measurement, streamed in packed frames of several samples.
+"""
+
+SAMPLE_RATE_CMD = 'f'
+"""
+Command to set the sample rate, followed by the rate in Hz (uint16, big endian). The device replies with the reset info.
+"""
+
+STOP_STREAM_CMD = 's'
+"""
+Command to stop data streaming.
+"""
+
+RESET_CMD = 'r'
+"""
+Command to retrieve information such as sampling frequency.
+"""
+
+
+
+##############
+#  SETTINGS  #
+##############
+READ_TIMEOUT = 0.1
+"""
+Maximum time, in seconds, a read on the serial port blocks waiting for data.
+Bounds the time the reading thread needs to notice a stop/kill request.
+"""
+
+FLUSH_RATE = 30
+"""
+Rate, in Hz, at which batches of resistance samples are notified (e.g. sent to the GUI).
+"""
+
+BATCH_SIZE = 1024
+"""
+Number of resistance samples that makes a batch full: a full batch is sent regardless of :py:data:`FLUSH_RATE`.
+"""
+
+RECONNECT_DELAY = 0.5
+"""
+Time, in seconds, waited before the first attempt to reconnect after the connection is lost.
+"""
+
+RECONNECT_MAX_DELAY = 8
+"""
+Maximum time, in seconds, between two attempts to reconnect. The delay doubles after each failed attempt.
+"""
+
+
+
+##############
+#   MACROS   #
+##############
+PSOC_RES_SAMPLE_RATE = 10 # hardcoded but also retrieved upon connection to be sure
+"""
+Default PSoC resistance measurement display rate in Hz.
+Hardcoded but also retrieved upon connection to be sure: the actual rate of each device is held by its :py:class:`DeviceState`.
+"""
+
+
+
+################
+# SAMPLE_BATCH #
+################
+class SampleBatch(array):
+    """
+    Batch of resistance samples, as an *array('d')*, with the timestamp of each sample in
+    ``timestamps`` (*array('q')*, host monotonic time in ns, see :py:class:`sample_clock.SampleClock`).
+    A ``NaN`` sample marks a gap in the data. ``outputs`` holds the processed signals, by name, one
+    value per sample (see :py:meth:`dsp.DspStage.process`).
+    """
+    def __new__(cls, values=(), timestamps=()):
+        """
+        Create a batch of samples.
+
+        :param values: Resistance samples.
+        :type values: sequence
+        :param timestamps: Timestamps of the samples, in ns.
+        :type timestamps: sequence
+        """
+        batch = super().__new__(cls, 'd', values)
+        batch.timestamps = array('q', timestamps)
+        batch.outputs = {}
+        return batch
+
+
+    def add_run(self, values, timestamps):
+        """
+        This method appends consecutive samples with their timestamps, with no Python object per sample.
+
+        :param values: Resistance samples.
+        :type values: numpy.ndarray
+        :param timestamps: Timestamps of the samples, in ns.
+        :type timestamps: numpy.ndarray
+        """
+        self.frombytes(np.asarray(values, dtype=np.float64).tobytes())
+        self.timestamps.frombytes(np.asarray(timestamps, dtype=np.int64).tobytes())
+
+
+    def add(self, value, timestamp):
+        """
+        This method appends a sample with its timestamp.
+
+        :param value: Resistance sample.
+        :type value: float
+        :param timestamp: Timestamp of the sample, in ns.
+        :type timestamp: int
+        """
+        self.append(value)
+        self.timestamps.append(timestamp)
+
+
+
+################
+# DEVICE_STATE #
+################
+class DeviceState:
+    """
+    Class that holds the state of a connected device, so that several devices can be acquired at the same time.
+    """
+    def __init__(self, port_name, label=None, sample_rate=PSOC_RES_SAMPLE_RATE):
+        """
+        Init a device state.
+
+        :param port_name: Name of the port the device is connected to.
+        :type port_name: str
+        :param label: Name of the device shown to the user. Defaults to the port name.
+        :type label: str
+        :param sample_rate: Sample rate of resistance measurements, in Hz, until retrieved from the device.
+        :type sample_rate: int
+
+        The ``clock`` timestamps the samples and estimates the actual sample rate of the device.
+        The ``dsp`` stage, if any (see :py:mod:`dsp`), processes the samples before they are notified.
+        The ``detector``, if any (see :py:mod:`detection`), decides from the samples whether the food sample contains gluten.
+        The ``calibration``, if any (see :py:mod:`calibration`), corrects the samples of the sensor in use.
+        """
+        self.port_name = port_name
+        self.label = label if label is not None else port_name
+        self.sample_rate = sample_rate
+        self.clock = SampleClock(sample_rate)
+        self.dsp = None
+        self.detector = None
+        self.calibration = None
+        self.writer = None
+
+
+
+###################
+#  SERIAL_READER  #
+###################
+class SerialReader:
+    """
+    Main class for serial reading tasks, independent of the GUI: data and status are notified
+    through the ``on_data`` and ``on_status`` callbacks, called by the reading thread.
+
+    If the connection is lost while streaming (e.g. a USB glitch), the worker supervises its
+    recovery: it marks the gap in the data with a :py:data:`frame_decoder.GAP_PACKET`, tries to
+    reconnect with increasing delays (looking for the device on other ports too, in case the OS
+    enumerated it again under a different name) and, once reconnected, resumes the measurement
+    that was running, without notifying the reset info requested to the device.
+    """
+    def __init__(self, serial_port_name, capture_path=None, reconnect=True, state=None, on_data=None, on_status=None):
+        """
+        Init a serial reader.
+
+        :param serial_port_name: Name of the port to be read.
+        :type serial_port_name: str
+        :param capture_path: Path of a file where all the raw bytes received are recorded, for later replay (see :py:mod:`replay`).
+        :type capture_path: str
+        :param reconnect: Whether to reconnect automatically when the connection is lost.
+        :type reconnect: bool
+        :param state: State of the device. A new one is created if not given.
+        :type state: DeviceState
+        :param on_data: Function called with the type of data *(str)* and the actual data received *(sequence)*:
+            resistance samples come in batches (:py:class:`SampleBatch`).
+        :type on_data: callable
+        :param on_status: Function called with the name of the port being used *(str)* and the status *(int)* of its connection
+            (0 - error during opening, 1 - success, 2 - reading error, 3 - connection lost and reconnecting, 4 - connection restored).
+        :type on_status: callable
+        """
+        self.is_streaming = False
+        self.is_killed = False
+        self.is_measuring = False
+        self.is_resuming = False
+        self.stream_cmd = PSOC_RES_CMD
+        self.requested_rate = None
+        self.sequence = None
+        self.reconnect_enabled = reconnect
+        self.on_data = on_data if on_data is not None else lambda packet_type, data: None
+        self.on_status = on_status if on_status is not None else lambda port_name, status: None
+        self.decoder = dec.FrameDecoder()
+        self.batch = SampleBatch()
+        self.last_flush = time.monotonic()
+        self.port = serial.Serial()
+        self.port_name = serial_port_name
+        self.state = state if state is not None else DeviceState(serial_port_name)
+        self.capture_path = capture_path
+        self.capture = None
+
+
+    def read(self):
+        """
+        This method estabilishes a connection with desired serial port and collects incoming data,
+        until ``is_streaming`` is set to ``False``.
+
+        .. note::
+            Reads block on the port for at most :py:data:`READ_TIMEOUT` seconds, so the thread
+            does not consume CPU while the device is idle and still reacts quickly when
+            ``is_streaming`` is set to ``False``.
+        """
+        try:
+            self.port = serial.Serial(port=self.port_name, baudrate=BAUDRATE,
+                                    write_timeout=0, timeout=READ_TIMEOUT)
+            if self.port.is_open:
+                self.on_status(self.port_name, 1)
+                logger.info("Succesfully connected to port {}.".format(self.port_name))
+                self.port.write(self.info_request())
+                if self.capture_path is not None:
+                    self.capture = open(self.capture_path, 'wb')
+                    logger.info("Recording raw data into {}.".format(self.capture_path))
+        except serial.SerialException:
+            self.on_status(self.port_name, 0)
+            logger.exception("Error during setup of port {}.".format(self.port_name))
+            self.is_streaming = False
+
+        while(self.is_streaming):
+            try:
+                # Sleep until at least one byte arrives (or READ_TIMEOUT expires),
+                # then read everything available at once and decode all the complete frames
+                chunk = self.port.read(1)
+                if chunk:
+                    chunk += self.port.read(self.port.in_waiting)
+                self.process(chunk)
+            except serial.SerialException:
+                if self.reconnect_enabled and self.is_streaming:
+                    logger.warning("Connection with port {} lost.".format(self.port_name))
+                    if self.reconnect():
+                        continue
+                self.on_status(self.port_name, 2)
+                logger.exception("Cannot communicate with port {}. Please check the connection and try again.".format(self.port_name))
+                self.is_streaming = False
+
+        self.flush()
+        if self.capture is not None:
+            self.capture.close()
+            self.capture = None
+        if self.is_killed:
+                self.port.close()
+                logger.info("Serial port {} closed.".format(self.port_name))
+                return
+
+
+    def reconnect(self):
+        """
+        This method restores the connection with target device after it has been lost.
+
+        The gap is marked in the data, then reconnection is attempted with delays doubling
+        from :py:data:`RECONNECT_DELAY` up to :py:data:`RECONNECT_MAX_DELAY`, until it succeeds or
+        ``is_streaming`` is set to ``False``. Upon reconnection, the reset info is requested to
+        update the sample rate and the measurement is resumed if it was running.
+
+        :returns: ``True`` if the connection has been restored.
+        :rtype: bool
+        """
+        self.mark_gap()
+        self.port.close()
+        delay = RECONNECT_DELAY
+        while self.is_streaming:
+            deadline = time.monotonic() + delay
+            while self.is_streaming and time.monotonic() < deadline:
+                time.sleep(READ_TIMEOUT)
+            if not self.is_streaming:
+                break
+            port_name = self.find_device()
+            if port_name is not None:
+                try:
+                    self.port = serial.Serial(port=port_name, baudrate=BAUDRATE,
+                                              write_timeout=0, timeout=READ_TIMEOUT)
+                    self.resume(port_name)
+                    return True
+                except serial.SerialException:
+                    self.port.close()
+                    logger.debug("Reconnection to port {} failed.".format(port_name))
+            delay = min(2*delay, RECONNECT_MAX_DELAY)
+        return False
+
+
+    def process(self, chunk):
+        """
+        This method records and decodes a chunk of bytes received, and notifies the pending batch
+        when :py:data:`FLUSH_RATE` requires it or when no byte has been received.
+
+        :param chunk: Bytes received, empty if the read timed out.
+        :type chunk: bytes
+        """
+        if chunk:
+            if self.capture is not None:
+                self.capture.write(chunk)
+            self.decode(chunk, time.monotonic_ns())
+        if (self.batch and
+            (not chunk or time.monotonic() - self.last_flush >= 1/FLUSH_RATE)):
+            self.flush()
+
+
+    def decode(self, chunk, arrival_ns):
+        """
+        This method decodes a chunk of bytes and handles its frames (see :py:meth:`handle_frames`).
+
+        :param chunk: Bytes received.
+        :type chunk: bytes
+        :param arrival_ns: Time the chunk has been received at, in ns.
+        :type arrival_ns: int
+
+        :returns: Number of resistance samples decoded.
+        :rtype: int
+        """
+        # Consecutive resistance frames are decoded at once
+        return self.handle_frames(self.decoder.feed_batches(chunk), arrival_ns)
+
+
+    def handle_frames(self, frames, arrival_ns):
+        """
+        This method handles the frames decoded from a chunk of bytes. Resistance samples are timestamped
+        knowing that the last one has been taken before ``arrival_ns``, and each of the others one
+        sample period before the next.
+
+        :param frames: Frames, as returned by :py:meth:`frame_decoder.FrameDecoder.feed_batches`.
+        :type frames: list
+        :param arrival_ns: Time the chunk has been received at, in ns.
+        :type arrival_ns: int
+
+        :returns: Number of resistance samples handled.
+        :rtype: int
+        """
+        n_samples = dec.count_samples(frames)
+        n_left = n_samples
+        for packet_type, value in frames:
+            if packet_type == dec.PSOC_PACKED_PACKET:
+                sequence, value = value
+                self.check_sequence(sequence, len(value))
+                packet_type = dec.PSOC_RES_PACKET
+            if packet_type == dec.PSOC_RES_PACKET:
+                n_left -= len(value)
+                self.handle_samples(value, arrival_ns - int((n_left + len(value) - 1)*self.state.clock.period_ns))
+            else:
+                self.handle_frame(packet_type, value)
+        return n_samples
+
+
+    def mark_gap(self):
+        """
+        This method marks a gap in the data after the connection has been lost, and notifies that the reader is reconnecting.
+        """
+        self.flush()
+        self.on_data(dec.GAP_PACKET, self.filter_batch(SampleBatch([float('nan')], [time.monotonic_ns()])))
+        self.on_status(self.port_name, 3)
+        self.decoder.reset()
+        self.state.clock.restart()
+        self.sequence = None
+
+
+    def resume(self, port_name):
+        """
+        This method resumes the acquisition once the port has been opened again: the reset info is requested
+        to update the sample rate and the measurement is restarted if it was running.
+
+        :param port_name: Name of the port, which may differ from the one the connection was lost on.
+        :type port_name: str
+        """
+        self.port_name = port_name
+        self.state.port_name = port_name
+        self.is_resuming = True
+        self.port.write(self.info_request())
+        if self.is_measuring:
+            self.port.write(self.stream_cmd.encode('utf-8'))
+        self.on_status(self.port_name, 4)
+        logger.success("Connection with target device restored on port {}.".format(self.port_name))
+
+
+    def stop(self):
+        """
+        This method stops the reading and closes the port.
+        """
+        self.is_streaming = False
+        self.is_killed = True
+
+
+    def find_device(self):
+        """
+        This method finds the port target device is connected to after the connection has been lost.
+
+        :returns: Name of the port, ``None`` if the device is not connected.
+        :rtype: str
+        """
+        fingerprint = disc.load_fingerprint()
+        if disc.probe_port(self.port_name):
+            return self.port_name
+        return disc.discover_device(disc.candidate_ports(fingerprint))
+
+
+    def info_request(self):
+        """
+        This method builds the request of the reset info: the sample rate command, if a rate has been
+        requested with :py:meth:`set_sample_rate` (the device replies with the reset info), the reset command otherwise.
+
+        :returns: Bytes to be sent.
+        :rtype: bytes
+        """
+        if self.requested_rate is None:
+            return RESET_CMD.encode('utf-8')
+        return SAMPLE_RATE_CMD.encode('utf-8') + struct.pack('>H', self.requested_rate)
+
+
+    def set_sample_rate(self, sample_rate):
+        """
+        This method sets the sample rate of the device, which stops the measurement and replies with the
+        reset info of the rate actually set. The rate is set again upon reconnection.
+
+        :param sample_rate: Sample rate, in Hz.
+        :type sample_rate: int
+        """
+        self.requested_rate = min(max(int(sample_rate), 1), 0xFFFF)
+        self.is_measuring = False
+        self.is_resuming = False
+        self.send(self.info_request())
+
+
+    def send(self, char):
+        """
+        This method sends a single character on serial port.
+
+        :param char: Character to be sent, or a command already encoded, with its arguments.
+        :type char: char or bytes
+        """
+        # Remember whether the measurement has to be resumed upon reconnection
+        if char in (PSOC_RES_CMD, PACKED_STREAM_CMD):
+            self.is_measuring = True
+            self.stream_cmd = char
+            self.sequence = None
+            # The time axis starts again: the pause is not a gap
+            self.state.clock.restart()
+        elif char in (STOP_STREAM_CMD, RESET_CMD):
+            self.is_measuring = False
+            self.is_resuming = False
+        try:
+            self.port.write(char if isinstance(char, bytes) else char.encode('utf-8'))
+            logger.debug("Written {} on port {}.".format(char, self.port_name))
+        except:
+            logger.exception("Could not write {} on port {}.".format(char, self.port_name))
+
+
+    def handle_samples(self, values, arrival_ns):
+        """
+        This method handles consecutive resistance samples decoded by :py:meth:`frame_decoder.FrameDecoder.feed_batches`.
+
+        :param values: Resistance samples.
+        :type values: numpy.ndarray
+        :param arrival_ns: Latest time, in ns, the first sample may have been taken at.
+        :type arrival_ns: int
+        """
+        timestamps, gap_ns = self.state.clock.stamp_run(arrival_ns, len(values))
+        if gap_ns is not None:
+            # Samples lost: interrupt the data instead of compressing time
+            self.batch.add(float('nan'), gap_ns)
+        self.batch.add_run(values, timestamps)
+        if len(self.batch) >= BATCH_SIZE:
+            self.flush()
+
+
+    def check_sequence(self, sequence, n_samples):
+        """
+        This method checks the sequence number of a packed frame: if frames have been lost (or discarded
+        because corrupted), their samples are skipped on the time axis and the gap is marked in the data.
+
+        :param sequence: Sequence number of the frame.
+        :type sequence: int
+        :param n_samples: Number of samples of the frame, assumed the same for the lost ones.
+        :type n_samples: int
+        """
+        expected, self.sequence = self.sequence, (sequence + 1) & dec.SEQUENCE_MASK
+        if expected is None or sequence == expected:
+            return
+        n_frames = (sequence - expected) & dec.SEQUENCE_MASK
+        if n_frames > dec.SEQUENCE_MASK//2:
+            # Going backwards: the device restarted the measurement
+            logger.debug("Sequence of packed frames restarted from {}.".format(sequence))
+            return
+        gap_ns = self.state.clock.skip(n_frames*n_samples)
+        if gap_ns is not None:
+            self.batch.add(float('nan'), gap_ns)
+        logger.debug("{} packed frames lost.".format(n_frames))
+
+
+    def handle_frame(self, packet_type, value):
+        """
+        This method handles a frame decoded by the :py:class:`frame_decoder.FrameDecoder`, other than
+        resistance samples (see :py:meth:`handle_samples`).
+
+        :param packet_type: Type of the decoded frame.
+        :type packet_type: str
+        :param value: Decoded value.
+        :type value: float or int
+        """
+        # Keep the order of arrival: pending samples go first
+        self.flush()
+        if packet_type == dec.RESET_PACKET:
+            if value == 0:
+                # Can only be a false match while re-synchronizing on corrupted data
+                logger.warning("Reset info with null sample rate discarded.")
+                return
+            if self.is_resuming:
+                # Requested upon reconnection: the ongoing measurement goes on
+                self.is_resuming = False
+                if value != self.state.sample_rate:
+                    logger.warning("PSoC res sample rate of {} changed from {} to {} Hz upon reconnection.".format(
+                        self.state.label, self.state.sample_rate, value))
+                    self.state.sample_rate = value
+                    self.state.clock.reset(value)
+                    self.reset_dsp()
+                return
+            logger.debug("Device reset.")
+            self.is_measuring = False
+            self.state.sample_rate = value
+            self.state.clock.reset(value)
+            self.reset_dsp()
+            logger.info("PSoC res sample rate of {} changed to {} Hz.".format(self.state.label, self.state.sample_rate))
+            self.on_data(packet_type, [0])
+        elif packet_type == dec.TEST_PACKET:
+            logger.debug("Test.")
+            self.on_data(packet_type, [value])
+
+
+    def flush(self):
+        """
+        This method notifies the pending batch of resistance samples, if any.
+        """
+        if self.batch:
+            self.on_data(dec.PSOC_RES_PACKET, self.filter_batch(self.calibrate(self.batch)))
+            self.batch = SampleBatch()
+        self.last_flush = time.monotonic()
+
+
+    def calibrate(self, batch):
+        """
+        This method corrects a batch in place with the calibration of the device, if any.
+
+        :param batch: Resistance samples.
+        :type batch: SampleBatch
+
+        :returns: The same batch, corrected.
+        :rtype: SampleBatch
+        """
+        # Read once: the calibration may be replaced by the GUI meanwhile
+        calibration = self.state.calibration
+        if calibration is not None:
+            values = np.frombuffer(batch, dtype=np.float64)
+            calibration.apply(values, out=values)
+        return batch
+
+
+    def filter_batch(self, batch):
+        """
+        This method computes the processed signals of a batch with the DSP stage of the device, if any.
+
+        :param batch: Resistance samples.
+        :type batch: SampleBatch
+
+        :returns: The same batch, with its ``outputs``.
+        :rtype: SampleBatch
+        """
+        # Read once: the stage may be replaced by the GUI meanwhile
+        stage = self.state.dsp
+        if stage is not None:
+            batch.outputs = stage.process(batch)
+        return batch
+
+
+    def reset_dsp(self):
+        """
+        This method restarts the DSP stage of the device, if any, for a new measurement.
+        """
+        stage = self.state.dsp
+        if stage is not None:
+            stage.reset(self.state.sample_rate)
+
+
+    def truncate(self, number, digits) -> float:
+        """
+        This method is used to truncate the reconstructed float after 3 decimals.
+        See :py:func:`frame_decoder.truncate`.
+        """
+        return dec.truncate(number, digits)
+
+
+    def get_data(self, data_raw):
+        """
+        This method reconstructs the measured resistance value from the 6 bytes received.
+        See :py:func:`frame_decoder.get_data`.
+        """
+        return dec.get_data(data_raw)
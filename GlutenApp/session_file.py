@@ -0,0 +1,306 @@
+"""
+Binary session format.
+
+A session file is made of a fixed-size header followed by raw, little-endian samples::
+
+    | magic (8 B) | header length (uint32) | JSON header, space padded | samples ... |
+    '------------------------ HEADER_SIZE bytes -----------------------'
+
+The JSON header holds identifier, sample rate, units, start time and the layout of the samples.
+Samples are ``float64`` resistance values, optionally paired with ``uint64`` timestamps (in ns,
+from the first sample): in this case each record holds a resistance value and its timestamp. Records are appended during
+acquisition, and the file can be opened at any time with :py:func:`open_session` as a ``numpy.memmap``
+without parsing. :py:func:`session_to_csv` converts a session file to the ``.csv`` layout of
+:py:mod:`csv_exporter`.
+
+Usage to convert a session file from command line::
+
+    python session_file.py <session file> [<csv file>]
+"""
+import os
+
+import sys
+
+import json
+
+import struct
+
+from datetime import datetime
+
+import numpy as np
+
+from loguru import logger
+
+
+
+############
+#  MACROS  #
+############
+MAGIC = b'GLUTSES\x00'
+"""
+Bytes identifying a session file.
+"""
+
+VERSION = 1
+"""
+Version of the session format.
+"""
+
+HEADER_SIZE = 1024
+"""
+Size, in bytes, of the header. Samples start at this offset.
+"""
+
+SESSION_EXT = '.gsn'
+"""
+Extension of session files.
+"""
+
+FLUSH_SAMPLES = 4096
+"""
+Number of samples written between two flushes of the session file.
+"""
+
+CSV_CHUNK = 65536
+"""
+Number of samples converted at a time by :py:func:`session_to_csv`.
+"""
+
+CSV_COLUMNS = 'Time;Resistance\n'
+"""
+Header row of the ``.csv`` layout: time, in s from the first sample, and resistance, separated by
+semicolons since the decimal separator is a comma.
+"""
+
+
+
+#############
+#  WRITERS  #
+#############
+class SessionWriter:
+    """
+    Class that appends resistance data to a binary session file while the measurement is running.
+    """
+    def __init__(self, path, identifier, sample_rate, timestamps=False, units='Ohm', extra=None):
+        """
+        Init a session writer.
+
+        :param path: Path of the session file to be created.
+        :type path: str
+        :param identifier: Identifier chosen by the user.
+        :type identifier: str
+        :param sample_rate: Sample rate of the data, in Hz.
+        :type sample_rate: int
+        :param timestamps: Whether each sample is stored with its timestamp.
+        :type timestamps: bool
+        :param units: Units of the samples.
+        :type units: str
+        :param extra: Additional information to be stored in the header.
+        :type extra: dict
+        """
+        self.path = path
+        self.timestamps = timestamps
+        self.dtype = record_dtype(timestamps)
+        self.start_ns = None
+        self.n_samples = 0
+        self.n_unflushed = 0
+        self.sample_rate = sample_rate
+        header = {
+            'version': VERSION,
+            'identifier': identifier,
+            'sample_rate': sample_rate,
+            'units': units,
+            'start_time': datetime.now().isoformat(),
+            'timestamps': timestamps,
+        }
+        if extra:
+            header.update(extra)
+        self.file = open(path, 'wb')
+        self.file.write(pack_header(header))
+        self.file.flush()
+
+
+    def write(self, data, timestamps=None):
+        """
+        This method appends a batch of samples.
+
+        :param data: Batch of resistance samples.
+        :type data: sequence
+        :param timestamps: Timestamps of the samples, in ns (e.g. host monotonic time). Stored from the first sample
+            written. If missing, samples are assumed to be evenly spaced at the sample rate.
+        :type timestamps: sequence
+        """
+        if self.timestamps:
+            if timestamps is None:
+                timestamps = (self.start_ns or 0) + ((self.n_samples + np.arange(len(data)))*1e9/self.sample_rate).astype(np.int64)
+            timestamps = np.asarray(timestamps, dtype=np.int64)
+            if self.start_ns is None and len(timestamps):
+                self.start_ns = int(timestamps[0])
+            records = np.empty(len(data), dtype=self.dtype)
+            records['resistance'] = data
+            records['timestamp'] = timestamps - self.start_ns if len(timestamps) else timestamps
+        else:
+            records = np.asarray(data, dtype=self.dtype)
+        self.file.write(records.tobytes())
+        self.n_samples += len(records)
+        self.n_unflushed += len(records)
+        if self.n_unflushed >= FLUSH_SAMPLES:
+            self.file.flush()
+            self.n_unflushed = 0
+
+
+    def close(self):
+        """
+        This method closes the session file.
+        """
+        self.file.close()
+
+
+
+###############
+#  UTILITIES  #
+###############
+def record_dtype(timestamps):
+    """
+    This function returns the data type of the samples of a session file.
+
+    :param timestamps: Whether each sample is stored with its timestamp.
+    :type timestamps: bool
+
+    :returns: Data type of a record.
+    :rtype: numpy.dtype
+    """
+    if timestamps:
+        return np.dtype([('resistance', '<f8'), ('timestamp', '<u8')])
+    return np.dtype('<f8')
+
+
+def csv_rows(times, values):
+    """
+    This function formats samples as rows of the ``.csv`` layout (see :py:data:`CSV_COLUMNS`).
+
+    :param times: Time of each sample, in s.
+    :type times: sequence
+    :param values: Resistance samples.
+    :type values: sequence
+
+    :returns: Formatted rows, with decimal comma.
+    :rtype: str
+    """
+    # Same format as pandas with float_format='%.3f', decimal=','
+    return ''.join(['%.6f;%.3f\n' % row for row in zip(times, values)]).replace('.', ',')
+
+
+def csv_calibration(calibration):
+    """
+    This function formats the header line of a ``.csv`` file recording the calibration applied to the data.
+
+    :param calibration: Description of the calibration (see :py:meth:`calibration.Calibration.describe`).
+    :type calibration: dict
+
+    :returns: Header line.
+    :rtype: str
+    """
+    return '#Calibration: '+json.dumps(calibration)+'\n'
+
+
+def pack_header(header):
+    """
+    This function serializes the header of a session file.
+
+    :param header: Information to be stored in the header.
+    :type header: dict
+
+    :returns: Header of exactly :py:data:`HEADER_SIZE` bytes.
+    :rtype: bytes
+    """
+    body = json.dumps(header).encode('utf-8')
+    prefix = MAGIC + struct.pack('<I', len(body))
+    if len(prefix) + len(body) > HEADER_SIZE:
+        raise ValueError("Session header exceeds {} bytes.".format(HEADER_SIZE))
+    return (prefix + body).ljust(HEADER_SIZE, b' ')
+
+
+def read_header(path):
+    """
+    This function reads the header of a session file.
+
+    :param path: Path of the session file.
+    :type path: str
+
+    :returns: Information stored in the header.
+    :rtype: dict
+    """
+    with open(path, 'rb') as file:
+        prefix = file.read(len(MAGIC) + 4)
+        if len(prefix) < len(MAGIC) + 4 or prefix[:len(MAGIC)] != MAGIC:
+            raise ValueError("{} is not a session file.".format(path))
+        length = struct.unpack('<I', prefix[len(MAGIC):])[0]
+        return json.loads(file.read(length).decode('utf-8'))
+
+
+def open_session(path):
+    """
+    This function opens a session file without loading nor parsing its samples.
+
+    :param path: Path of the session file.
+    :type path: str
+
+    :returns: The header and the samples, as a read-only ``numpy.memmap`` (a structured array with
+        ``resistance`` and ``timestamp`` fields if the file stores timestamps).
+    :rtype: tuple
+    """
+    header = read_header(path)
+    dtype = record_dtype(header['timestamps'])
+    # A sample may be partially written if the acquisition is still running
+    n_samples = (os.path.getsize(path) - HEADER_SIZE) // dtype.itemsize
+    if n_samples <= 0:
+        return header, np.empty(0, dtype=dtype)
+    samples = np.memmap(path, dtype=dtype, mode='r', offset=HEADER_SIZE, shape=(n_samples,))
+    return header, samples
+
+
+def session_to_csv(path, csv_path=None):
+    """
+    This function converts a session file to the ``.csv`` layout of :py:mod:`csv_exporter`.
+
+    :param path: Path of the session file.
+    :type path: str
+    :param csv_path: Path of the ``.csv`` file. Defaults to the session file path with ``.csv`` extension.
+    :type csv_path: str
+
+    :returns: Path of the ``.csv`` file.
+    :rtype: str
+    """
+    if csv_path is None:
+        csv_path = os.path.splitext(path)[0]+'.csv'
+    header, samples = open_session(path)
+    resistance = samples['resistance'] if header['timestamps'] else samples
+    with open(csv_path, 'w', encoding='utf-8') as file:
+        file.write('#Identifier: '+header['identifier']+'\n')
+        file.write('#Sample rate: '+str(header['sample_rate'])+' Hz\n')
+        file.write('#Units: s;'+header['units']+'\n')
+        if header.get('calibration'):
+            file.write(csv_calibration(header['calibration']))
+        file.write('\n')
+        file.write(CSV_COLUMNS)
+        for start in range(0, len(resistance), CSV_CHUNK):
+            chunk = resistance[start:start + CSV_CHUNK]
+            if header['timestamps']:
+                times = samples['timestamp'][start:start + CSV_CHUNK]/1e9
+            else:
+                times = np.arange(start, start + len(chunk))/float(header['sample_rate'])
+            file.write(csv_rows(times.tolist(), chunk.tolist()))
+    logger.info("Session file {} converted into {}".format(path, csv_path))
+    return csv_path
+
+
+
+#############
+#  RUN APP  #
+#############
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("Usage: python session_file.py <session file> [<csv file>]")
+        sys.exit(1)
+    print(session_to_csv(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None))
@@ -3,8 +3,11 @@ from PyQt5.QtWidgets import (
     QPushButton,
     QTabWidget, 
     QVBoxLayout,  
-    QTextEdit
+    QHBoxLayout
 )
+from PyQt5.QtCore import QTimer
+
+import numpy as np
 
 import pyqtgraph as pg
 from pyqtgraph import PlotWidget, plot
@@ -13,6 +16,29 @@ from pyqtgraph.functions import SI_PREFIXES_ASCII
 from loguru import logger
 
 import serial_workers as wrk
+from ring_buffer import RingBuffer
+from output_view import OutputView
+from decimation import MinMaxPyramid, minmax_decimate
+
+
+
+############
+#  MACROS  #
+############
+PLOT_FPS = 30
+"""
+Default target refresh rate of the plots, in frames per second.
+"""
+
+N_SECONDS = 30
+"""
+Default length, in seconds, of the live plot window.
+"""
+
+CURVE_COLORS = ['r', 'b', 'g', 'm', 'c', 'k', 'y', (255, 128, 0)]
+"""
+Colors of the curves of the devices, in the order the devices are connected.
+"""
 
 
 
@@ -22,11 +48,26 @@ import serial_workers as wrk
 class MyTabWidget(QWidget):
     """
     This class holds the tabs shown at the center of the application. The first tab hosts an
-    output window on which numeric data will be printed, whereas the second tab hosts the data plot.
+    output window on which numeric data will be printed (see :py:class:`output_view.OutputView`), whereas the second tab hosts the data plot.
+    The third tab plots the signals processed from the data (see :py:mod:`dsp`), one curve per output of each device.
+
+    .. note::
+        Plots are redrawn by a timer at a target frame rate, not upon data arrival: new data only
+        update the buffers, and the curves whose buffers changed are redrawn at the next tick.
+        Every curve is drawn with about as many points as the plot has pixels: the live window
+        is min/max decimated, whereas the whole session is kept in a :py:class:`decimation.MinMaxPyramid`.
+        Each device connected has its own curve (see :py:meth:`device_line`), with its own sample rate.
+        Samples are drawn at their timestamps (see :py:class:`sample_clock.SampleClock`), so the time
+        axis follows the actual sample rate of the device and gaps in the data are not compressed.
     """
-    def __init__(self):
+    def __init__(self, fps=PLOT_FPS, n_seconds=N_SECONDS):
         """
         Init a tab widget.
+
+        :param fps: Target refresh rate of the plots, in frames per second.
+        :type fps: int
+        :param n_seconds: Length of the live plot window, in seconds.
+        :type n_seconds: int
         """
         super(QWidget, self).__init__()
         self.layout = QVBoxLayout()
@@ -35,15 +76,17 @@ class MyTabWidget(QWidget):
         self.tabs = QTabWidget()
         self.tab1 = QWidget()
         self.tab2 = QWidget()
+        self.tab3 = QWidget()
         self.tabs.resize(300, 200)
   
         # Add tabs
         self.tabs.addTab(self.tab1, "Reading...")
         self.tabs.addTab(self.tab2, "PSoC-R")
+        self.tabs.addTab(self.tab3, "Processed")
 
         # Create first tab
         self.tab1.layout = QVBoxLayout(self)
-        self.output_window = QTextEdit(readOnly=True)
+        self.output_window = OutputView()
         self.tab1.layout.addWidget(self.output_window)
         self.tab1.setLayout(self.tab1.layout)
 
@@ -54,13 +97,27 @@ class MyTabWidget(QWidget):
             text="Clear plot",
         )
         self.clear_plot_btn.clicked.connect(lambda state,plot=self.psoc_r_graph: self.clear_plot(state, plot))
-        self.tab2.layout.addWidget(self.clear_plot_btn)
+        self.full_session_btn = QPushButton(
+            text="Full session",
+            checkable=True,
+            toggled=self.show_full_session
+        )
+        plot_btn_hlay = QHBoxLayout()
+        plot_btn_hlay.addWidget(self.clear_plot_btn)
+        plot_btn_hlay.addWidget(self.full_session_btn)
+        self.tab2.layout.addLayout(plot_btn_hlay)
         self.tab2.layout.addWidget(self.psoc_r_graph)
         self.tab2.setLayout(self.tab2.layout)
 
+        # Create third tab
+        self.tab3.layout = QVBoxLayout(self)
+        self.dsp_graph = PlotWidget()
+        self.tab3.layout.addWidget(self.dsp_graph)
+        self.tab3.setLayout(self.tab3.layout)
+
         # Plot settings
             # Axes
-        self.n_seconds = 30 # Number of seconds to display
+        self.n_seconds = n_seconds # Number of seconds to display
         self.x_psoc_r, self.y_psoc_r = self.define_axes(wrk.PSOC_RES_SAMPLE_RATE)
             # Add grid
         self.psoc_r_graph.showGrid(x=True, y=True)
@@ -74,9 +131,36 @@ class MyTabWidget(QWidget):
         self.psoc_r_graph.setLabel('bottom', 'Time [s]', **styles)
             # Add legend
         self.psoc_r_graph.addLegend()
+            # Processed signals share the time axis of the measurements
+        self.dsp_graph.showGrid(x=True, y=True)
+        self.dsp_graph.setBackground('w')
+        self.dsp_graph.setTitle("Processed resistance measurements")
+        self.dsp_graph.setLabel('left', 'Processed signal', **styles)
+        self.dsp_graph.setLabel('bottom', 'Time [s]', **styles)
+        self.dsp_graph.addLegend()
+        self.dsp_graph.setXLink(self.psoc_r_graph)
 
         # Plot data
-        self.psoc_rLoad_line = self.plot(self.psoc_r_graph, self.x_psoc_r, self.y_psoc_r, 'Load', 'r')
+        self.psoc_rLoad_line = self.plot(self.psoc_r_graph, self.x_psoc_r.view(), self.y_psoc_r.view(), 'Load', 'r')
+
+        # Whole session history of each curve
+        self.psoc_r_history = MinMaxPyramid()
+        self.histories = {self.psoc_rLoad_line: self.psoc_r_history}
+        self.full_session = False
+        self.psoc_r_graph.getViewBox().sigXRangeChanged.connect(self.range_changed)
+
+        # Curves of the devices
+        self.device_lines = {} # curve of each device state
+        self.output_lines = {} # curve of each (device state, output name) of the processed signals
+        self.sample_rates = {self.psoc_rLoad_line: wrk.PSOC_RES_SAMPLE_RATE}
+        self.start_times = {} # timestamp, in ns, of the first sample of each curve
+
+        # Plot refresh
+        self.curves = {} # axes of each curve
+        self.pending_lines = set() # curves to be redrawn
+        self.plot_timer = QTimer(self)
+        self.plot_timer.timeout.connect(self.refresh_plot)
+        self.set_fps(fps)
 
         # Add tabs to widget
         self.layout.addWidget(self.tabs)
@@ -103,28 +187,113 @@ class MyTabWidget(QWidget):
             to re-draw it. 
         """
         pen = pg.mkPen(color=color)
-        line = graph.plot(x, y, name=curve_name, pen=pen)
+        # NaN samples mark gaps in the data: the curve is interrupted there
+        line = graph.plot(x, y, name=curve_name, pen=pen, connect='finite')
         return line
 
   
-    def update_plot(self, data, x_array, y_array, plot_line):
+    def update_plot(self, data, x_array, y_array, plot_line, times=None):
         """
-        This method updates the plot curve with new data received.
+        This method updates the buffers of a plot curve with a batch of new data received.
+        The curve will be redrawn at the next tick of the plot timer.
 
         :param data: New data to update the plot with.
-        :type data: double
-        :param x: Array of data to be shown on x-axis.
-        :type x: double
-        :param y: Array of data to be plotted.
-        :type y: double
+        :type data: sequence
+        :param x_array: Buffer of the time of the data, in seconds.
+        :type x_array: RingBuffer
+        :param y_array: Buffer of data to be plotted.
+        :type y_array: RingBuffer
         :param plot_line: Plot curve that needs to be updated with the new data.
+        :param times: Time of the new data, in seconds. If not given, data follow the previous ones at the sample rate of the curve.
+        :type times: numpy.ndarray
+        """
+        if times is None:
+            sample_rate = float(self.sample_rates.get(plot_line, wrk.PSOC_RES_SAMPLE_RATE))
+            times = x_array.view()[-1] + np.arange(1, len(data) + 1)/sample_rate
+        # Update x and y values
+        x_array.extend(times)
+        y_array.extend(data)
+        history = self.histories.get(plot_line)
+        if history is not None:
+            history.extend(data, times)
+
+        # Schedule the plot update
+        self.curves[plot_line] = (x_array, y_array)
+        self.pending_lines.add(plot_line)
+
+
+    def refresh_plot(self):
         """
-        # Update y values
-        y_array.append(y_array.pop(0))
-        y_array[-1] = data
+        This method redraws the curves updated since the previous call. Nothing is done if no curve changed.
+        """
+        if not self.pending_lines:
+            return
+        for plot_line in self.pending_lines:
+            self.draw(plot_line)
+        self.pending_lines.clear()
+
 
-        # Update plot with new values
-        plot_line.setData(x_array, y_array)
+    def draw(self, plot_line):
+        """
+        This method draws a curve with about one min/max pair of points per pixel.
+
+        The live window is drawn from the ring buffers, with the newest sample at time 0. When the full
+        session is shown, the visible range (or the whole session, if the x axis is auto-ranging) is drawn
+        from the history, with time 0 at the first sample.
+
+        :param plot_line: Plot curve to be drawn.
+        """
+        x_array, y_array = self.curves[plot_line]
+        view_box = plot_line.getViewBox()
+        n_bins = int(view_box.width()) if view_box is not None else 0
+        n_bins = max(n_bins, 100)
+        history = self.histories.get(plot_line)
+        if self.full_session and history is not None:
+            if view_box is None or view_box.autoRangeEnabled()[0]:
+                start, stop = 0, len(history)
+            else:
+                x_min, x_max = view_box.viewRange()[0]
+                start, stop = history.index_of(x_min), history.index_of(x_max) + 2
+            plot_line.setData(*history.query(start, stop, n_bins))
+        else:
+            x = x_array.view()
+            plot_line.setData(*minmax_decimate(x - x[-1], y_array.view(), n_bins))
+
+
+    def show_full_session(self, checked):
+        """
+        This method switches the plot between the live window and the whole session.
+
+        :param checked: State of the ``full_session_btn``.
+        :type checked: bool
+        """
+        self.full_session = checked
+        self.psoc_r_graph.enableAutoRange()
+        self.dsp_graph.enableAutoRange()
+        for plot_line in self.curves:
+            self.pending_lines.add(plot_line)
+
+
+    def range_changed(self):
+        """
+        This method schedules a redraw of the whole session when the user zooms or pans the plot,
+        so that the visible range is drawn at the right level of detail.
+        """
+        if self.full_session and not self.psoc_r_graph.getViewBox().autoRangeEnabled()[0]:
+            for plot_line in self.histories:
+                if plot_line in self.curves:
+                    self.pending_lines.add(plot_line)
+
+
+    def set_fps(self, fps):
+        """
+        This method sets the target refresh rate of the plots.
+
+        :param fps: Target refresh rate, in frames per second.
+        :type fps: int
+        """
+        self.plot_timer.start(int(1000/fps))
+        logger.debug("Plot refresh rate set to {} fps.".format(fps))
 
 
     def clear_plot(self, state, graph):
@@ -137,32 +306,192 @@ class MyTabWidget(QWidget):
         :type graph: PlotWidget
         """
         if graph == self.psoc_r_graph:
-            # Re-define axes
-            self.x_psoc_r, self.y_psoc_r = self.define_axes(wrk.PSOC_RES_SAMPLE_RATE)
-            # Adjust lines
-            self.psoc_rLoad_line.setData(self.x_psoc_r, self.y_psoc_r)
+            for plot_line in self.sample_rates:
+                self.clear_line(plot_line, self.sample_rates[plot_line])
             logger.debug("Plot cleared.")
 
 
+    def clear_line(self, plot_line, sample_rate):
+        """
+        This method clears a curve and adjusts its axes to a given sample rate.
+
+        :param plot_line: Plot curve to be cleared.
+        :param sample_rate: The sample rate of the data of the curve.
+        :type sample_rate: int
+        """
+        # Re-define axes
+        x_array, y_array = self.define_axes(sample_rate)
+        if plot_line == self.psoc_rLoad_line:
+            self.x_psoc_r, self.y_psoc_r = x_array, y_array
+        self.histories[plot_line].clear()
+        self.sample_rates[plot_line] = sample_rate
+        self.start_times.pop(plot_line, None)
+        # Adjust lines
+        self.curves[plot_line] = (x_array, y_array)
+        self.pending_lines.discard(plot_line)
+        self.draw(plot_line)
+
+
+    def device_line(self, state):
+        """
+        This method returns the curve of a device, creating it upon the first call.
+        The first device is drawn on the ``psoc_rLoad_line`` curve.
+
+        :param state: State of the device.
+        :type state: serial_reader.DeviceState
+
+        :returns: The curve of the device.
+        """
+        plot_line = self.device_lines.get(state)
+        if plot_line is not None:
+            return plot_line
+        if self.psoc_rLoad_line not in self.device_lines.values():
+            plot_line = self.psoc_rLoad_line
+        else:
+            color = CURVE_COLORS[len(self.device_lines) % len(CURVE_COLORS)]
+            plot_line = self.add_line(self.psoc_r_graph, state.label, color, state.sample_rate)
+        self.device_lines[state] = plot_line
+        self.clear_line(plot_line, state.sample_rate)
+        return plot_line
+
+
+    def output_line(self, state, name):
+        """
+        This method returns the curve of a processed signal of a device, creating it upon the first call.
+
+        :param state: State of the device.
+        :type state: serial_reader.DeviceState
+        :param name: Name of the output of the DSP stage of the device.
+        :type name: str
+
+        :returns: The curve of the processed signal.
+        """
+        plot_line = self.output_lines.get((state, name))
+        if plot_line is None:
+            color = CURVE_COLORS[len(self.output_lines) % len(CURVE_COLORS)]
+            plot_line = self.add_line(self.dsp_graph, "{} {}".format(state.label, name), color, state.sample_rate)
+            self.output_lines[(state, name)] = plot_line
+            self.clear_line(plot_line, state.sample_rate)
+        return plot_line
+
+
+    def add_line(self, graph, curve_name, color, sample_rate):
+        """
+        This method adds a curve, with its own buffers and history, to a graph.
+
+        :param graph: Plot on which the curve is drawn.
+        :type graph: PlotWidget
+        :param curve_name: Name of the curve, shown in the legend.
+        :type curve_name: str
+        :param color: Color of the curve.
+        :type color: str
+        :param sample_rate: The sample rate of the data of the curve.
+        :type sample_rate: int
+
+        :returns: The new curve.
+        """
+        x_array, y_array = self.define_axes(sample_rate)
+        plot_line = self.plot(graph, x_array.view(), y_array.view(), curve_name, color)
+        self.histories[plot_line] = MinMaxPyramid()
+        self.sample_rates[plot_line] = sample_rate
+        self.curves[plot_line] = (x_array, y_array)
+        return plot_line
+
+
+    def remove_line(self, graph, plot_line):
+        """
+        This method removes a curve added by :py:meth:`add_line`.
+
+        :param graph: Plot on which the curve is drawn.
+        :type graph: PlotWidget
+        :param plot_line: Plot curve to be removed.
+        """
+        graph.removeItem(plot_line)
+        del self.histories[plot_line]
+        del self.sample_rates[plot_line]
+        self.start_times.pop(plot_line, None)
+        self.curves.pop(plot_line, None)
+        self.pending_lines.discard(plot_line)
+
+
+    def clear_device(self, state):
+        """
+        This method clears the curve of a device and the ones of its processed signals, e.g. upon device reset.
+
+        :param state: State of the device.
+        :type state: serial_reader.DeviceState
+        """
+        self.clear_line(self.device_line(state), state.sample_rate)
+        for (output_state, name), plot_line in self.output_lines.items():
+            if output_state is state:
+                self.clear_line(plot_line, state.sample_rate)
+
+
+    def update_device_plot(self, state, data):
+        """
+        This method updates the curve of a device with a batch of new data received. See :py:meth:`update_plot`.
+
+        :param state: State of the device.
+        :type state: serial_reader.DeviceState
+        :param data: New data to update the plot with, with their timestamps and processed signals if it is a :py:class:`serial_reader.SampleBatch`.
+        :type data: sequence
+        """
+        plot_line = self.device_line(state)
+        x_array, y_array = self.curves[plot_line]
+        times = None
+        timestamps = getattr(data, 'timestamps', None)
+        if timestamps is not None and len(timestamps) == len(data):
+            timestamps = np.frombuffer(timestamps, dtype=np.int64)
+            if plot_line not in self.start_times:
+                self.start_times[plot_line] = int(timestamps[0]) if len(timestamps) else 0
+            times = (timestamps - self.start_times[plot_line])/1e9
+        self.update_plot(data, x_array, y_array, plot_line, times)
+        # Processed signals are drawn at the same times as the data, while processing is enabled
+        outputs = getattr(data, 'outputs', {}) if state.dsp is not None else {}
+        for name, values in outputs.items():
+            output_line = self.output_line(state, name)
+            x_array, y_array = self.curves[output_line]
+            self.update_plot(values, x_array, y_array, output_line, times)
+
+
+    def remove_devices(self):
+        """
+        This method removes the curves of all the devices but the first one, which is cleared, and the curves of the processed signals.
+        """
+        for state, plot_line in self.device_lines.items():
+            if plot_line != self.psoc_rLoad_line:
+                self.remove_line(self.psoc_r_graph, plot_line)
+        self.device_lines.clear()
+        self.remove_outputs()
+        self.clear_line(self.psoc_rLoad_line, self.sample_rates[self.psoc_rLoad_line])
+
+
+    def remove_outputs(self):
+        """
+        This method removes the curves of the processed signals of all the devices.
+        """
+        for plot_line in self.output_lines.values():
+            self.remove_line(self.dsp_graph, plot_line)
+        self.output_lines.clear()
+
+
     def define_axes(self, sample_rate):
         """
         This method defines the x axis (and init y axis to 0) according to a given sample rate.
-        The dependency on the sample rate is needed to adjust from sample per
-        seconds to seconds (which is the units displayed on the x axis).
+        The dependency on the sample rate is needed to hold about ``n_seconds`` of data, and to place
+        the initial points before time 0, one sample period apart.
 
         :param sample_rate: The sample rate of the acquired data.
         :type sample_rate: int
 
-        :returns: The two axes in the form of two arrays.
+        :returns: The x axis, in seconds, and the y axis, filled with zeros, as :py:class:`ring_buffer.RingBuffer` objects.
         :rtype: tuple
         """
         # Number of points to plot
-        n_points = self.n_seconds * sample_rate 
+        n_points = int(round(self.n_seconds * sample_rate))
 
-        time_between_points = (self.n_seconds)/float(n_points)
-        x_axis = [x for x in range(-n_points, 0)]
-        for j in range(n_points):
-            x_axis[j] = -self.n_seconds + j * time_between_points
-        y_axis = [0 for y in range(-n_points, 0)]
+        x_axis = RingBuffer(n_points)
+        x_axis.extend(np.arange(-n_points, 0) / float(sample_rate))
+        y_axis = RingBuffer(n_points)
 
         return x_axis, y_axis     
\ No newline at end of file
@@ -0,0 +1,61 @@
+"""
+Tests of :py:mod:`serial_workers`.
+"""
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import discovery as disc
+import port_monitor as pm
+import serial_workers as wrk
+
+
+class StubPortMonitor:
+    """
+    Port monitor on which no port is ever added or removed.
+    """
+    def __init__(self):
+        self.woken = threading.Event()
+
+    def wait(self, timeout=None):
+        self.woken.wait(timeout)
+        self.woken.clear()
+        return set(), set()
+
+    def wake(self):
+        self.woken.set()
+
+    def close(self):
+        pass
+
+
+def test_search_again_searches_at_once(monkeypatch):
+    monkeypatch.setattr(pm, 'PortMonitor', StubPortMonitor)
+    monkeypatch.setattr(disc, 'load_fingerprint', lambda: None)
+    monkeypatch.setattr(disc, 'save_fingerprint', lambda port: None)
+    worker = wrk.ScanWorker()
+    searches = []
+    searched = threading.Event()
+
+    def search(fingerprint=None, try_cached=False):
+        searches.append(fingerprint)
+        searched.set()
+        # Found on the first search, as before a failed setup
+        return 'PORT' if len(searches) == 1 else None
+
+    worker.search = search
+    thread = threading.Thread(target=worker.run, daemon=True)
+    thread.start()
+    try:
+        assert searched.wait(1)
+        searched.clear()
+        worker.search_again()
+        # Well before RESCAN_INTERVAL
+        assert searched.wait(1)
+        assert len(searches) == 2
+    finally:
+        worker.kill()
+        thread.join(1)
+    assert not thread.is_alive()
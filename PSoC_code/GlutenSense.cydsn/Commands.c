@@ -20,6 +20,15 @@
 
 
 
+// =============================================
+//                   GLOBALS
+// =============================================
+
+static uint8_t  arg_count = 0;    ///< Bytes of the argument of the last command still to be received
+static uint16_t arg_value = 0;    ///< Argument of the last command, received MSB first
+
+
+
 
 /**
 *   \brief Send connection string.
@@ -47,6 +56,20 @@ void Cmd_StartMeasure(void) {
 
 
 
+/**
+*   \brief Start measurement with packed frames.
+*
+*   This function starts a measurement on demand,
+*   sending PACKED_SAMPLES samples in each frame.
+*/
+void Cmd_StartPackedMeasure(void) {
+    // User requested resistance computation, streamed in packed frames
+    Reset_TIMER();
+    state = SENSING_PACKED;
+}
+
+
+
 /**
 *   \brief Stop measurement.
 *
@@ -66,12 +89,63 @@ void Cmd_StopMeasure(void) {
 *   to inform the GUI on sampling frequency.
 */
 void Cmd_SendResetBuffer(void) {
-    uint8_t reset_buffer[RESET_SIZE] = {0};
-    reset_buffer[0]                  = HEADER_RESET;
-    reset_buffer[1]                  = FS;
-    reset_buffer[RESET_SIZE-1]       = TAIL_RESET;
+    uint32_t fs_mhz = (1000UL*TIMER_RATE)/fs_divider;
+    
+    if((fs_mhz%1000) == 0 && fs_mhz <= 255000) {
+        // Integer frequencies up to 255 Hz fit the original reset buffer
+        uint8_t reset_buffer[RESET_SIZE] = {0};
+        reset_buffer[0]                  = HEADER_RESET;
+        reset_buffer[1]                  = (uint8_t) (fs_mhz/1000);
+        reset_buffer[RESET_SIZE-1]       = TAIL_RESET;
+        
+        UART_PutArray(reset_buffer, RESET_SIZE);
+    }
+    else {
+        uint8_t reset_buffer[RESET_EXT_SIZE] = {0};
+        reset_buffer[0]                      = HEADER_RESET_EXT;
+        reset_buffer[1]                      = (uint8_t) (fs_mhz >> 24);
+        reset_buffer[2]                      = (uint8_t) (fs_mhz >> 16);
+        reset_buffer[3]                      = (uint8_t) (fs_mhz >> 8);
+        reset_buffer[4]                      = (uint8_t) (fs_mhz & 0xFF);
+        reset_buffer[RESET_EXT_SIZE-1]       = TAIL_RESET;
+        
+        UART_PutArray(reset_buffer, RESET_EXT_SIZE);
+    }
+}
+
+
+
+/**
+*   \brief Set sampling frequency.
+*
+*   This function sets the sampling frequency to the 
+*   value sent by the GUI in the next 2 bytes [Hz].
+*/
+void Cmd_SetSampleRate(void) {
+    // The argument is handled by Cmd_InvokeCommand as it is received
+    state     = IDLE;
+    arg_count = 2;
+    arg_value = 0;
+}
+
+
+
+/**
+*   \brief Apply sampling frequency.
+*
+*   This function sets the closest sampling frequency the timer 
+*   can provide and sends the reset buffer to inform the GUI.
+*/
+static void Cmd_ApplySampleRate(uint16_t fs) {
+    if(fs == 0) {
+        fs = 1;
+    }
+    if(fs > FS_MAX) {
+        fs = FS_MAX;
+    }
     
-    UART_PutArray(reset_buffer, RESET_SIZE);
+    fs_divider = (TIMER_RATE + fs/2)/fs;
+    Cmd_SendResetBuffer();
 }
 
 
@@ -118,10 +192,22 @@ void Cmd_PrintHelp(void) {
 *   \brief Invoke the command.
 *
 *   This function invokes the command called by
-*   the user.
+*   the user, or takes the byte received as 
+*   argument of the previous command.
 */
 void Cmd_InvokeCommand(char rx, const struct commandStruct *cmd) {
     unsigned int i = 0;
+    
+    if(arg_count > 0) {
+        // Byte of the argument of the previous command
+        arg_value = (arg_value << 8) | (uint8_t) rx;
+        arg_count--;
+        if(arg_count == 0) {
+            Cmd_ApplySampleRate(arg_value);
+        }
+        return;
+    }
+    
     while(cmd[i].name != ' ') {
         if (cmd[i].name == rx) {
             cmd[i].execute();
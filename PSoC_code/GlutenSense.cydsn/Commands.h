@@ -46,6 +46,15 @@
     void Cmd_StartMeasure(void);
     
     
+    /**
+    *   \brief Start measurement with packed frames.
+    *
+    *   This function starts a measurement on demand,
+    *   sending PACKED_SAMPLES samples in each frame.
+    */
+    void Cmd_StartPackedMeasure(void);
+    
+    
     /**
     *   \brief Stop measurement.
     *
@@ -64,6 +73,15 @@
     void Cmd_SendResetBuffer(void);
     
     
+    /**
+    *   \brief Set sampling frequency.
+    *
+    *   This function sets the sampling frequency to the 
+    *   value sent by the GUI in the next 2 bytes [Hz].
+    */
+    void Cmd_SetSampleRate(void);
+    
+    
     /**
     *   \brief Send data stored in union object.
     *
@@ -87,7 +105,8 @@
     *   \brief Invoke the command.
     *
     *   This function invokes the command called by
-    *   the user.
+    *   the user, or takes the byte received as 
+    *   argument of the previous command.
     */
     void Cmd_InvokeCommand(char rx, const struct commandStruct commands[]);
     
@@ -101,8 +120,10 @@
     static const struct commandStruct commands[] = {
         {'c', &Cmd_SendConnString, "Enter c to send connection string.\r\n"},
         {'m', &Cmd_StartMeasure, "Enter m to start measurement.\r\n"},
+        {'p', &Cmd_StartPackedMeasure, "Enter p to start measurement with packed frames.\r\n"},
         {'s', &Cmd_StopMeasure, "Enter s to stop measurement.\r\n"},
         {'r', &Cmd_SendResetBuffer, "Enter r to send reset info.\r\n"},
+        {'f', &Cmd_SetSampleRate, "Enter f and the sampling frequency in Hz (2 bytes, MSB first) to set it.\r\n"},
         {'u', &Cmd_SendUnion, "Enter u to send test union data buffer.\r\n"},
         {'h', &Cmd_PrintHelp, "Enter h to list commands.\r\n"},
         {' ',0,""} // End of table indicator
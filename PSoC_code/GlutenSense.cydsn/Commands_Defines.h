@@ -18,19 +18,31 @@
     
     #define IDLE                0              ///< Idle state, no operation needed, wait for user
     #define SENSING             1              ///< Measure resistance of sensor
+    #define SENSING_PACKED      2              ///< Measure resistance of sensor, sending packed frames
     
     #define TIMER_PERIOD        5              ///< Period of the timer, with a 10kHz clock [*100 us]
-    #define FS                  10             ///< Desired sampling frequency [Hz]
+    #define TIMER_RATE          (10000/TIMER_PERIOD) ///< Rate of the timer ISR [Hz]
+    #define FS                  10             ///< Default sampling frequency, until set by the GUI [Hz]
+    #define FS_MAX              TIMER_RATE     ///< Highest sampling frequency, one sample per timer ISR [Hz]
     
     #define DATA_SIZE           1+32/8+16/8+1  ///< Size of the measurement buffer that will be sent to the GUI
     #define RESET_SIZE          1+1+1          ///< Size of the reset buffer sent to GUI. header+sr_info+tail
+    #define RESET_EXT_SIZE      1+32/8+1       ///< Size of the extended reset buffer. header+sr_info [mHz]+tail
     #define RESIST_SIZE         1+32/8+16/8+1  ///< Size of resistance buffer (load value)
     
+    #define PACKED_SAMPLES      10             ///< Number of samples sent in each packed frame
+    #define SAMPLE_SIZE         32/8+16/8      ///< Size of a sample in a packed frame. integer+decimal part
+    #define PACKED_HEADER_SIZE  1+16/8+1       ///< Size of the packed frame before the samples. header+sequence+count
+    #define PACKED_SIZE         PACKED_HEADER_SIZE+PACKED_SAMPLES*(SAMPLE_SIZE)+1+1 ///< Size of a full packed frame. +checksum+tail
+    
     #define HEADER_RESET        0x00   ///< Header for reset packet
+    #define HEADER_RESET_EXT    0x01   ///< Header for reset packet with sampling frequency in mHz
     #define HEADER_PSOC_R_MEAS  0x0A   ///< Header for PSoC res measurements
+    #define HEADER_PSOC_R_PACKED 0x0B  ///< Header for packed PSoC res measurements
     
     #define TAIL_RESET          0x0F   ///< Identifier tail for reset packet    
     #define TAIL_MEAS_PACKETS   0xFF   ///< Identifier tail for measurements  
+    #define TAIL_PACKED         0xFE   ///< Identifier tail for packed measurements
     
     
     #define typename(x) _Generic((x),                                                 \
@@ -32,7 +32,8 @@
     
     volatile uint8_t flag_timer;        ///< Flag that tells a timer overflow has occurred
     volatile uint8_t flag_fs;           ///< Flag that tells it's time to acquire a sample
-    volatile uint8_t count_fs;          ///< Counter to keep track of each timer overflow
+    volatile uint16_t count_fs;         ///< Counter to keep track of each timer overflow
+    volatile uint16_t fs_divider;       ///< Timer overflows per sample, sets the sampling frequency
     
     
     
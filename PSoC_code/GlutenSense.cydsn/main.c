@@ -39,6 +39,37 @@
 
 
 
+// =============================================
+//                  FUNCTIONS
+// =============================================
+
+/**
+*   \brief Send packed frame.
+*
+*   This function completes the packed frame with sequence counter, 
+*   number of samples, checksum and tail, and sends it to the GUI.
+*   The checksum is the sum of all the bytes before it, modulo 256.
+*/
+static void Send_PackedFrame(uint8_t* packed_buffer, uint16_t sequence, uint8_t n_samples) {
+    uint16_t length   = PACKED_HEADER_SIZE + n_samples*(SAMPLE_SIZE);
+    uint8_t  checksum = 0;
+    uint16_t i        = 0;
+    
+    packed_buffer[1] = (uint8_t) (sequence >> 8);
+    packed_buffer[2] = (uint8_t) (sequence & 0xFF);
+    packed_buffer[3] = n_samples;
+    
+    for(i = 0; i < length; i++) {
+        checksum += packed_buffer[i];
+    }
+    packed_buffer[length]   = checksum;
+    packed_buffer[length+1] = TAIL_PACKED;
+    
+    UART_PutArray(packed_buffer, length+2);
+}
+
+
+
 int main(void) {
     
     CyGlobalIntEnable; /* Enable global interrupts. */
@@ -62,6 +93,7 @@ int main(void) {
     flag_timer              = 0;
     count_fs                = 0;    
     flag_fs                 = 0;
+    fs_divider              = TIMER_RATE/FS;
     
     
     int32_t Voffset_ref     = 0;
@@ -78,6 +110,13 @@ int main(void) {
     resistance_buffer[0]                    = HEADER_PSOC_R_MEAS;
     resistance_buffer[RESIST_SIZE-1]        = TAIL_MEAS_PACKETS;
     
+    uint8_t packed_buffer[PACKED_SIZE]      = {0};
+    packed_buffer[0]                        = HEADER_PSOC_R_PACKED;
+    uint8_t* sample                         = 0;
+    uint8_t packed                          = 0;
+    uint8_t n_packed                        = 0;
+    uint16_t sequence                       = 0;
+    
     
     // Init ISRs
     ISR_RX_StartEx(Custom_ISR_RX);
@@ -89,13 +128,15 @@ int main(void) {
         
         if(flag_rx) {
             flag_rx = 0;
-            rx = UART_ReadRxData();
             
-            // Handle possible user requested commands
-            Cmd_InvokeCommand(rx, commands);            
+            // Handle possible user requested commands, with their arguments
+            while(UART_GetRxBufferSize() > 0) {
+                rx = UART_ReadRxData();
+                Cmd_InvokeCommand(rx, commands);
+            }
         }        
             
-        if(state == SENSING) {
+        if(state == SENSING || state == SENSING_PACKED) {
             
             IDAC_Start();
             ADC_MUX_FastSelect(REF_CH);
@@ -105,8 +146,11 @@ int main(void) {
             
             //Cmd_SendResetBuffer();
             
+            packed   = (state == SENSING_PACKED);
+            n_packed = 0;
+            sequence = 0;
             
-            while(state == SENSING) {
+            while(state != IDLE) {
                 if(flag_fs) {
                     flag_fs = 0;
                     
@@ -127,20 +171,44 @@ int main(void) {
                     */
                     
                     
-                    // Send value
-                    resistance_buffer[1] = (uint8_t) (integer_part >> 24);
-                    resistance_buffer[2] = (uint8_t) (integer_part >> 16);
-                    resistance_buffer[3] = (uint8_t) (integer_part >> 8);
-                    resistance_buffer[4] = (uint8_t) (integer_part & 0xFF);
-                    resistance_buffer[5] = (uint8_t) (decimal_part >> 8);
-                    resistance_buffer[6] = (uint8_t) (decimal_part & 0xFF);
-                    
-                    UART_PutArray(resistance_buffer, RESIST_SIZE);
+                    if(packed) {
+                        // Add value to the packed frame, send it when full
+                        sample    = &packed_buffer[PACKED_HEADER_SIZE + n_packed*(SAMPLE_SIZE)];
+                        sample[0] = (uint8_t) (integer_part >> 24);
+                        sample[1] = (uint8_t) (integer_part >> 16);
+                        sample[2] = (uint8_t) (integer_part >> 8);
+                        sample[3] = (uint8_t) (integer_part & 0xFF);
+                        sample[4] = (uint8_t) (decimal_part >> 8);
+                        sample[5] = (uint8_t) (decimal_part & 0xFF);
+                        n_packed++;
+                        
+                        if(n_packed == PACKED_SAMPLES) {
+                            Send_PackedFrame(packed_buffer, sequence, n_packed);
+                            sequence++;
+                            n_packed = 0;
+                        }
+                    }
+                    else {
+                        // Send value
+                        resistance_buffer[1] = (uint8_t) (integer_part >> 24);
+                        resistance_buffer[2] = (uint8_t) (integer_part >> 16);
+                        resistance_buffer[3] = (uint8_t) (integer_part >> 8);
+                        resistance_buffer[4] = (uint8_t) (integer_part & 0xFF);
+                        resistance_buffer[5] = (uint8_t) (decimal_part >> 8);
+                        resistance_buffer[6] = (uint8_t) (decimal_part & 0xFF);
+                        
+                        UART_PutArray(resistance_buffer, RESIST_SIZE);
+                    }
                     
                     R_sense = 0.0;
                     
                 }                
             }
+            
+            // Send the samples of the last packed frame, not full
+            if(n_packed > 0) {
+                Send_PackedFrame(packed_buffer, sequence, n_packed);
+            }
         }
         else {
             Debug_LED_Write(LED_OFF);